@@ -0,0 +1,88 @@
+"""
+Benchmark: montagem do documento de saída no process_catalog_v2.
+
+Catálogo sintético de 500 páginas (imagem e fonte compartilhadas por todas
+as páginas) com páginas removidas espalhadas. Compara:
+  - por página: um out_doc.insert_pdf por página mantida (implementação anterior)
+  - faixas:     um insert_pdf por faixa contígua de páginas mantidas (atual)
+  - select:     src_doc.select(mantidas) no próprio documento
+e o tempo de salvar cada resultado com garbage=4 + deflate.
+
+Uso: python benchmarks/bench_assembly.py [páginas] [removidas]
+"""
+import os
+import random
+import sys
+import time
+
+import fitz
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+from backend.pdf_processor import _page_runs
+
+
+def build_catalog(pages):
+    doc = fitz.open()
+    pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 400, 400), False)
+    pix.clear_with(200)
+    image = pix.tobytes("png")
+    xref = 0
+    for i in range(pages):
+        page = doc.new_page()
+        # Mesma imagem em todas as páginas (recurso compartilhado, como um fundo de catálogo)
+        if xref:
+            page.insert_image(fitz.Rect(50, 50, 400, 400), xref=xref)
+        else:
+            xref = page.insert_image(fitz.Rect(50, 50, 400, 400), stream=image)
+        page.insert_text((50, 500), f"Item {i} R$ 10,00", fontsize=12)
+    return doc.tobytes()
+
+
+def per_page(data, kept):
+    src = fitz.open("pdf", data)
+    out = fitz.open()
+    out.new_page()  # Capa
+    for n in kept:
+        out.insert_pdf(src, from_page=n, to_page=n)
+    return out
+
+
+def by_runs(data, kept):
+    src = fitz.open("pdf", data)
+    out = fitz.open()
+    out.new_page()  # Capa
+    for first, last in _page_runs(kept):
+        out.insert_pdf(src, from_page=first, to_page=last)
+    return out
+
+
+def select(data, kept):
+    src = fitz.open("pdf", data)
+    src.select(kept)
+    src.new_page(pno=0)  # Capa
+    return src
+
+
+def main():
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    removed = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+    data = build_catalog(pages)
+    random.seed(1)
+    excluded = set(random.sample(range(pages), removed))
+    kept = [n for n in range(pages) if n not in excluded]
+
+    print(f"{pages} páginas, {removed} removidas ({len(_page_runs(kept))} faixas contíguas)")
+    print(f"{'modo':>10} | {'montagem':>9} | {'salvar':>8} | {'tamanho':>8}")
+    for name, assemble in (("por página", per_page), ("faixas", by_runs), ("select", select)):
+        start = time.perf_counter()
+        doc = assemble(data, kept)
+        assembly = time.perf_counter() - start
+        start = time.perf_counter()
+        size = len(doc.tobytes(garbage=4, deflate=True))
+        save = time.perf_counter() - start
+        doc.close()
+        print(f"{name:>10} | {assembly * 1000:7.0f}ms | {save * 1000:6.0f}ms | {size / 1024:5.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
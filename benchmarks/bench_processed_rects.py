@@ -0,0 +1,68 @@
+"""
+Micro-benchmark: deduplicação de `processed_rects` (lista linear x RectGrid).
+
+Simula uma página de tabela de preços com N preços. Como no processador,
+a primeira estratégia registra cada preço e as outras cinco consultam de
+novo todos os candidatos antes de desistir.
+
+Uso: python benchmarks/bench_processed_rects.py
+"""
+import os
+import sys
+import time
+
+import fitz
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+from backend.spatial_index import RectGrid
+
+STRATEGIES = 6
+
+
+def linear_already_processed(new_rect, processed_rects, tolerance=5):
+    # Implementação anterior (varredura da lista inteira)
+    for rect in processed_rects:
+        if (abs(rect.x0 - new_rect.x0) < tolerance and
+            abs(rect.y0 - new_rect.y0) < tolerance and
+            abs(rect.x1 - new_rect.x1) < tolerance and
+            abs(rect.y1 - new_rect.y1) < tolerance):
+            return True
+    return False
+
+
+def price_rects(n):
+    # Tabela: 10 colunas, linhas a cada 14pt (página "alta" para 5.000 preços)
+    rects = []
+    for i in range(n):
+        col, row = i % 10, i // 10
+        x0, y0 = 20 + col * 57, 20 + row * 14
+        rects.append(fitz.Rect(x0, y0, x0 + 50, y0 + 12))
+    return rects
+
+
+def run(candidates, processed, check):
+    for _ in range(STRATEGIES):
+        for rect in candidates:
+            if not check(rect, processed):
+                processed.append(rect)
+
+
+def bench(n):
+    candidates = price_rects(n)
+
+    start = time.perf_counter()
+    run(candidates, [], linear_already_processed)
+    t_list = time.perf_counter() - start
+
+    start = time.perf_counter()
+    run(candidates, RectGrid(), lambda r, p: p.contains_near(r, 5))
+    t_grid = time.perf_counter() - start
+
+    return t_list, t_grid
+
+
+if __name__ == "__main__":
+    print(f"{'preços':>8} | {'lista (ms)':>11} | {'RectGrid (ms)':>13} | {'ganho':>7}")
+    for n in (50, 500, 5000):
+        t_list, t_grid = bench(n)
+        print(f"{n:>8} | {t_list * 1000:>11.2f} | {t_grid * 1000:>13.2f} | {t_list / t_grid:>6.1f}x")
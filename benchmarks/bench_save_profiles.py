@@ -0,0 +1,61 @@
+"""
+Benchmark: perfis de gravação (fast / balanced / compact / incremental).
+
+Roda o process_catalog (edição no próprio documento, onde os quatro perfis
+se aplicam) num catálogo sintético com fotos e preços e mostra o tempo de
+gravação e o tamanho final de cada perfil (SaveReport).
+
+Uso: python benchmarks/bench_save_profiles.py [páginas]
+"""
+import io
+import os
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+import fitz
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+from backend.pdf_processor import PdfProcessor
+from backend.save_profiles import SAVE_PROFILES
+
+
+def build_catalog(path, pages):
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page()
+        # Foto "ruidosa" diferente por página (não comprime de graça)
+        pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 300, 300), False)
+        pix.set_rect(pix.irect, ((i * 37) % 255, 120, 200))
+        for x in range(0, 300, 7):
+            pix.set_pixel(x, (x * i) % 300, (0, 0, 0))
+        page.insert_image(fitz.Rect(50, 50, 350, 350), pixmap=pix)
+        # Um único stream de texto por página, como num catálogo real
+        shape = page.new_shape()
+        for j in range(40):
+            shape.insert_text((380, 60 + j * 18), f"R$ {j + i},90", fontsize=10)
+        shape.commit()
+    doc.save(path, garbage=4, deflate=True)
+
+
+def main():
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    tmp = tempfile.mkdtemp()
+    src = os.path.join(tmp, "catalogo.pdf")
+    build_catalog(src, pages)
+    print(f"{pages} páginas, original {os.path.getsize(src) / 1024:.0f} KB")
+    print(f"{'perfil':>12} | {'total':>8} | {'gravação':>9} | {'tamanho':>9}")
+    for profile in SAVE_PROFILES:
+        out = os.path.join(tmp, f"saida_{profile}.pdf")
+        processor = PdfProcessor(save_profile=profile)
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            ok, msg = processor.process_catalog(src, out, 5.0)
+        total = time.perf_counter() - start
+        report = processor.last_save
+        print(f"{profile:>12} | {total * 1000:6.0f}ms | {report.seconds * 1000:7.0f}ms | {report.size / 1024:6.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark: gravação dos preços novos (uma chamada por capa/texto x PageWriter).
+
+Gera um catálogo sintético com N páginas de ~200 preços cada, aplica o
+markup nos dois modos e compara o tempo de aplicação, o número de streams
+novos em /Contents e o tamanho do arquivo salvo (sem compressão e com
+garbage=4 + deflate).
+
+Uso: python benchmarks/bench_write_back.py [páginas] [preços por página]
+"""
+import os
+import sys
+import time
+
+import fitz
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+from backend.pdf_processor import PdfProcessor
+
+
+def build_catalog(pages, prices):
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page(width=595, height=842)
+        for i in range(prices):
+            col, row = i % 4, i // 4
+            x, y = 20 + col * 145, 20 + row * 16
+            page.insert_text((x, y), f"Item {i}", fontsize=8)
+            page.insert_text((x + 55, y), f"R$ {i + 1},90", fontsize=8)
+    return doc.tobytes()
+
+
+def run(data, batch_writes):
+    proc = PdfProcessor(batch_writes=batch_writes)
+    doc = fitz.open("pdf", data)
+    candidates = [proc.detect_prices(page) for page in doc]
+    before = sum(len(page.get_contents()) for page in doc)
+    start = time.perf_counter()
+    for page, cands in zip(doc, candidates):
+        proc._apply_price_candidates(page, cands, 10.0)
+    elapsed = time.perf_counter() - start
+    streams = sum(len(page.get_contents()) for page in doc) - before
+    plain = len(doc.tobytes(garbage=0, deflate=False))
+    compact = len(doc.tobytes(garbage=4, deflate=True))
+    doc.close()
+    return elapsed, streams, plain, compact
+
+
+def main():
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    prices = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    data = build_catalog(pages, prices)
+
+    # Silenciar o [DEBUG] da detecção
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        results = {mode: run(data, mode) for mode in (False, True)}
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    print(f"{pages} páginas x {prices} preços")
+    print(f"{'modo':>11} | {'tempo':>8} | {'streams novos':>14} | {'sem compressão':>14} | {'garbage=4+deflate':>17}")
+    for mode, (elapsed, streams, plain, compact) in results.items():
+        name = "lote" if mode else "por chamada"
+        print(f"{name:>11} | {elapsed * 1000:6.0f}ms | {streams:14d} | {plain / 1024:11.0f} KB | {compact / 1024:14.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
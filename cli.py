@@ -0,0 +1,10 @@
+import sys
+import os
+
+# Adiciona o diretório 'src' ao PATH para permitir imports corretos
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from backend.cli import main
+
+if __name__ == "__main__":
+    sys.exit(main())
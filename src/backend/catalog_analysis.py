@@ -0,0 +1,71 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from backend.price_detection import PriceCandidate
+
+Color = Tuple[float, float, float]
+
+# Versão do formato/algoritmo da análise. Incrementar sempre que a detecção
+# de preços, a amostragem de cores ou a posição da logo mudarem, para que
+# análises antigas em cache sejam ignoradas.
+ANALYSIS_VERSION = 2
+
+
+@dataclass
+class CatalogAnalysis:
+    """
+    Resultado da análise de um catálogo, independente do markup.
+
+    Guarda tudo o que a gravação precisa e que só depende do PDF de origem:
+    os preços de cada página (já com cor de fundo), onde a logo entra em
+    cada página e a cor de fundo das páginas. Com isso várias saídas
+    (markups/logos diferentes) são gravadas sem reextrair texto nem
+    redetectar preços, e a análise pode ser guardada em cache em disco.
+    """
+    page_count: int
+    # número da página -> candidatos daquela página
+    prices: Dict[int, List[PriceCandidate]] = field(default_factory=dict)
+    # número da página -> retângulos (x0, y0, x1, y1) onde a logo é inserida
+    logo_slots: Dict[int, List[tuple]] = field(default_factory=dict)
+    # número da página -> cor de fundo (só das páginas já consultadas)
+    page_bg_colors: Dict[int, Color] = field(default_factory=dict)
+
+    def candidates_for(self, page_num: int) -> List[PriceCandidate]:
+        return self.prices.get(page_num, [])
+
+    def covers_page(self, page_num: int) -> bool:
+        """A página foi analisada (preços e logo disponíveis)?"""
+        return page_num in self.prices
+
+    @property
+    def price_count(self) -> int:
+        return sum(len(c) for c in self.prices.values())
+
+    def to_dict(self) -> dict:
+        """Forma serializável em JSON (o cache em disco não guarda pickle)."""
+        return {
+            "page_count": self.page_count,
+            "prices": {str(n): [c.to_dict() for c in cands] for n, cands in self.prices.items()},
+            "logo_slots": {str(n): [list(s) for s in slots] for n, slots in self.logo_slots.items()},
+            "page_bg_colors": {str(n): list(c) for n, c in self.page_bg_colors.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CatalogAnalysis":
+        """Inverso de to_dict (chaves do JSON voltam a ser números de página)."""
+        return cls(
+            page_count=data["page_count"],
+            prices={int(n): [PriceCandidate.from_dict(c) for c in cands]
+                    for n, cands in data["prices"].items()},
+            logo_slots={int(n): [tuple(s) for s in slots] for n, slots in data["logo_slots"].items()},
+            page_bg_colors={int(n): tuple(c) for n, c in data["page_bg_colors"].items()},
+        )
+
+
+@dataclass
+class CatalogVariant:
+    """Uma saída do mesmo catálogo: markup, logo e nome próprios."""
+    markup: float
+    output_path: str
+    logo_path: Optional[str] = None
+    catalog_name: str = ""
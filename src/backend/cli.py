@@ -0,0 +1,104 @@
+"""
+Linha de comando do processador (sem interface gráfica).
+
+Exemplos (a partir da raiz do projeto):
+    python cli.py analyze catalogo.pdf --report precos.csv --format csv
+    python cli.py variants catalogo.pdf \\
+        --variant "markup=5;output=loja_a.pdf;logo=logo_a.png;name=Coleção A" \\
+        --variant "markup=10,50;output=loja_b.pdf;name=Coleção B" \\
+        --exclude 1 2 --cover --intro
+"""
+import argparse
+import sys
+import time
+from typing import List, Optional
+
+from backend.catalog_analysis import CatalogVariant
+from backend.pdf_processor import PdfProcessor
+from backend.save_profiles import SAVE_PROFILES
+
+VARIANT_KEYS = {"markup", "output", "logo", "name"}
+
+
+def parse_variant(spec: str) -> CatalogVariant:
+    """
+    "markup=5;output=a.pdf;logo=a.png;name=Coleção A" -> CatalogVariant.
+    Campos separados por ";" (o markup pode usar vírgula decimal).
+    """
+    fields = {}
+    for part in spec.split(";"):
+        key, sep, value = part.partition("=")
+        key = key.strip().lower()
+        if not sep or key not in VARIANT_KEYS:
+            raise argparse.ArgumentTypeError(f"Campo inválido na variante: '{part}'")
+        fields[key] = value.strip()
+    if "markup" not in fields or "output" not in fields:
+        raise argparse.ArgumentTypeError("Variante precisa de markup= e output=")
+    try:
+        markup = float(fields["markup"].replace(",", "."))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Markup inválido: '{fields['markup']}'")
+    return CatalogVariant(
+        markup=markup,
+        output_path=fields["output"],
+        logo_path=fields.get("logo") or None,
+        catalog_name=fields.get("name", ""),
+    )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Editor de Catálogo PDF (linha de comando)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    analyze = sub.add_parser("analyze", help="Lista os preços detectados sem alterar o PDF")
+    analyze.add_argument("input", help="PDF de entrada")
+    analyze.add_argument("--report", help="Arquivo do relatório (padrão: só o resumo na tela)")
+    analyze.add_argument("--format", choices=["json", "csv"], default="json")
+    analyze.add_argument("--exclude", type=int, nargs="*", default=[], help="Páginas a ignorar (a partir de 1)")
+
+    variants = sub.add_parser("variants", help="Gera várias saídas a partir de uma análise")
+    variants.add_argument("input", help="PDF de entrada")
+    variants.add_argument("--variant", type=parse_variant, action="append", required=True,
+                          help='"markup=5;output=saida.pdf[;logo=logo.png][;name=Nome]"')
+    variants.add_argument("--exclude", type=int, nargs="*", default=[], help="Páginas a remover (a partir de 1)")
+    variants.add_argument("--cover", action="store_true", help="Gerar capa com a logo")
+    variants.add_argument("--intro", action="store_true", help="Gerar página de apresentação")
+    variants.add_argument("--workers", type=int, default=None, help="Processos de gravação (padrão: nº de CPUs)")
+    variants.add_argument("--save-profile", choices=list(SAVE_PROFILES), default=None,
+                          help="Perfil de gravação (padrão: balanced)")
+    variants.add_argument("--image-dpi", type=float, default=None,
+                          help="Reduzir imagens exibidas acima desta resolução")
+    variants.add_argument("--target-size-mb", type=float, default=None,
+                          help="Tamanho máximo desejado de cada PDF (reduz/recomprime imagens)")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    # A interface mostra páginas a partir de 1; o processador usa índices a partir de 0
+    pages_to_exclude = [p - 1 for p in args.exclude]
+    processor = PdfProcessor(
+        save_profile=getattr(args, "save_profile", None),
+        image_dpi=getattr(args, "image_dpi", None),
+        target_size_mb=getattr(args, "target_size_mb", None),
+    )
+    start = time.perf_counter()
+
+    if args.command == "analyze":
+        report = processor.analyze_prices(args.input, args.report, args.format, pages_to_exclude)
+        summary = report["summary"]
+        print(f"{summary['prices']} preços em {summary['analyzed_pages']} páginas ({summary['seconds']:.2f}s)")
+        return 0
+
+    results = processor.process_variants(
+        args.input, args.variant, pages_to_exclude,
+        add_cover=args.cover, add_intro=args.intro, max_workers=args.workers
+    )
+    for variant, (ok, message) in zip(args.variant, results):
+        print(f"{'OK' if ok else 'ERRO'} {variant.output_path} (markup {variant.markup}): {message}")
+    print(f"Tempo total: {time.perf_counter() - start:.2f}s")
+    return 0 if all(ok for ok, _ in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
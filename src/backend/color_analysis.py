@@ -0,0 +1,120 @@
+import fitz  # PyMuPDF
+import numpy as np
+from typing import List, Tuple
+
+Color = Tuple[float, float, float]
+
+# Diferença mínima (soma |dR|+|dG|+|dB|, 0-255) para um pixel contar como texto
+TEXT_DIFF_THRESHOLD = 100
+# Bits por canal na quantização usada para agrupar cores (4 -> 16 níveis)
+QUANT_BITS = 4
+
+
+def pixmap_array(pix) -> np.ndarray:
+    """
+    Visão (altura, largura, 3) dos pixels RGB de um Pixmap, sem cópia.
+    Lê direto o buffer `samples_mv` respeitando o stride da linha.
+    O Pixmap precisa continuar vivo enquanto o array for usado.
+    """
+    buf = np.frombuffer(pix.samples_mv, dtype=np.uint8)
+    rows = buf.reshape(pix.height, pix.stride)
+    return rows[:, :pix.width * pix.n].reshape(pix.height, pix.width, pix.n)[:, :, :3]
+
+
+def _border_pixels(arr: np.ndarray) -> np.ndarray:
+    """Pixels da borda (linha de cima/baixo, coluna esquerda/direita) como (N, 3)."""
+    if arr.shape[0] <= 2 or arr.shape[1] <= 2:
+        return arr.reshape(-1, 3)
+    return np.concatenate([
+        arr[0, :], arr[-1, :], arr[1:-1, 0], arr[1:-1, -1]
+    ])
+
+
+def _cluster_keys(pixels: np.ndarray) -> np.ndarray:
+    """Chave do cluster de cada pixel (cor quantizada em QUANT_BITS por canal)."""
+    q = (pixels >> (8 - QUANT_BITS)).astype(np.int32)
+    return (q[:, 0] << (2 * QUANT_BITS)) | (q[:, 1] << QUANT_BITS) | q[:, 2]
+
+
+def _dominant_color(pixels: np.ndarray) -> np.ndarray:
+    """Cor média do cluster mais populoso (0-255)."""
+    keys = _cluster_keys(pixels)
+    top = np.bincount(keys).argmax()
+    return pixels[keys == top].mean(axis=0)
+
+
+def _to_unit(color) -> Color:
+    return tuple(float(c) / 255.0 for c in color)
+
+
+def _contrast_of(bg) -> Color:
+    lum = 0.299 * bg[0] + 0.587 * bg[1] + 0.114 * bg[2]
+    return (0, 0, 0) if lum > 128 else (1, 1, 1)
+
+
+def background_color(arr: np.ndarray) -> Color:
+    """Cor de fundo: cor dominante da borda da área."""
+    if arr.size == 0:
+        return (1, 1, 1)
+    return _to_unit(_dominant_color(_border_pixels(arr)))
+
+
+def text_color(arr: np.ndarray, bg: Color = None) -> Color:
+    """
+    Cor do texto: entre os pixels que contrastam com o fundo, o cluster de
+    cor mais populoso. O miolo das letras concentra muitos pixels numa cor
+    só, enquanto a suavização das bordas espalha poucos pixels por vários
+    clusters, então o cluster dominante é a cor "cheia" do texto.
+    Sem pixels contrastantes, cai para preto/branco conforme o fundo.
+    """
+    if arr.size == 0:
+        return (0, 0, 0)
+    if bg is None:
+        bg = background_color(arr)
+    bg_255 = np.array(bg, dtype=np.float32) * 255.0
+
+    pixels = arr.reshape(-1, 3)
+    diff = np.abs(pixels.astype(np.int16) - bg_255.astype(np.int16)).sum(axis=1)
+    contrasting = pixels[diff > TEXT_DIFF_THRESHOLD]
+    if len(contrasting) == 0:
+        return _contrast_of(bg_255)
+    return _to_unit(_dominant_color(contrasting))
+
+
+def analyze_array(arr: np.ndarray) -> Tuple[Color, Color]:
+    """(cor de fundo, cor do texto) de uma área já rasterizada."""
+    bg = background_color(arr)
+    return bg, text_color(arr, bg)
+
+
+def crop(arr: np.ndarray, rect, zoom: float, origin=(0, 0)) -> np.ndarray:
+    """
+    Recorte (visão, sem cópia) de um raster da página inteira.
+    `rect` em coordenadas da página; `origin` é o canto superior esquerdo
+    da página no raster e `zoom` o fator usado na renderização.
+    """
+    h, w = arr.shape[:2]
+    x0 = max(0, min(w, int((rect[0] - origin[0]) * zoom)))
+    y0 = max(0, min(h, int((rect[1] - origin[1]) * zoom)))
+    x1 = max(x0, min(w, int(np.ceil((rect[2] - origin[0]) * zoom))))
+    y1 = max(y0, min(h, int(np.ceil((rect[3] - origin[1]) * zoom))))
+    return arr[y0:y1, x0:x1]
+
+
+def analyze_page_rects(page, rects: List, zoom: float = 1.0, margin: float = 5) -> List[Tuple[Color, Color]]:
+    """
+    Modo em lote: renderiza a página UMA vez e devolve (fundo, texto) para
+    cada retângulo. O fundo vem da borda da área expandida por `margin`
+    (como em _sample_background_color) e o texto da área exata.
+    """
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+    arr = pixmap_array(pix)
+    origin = (page.rect.x0, page.rect.y0)
+
+    results = []
+    for rect in rects:
+        r = fitz.Rect(rect)
+        bg_area = crop(arr, (r.x0 - margin, r.y0 - margin, r.x1 + margin, r.y1 + margin), zoom, origin)
+        bg = background_color(bg_area)
+        results.append((bg, text_color(crop(arr, r, zoom, origin), bg)))
+    return results
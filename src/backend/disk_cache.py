@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+# (caminho, tamanho, mtime) -> SHA-256 dos últimos arquivos hasheados
+_DIGESTS: "OrderedDict[tuple, str]" = OrderedDict()
+_DIGESTS_MAX = 256
+_digests_lock = threading.Lock()
+
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    SHA-256 do conteúdo do arquivo (lido em blocos, sem carregar tudo na memória).
+
+    Memorizado por caminho + tamanho + mtime: cada lote de miniaturas/folhas
+    do mesmo PDF pede o hash de novo e só a primeira chamada relê o arquivo.
+    Um arquivo regravado muda de mtime e é hasheado outra vez.
+    """
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _digests_lock:
+        digest = _DIGESTS.get(key)
+        if digest is not None:
+            _DIGESTS.move_to_end(key)
+            return digest
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+    with _digests_lock:
+        _DIGESTS[key] = digest
+        while len(_DIGESTS) > _DIGESTS_MAX:
+            _DIGESTS.popitem(last=False)
+    return digest
+
+
+def data_digest(data: bytes) -> str:
+    """SHA-256 de um conteúdo já em memória (mesmo formato de file_digest)."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class DiskCache:
+    """
+    Cache em disco de blobs por chave, com limite de tamanho e despejo LRU.
+
+    Cada entrada é um arquivo `<hash da chave><suffix>` no diretório (`.bin`
+    por padrão; miniaturas usam `.jpg` para serem abertas direto). O último acesso
+    fica no mtime do arquivo (atualizado a cada leitura), então o despejo
+    remove primeiro as entradas usadas há mais tempo até caber em
+    `max_bytes` / `max_entries`. A gravação é atômica (arquivo temporário +
+    os.replace), para que duas abas/processos não leiam uma entrada pela metade.
+    """
+
+    SUFFIX = ".bin"
+
+    def __init__(self, directory: str, max_bytes: int = 200 * 1024 * 1024, max_entries: int = 500,
+                 suffix: str = SUFFIX):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        # Contadores para medição
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        # Chaves viram nomes de arquivo seguros (só caracteres hexadecimais)
+        name = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, name + self.suffix)
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # Marca como usado agora (LRU)
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def get_path(self, key: str) -> Optional[str]:
+        """Caminho do arquivo da entrada, para quem precisa de um arquivo (ex.: imagens da UI)."""
+        path = self._path(key)
+        try:
+            os.utime(path)  # Marca como usado agora (LRU)
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def put(self, key: str, data: bytes, evict: bool = True) -> Optional[str]:
+        """
+        Grava a entrada e devolve o caminho do arquivo (None se não coube).
+        Com evict=False o despejo fica para uma chamada de evict() no fim de um lote.
+        """
+        if len(data) > self.max_bytes:
+            return None  # Nunca caberia; não despeja o cache inteiro por causa dela
+        path = self._path(key)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return None
+        if evict:
+            self.evict()
+        return path
+
+    def get_object(self, key: str) -> Any:
+        """
+        Valor guardado com put_object (None se ausente ou ilegível).
+
+        Os valores são JSON, nunca pickle: o diretório pode ser compartilhado
+        (ex.: o temporário do sistema) e um pickle plantado lá executaria
+        código ao ser lido.
+        """
+        data = self.get(key)
+        if data is None:
+            return None
+        try:
+            return json.loads(data.decode("utf-8"))
+        except ValueError:
+            # Entrada corrompida ou de uma versão incompatível
+            self.discard(key)
+            return None
+
+    def put_object(self, key: str, value: Any):
+        """Grava `value` (dict/list/números/strings, serializável em JSON)."""
+        self.put(key, json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+    def discard(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _entries(self) -> list:
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.suffix):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """Remove as entradas menos usadas até respeitar os limites."""
+        with self._lock:
+            entries = sorted(self._entries())  # Mais antigas primeiro
+            total = sum(size for _, size, _ in entries)
+            while entries and (total > self.max_bytes or len(entries) > self.max_entries):
+                _, size, path = entries.pop(0)
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                total -= size
+
+    def clear(self):
+        for _, _, path in self._entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
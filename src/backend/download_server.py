@@ -0,0 +1,314 @@
+import asyncio
+import hashlib
+import mimetypes
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+from backend.disk_cache import file_digest
+
+
+class DownloadApp:
+    """
+    App ASGI que serve os PDFs gerados com suporte a HTTP Range e ETag.
+
+    - ETag = hash do conteúdo (calculado uma vez por arquivo/tamanho/mtime);
+      If-None-Match igual devolve 304 sem corpo.
+    - Range "bytes=a-b", "bytes=a-" e "bytes=-n" devolvem 206 só com o
+      trecho pedido (If-Range com ETag diferente ignora o Range). Assim o
+      leitor de PDF do celular busca a página 1 sem baixar o arquivo todo.
+    Só arquivos dentro de `directory` são servidos, além dos resultados
+    publicados em memória com `publish` (sem passar pelo disco). O disco
+    continua sendo o armazenamento de fundo: um resultado que sai da
+    memória (despejo ou fim do servidor) é gravado em `directory` com o
+    mesmo nome, então o link dele continua valendo.
+    """
+
+    def __init__(self, directory: str, chunk_size: int = 256 * 1024, max_published: int = 20,
+                 max_etags: int = 1000):
+        self.directory = os.path.realpath(directory)
+        self.chunk_size = chunk_size
+        self.max_published = max_published
+        self.max_etags = max_etags
+        # caminho -> (tamanho, mtime, ETag); arquivo regravado substitui a entrada,
+        # e acima de max_etags sai o usado há mais tempo
+        self._etags: "OrderedDict[str, Tuple[int, int, str]]" = OrderedDict()
+        # nome -> resultado em memória (mais antigo primeiro)
+        self._published: "OrderedDict[str, _Published]" = OrderedDict()
+        # publish/spill rodam nas threads de processamento e as leituras no loop
+        # de eventos (e etag nas threads do executor): todo acesso aos dois dicts é sob lock
+        self._lock = threading.Lock()
+
+    def publish(self, name: str, fp) -> str:
+        """
+        Serve `fp` (arquivo binário aberto: BytesIO, SpooledTemporaryFile)
+        em `name`, direto da memória. Acima de max_published o mais antigo é
+        gravado em `directory` (ver spill) e fechado. Devolve o nome publicado.
+        """
+        if self._spill_path(name) is None:
+            raise ValueError(f"Nome inválido: {name}")
+        published = _Published(fp)
+        with self._lock:
+            self._published.pop(name, None)
+            self._published[name] = published
+        while True:
+            with self._lock:
+                if len(self._published) <= self.max_published:
+                    break
+                oldest = next(iter(self._published))
+            self.spill(oldest)
+        return name
+
+    def spill(self, name: str):
+        """
+        Grava o resultado publicado `name` em `directory` e o tira da memória.
+        Só sai do dict depois de gravado: um pedido no meio ainda o encontra.
+        """
+        with self._lock:
+            published = self._published.get(name)
+        if published is None:
+            return
+        published.spill(self._spill_path(name))
+        with self._lock:
+            if self._published.get(name) is published:
+                del self._published[name]
+
+    def spill_all(self):
+        """Grava em disco tudo o que está em memória (ex.: ao encerrar o servidor)."""
+        with self._lock:
+            names = list(self._published)
+        for name in names:
+            self.spill(name)
+
+    def discard(self, name: str):
+        with self._lock:
+            published = self._published.pop(name, None)
+        if published is not None:
+            published.close()
+
+    def _spill_path(self, name: str) -> Optional[str]:
+        path = os.path.realpath(os.path.join(self.directory, name))
+        if os.path.dirname(path) != self.directory:
+            return None
+        return path
+
+    def etag(self, path: str, st: os.stat_result) -> str:
+        with self._lock:
+            entry = self._etags.get(path)
+            if entry is not None and entry[:2] == (st.st_size, st.st_mtime_ns):
+                self._etags.move_to_end(path)
+                return entry[2]
+        tag = f'"{file_digest(path)[:32]}"'
+        with self._lock:
+            self._etags[path] = (st.st_size, st.st_mtime_ns, tag)
+            self._etags.move_to_end(path)
+            while len(self._etags) > self.max_etags:
+                self._etags.popitem(last=False)
+        return tag
+
+    def _resolve(self, rel_path: str) -> Optional[str]:
+        # rel_path vem do scope["path"] do ASGI, que já chega decodificado
+        path = os.path.realpath(os.path.join(self.directory, rel_path.lstrip("/")))
+        if os.path.commonpath([path, self.directory]) != self.directory or not os.path.isfile(path):
+            return None
+        return path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        method = scope["method"]
+        if method not in ("GET", "HEAD"):
+            await _respond(send, 405, [(b"allow", b"GET, HEAD")])
+            return
+        # scope["path"] já vem decodificado (%XX); decodificar de novo trocaria o arquivo
+        rel_path = scope.get("path", "").lstrip("/")
+        with self._lock:
+            published = self._published.get(rel_path)
+        path = None if published is not None else self._resolve(rel_path)
+        if published is None and path is None:
+            await _respond(send, 404)
+            return
+
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        if published is not None:
+            size, mtime, etag = published.size, published.mtime, published.etag
+        else:
+            st = os.stat(path)
+            size, mtime = st.st_size, st.st_mtime
+            # Hash do arquivo fora do loop de eventos (arquivos grandes)
+            etag = await asyncio.get_running_loop().run_in_executor(None, self.etag, path, st)
+        content_type = mimetypes.guess_type(rel_path)[0] or "application/octet-stream"
+        common = [
+            (b"etag", etag.encode()),
+            (b"accept-ranges", b"bytes"),
+            (b"last-modified", formatdate(mtime, usegmt=True).encode()),
+            (b"cache-control", b"no-cache"),  # Sempre revalida; 304 se nada mudou
+        ]
+
+        if _etag_matches(headers.get("if-none-match"), etag):
+            await _respond(send, 304, common)
+            return
+
+        start, end, status = 0, size - 1, 200
+        range_header = headers.get("range")
+        if range_header and headers.get("if-range", etag) == etag:
+            parsed = parse_range(range_header, size)
+            if parsed == "invalid":
+                await _respond(send, 416, common + [(b"content-range", f"bytes */{size}".encode())])
+                return
+            if parsed is not None:
+                start, end = parsed
+                status = 206
+
+        length = end - start + 1 if size else 0
+        response_headers = common + [
+            (b"content-type", content_type.encode()),
+            (b"content-length", str(length).encode()),
+            (b"content-disposition", f"inline; filename*=UTF-8''{quote(os.path.basename(rel_path))}".encode()),
+        ]
+        if status == 206:
+            response_headers.append((b"content-range", f"bytes {start}-{end}/{size}".encode()))
+        await send({"type": "http.response.start", "status": status, "headers": response_headers})
+        if method == "HEAD" or length == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+        if published is not None:
+            await self._send_chunks(send, lambda offset, n: published.read(start + offset, n), length)
+        else:
+            with open(path, "rb") as f:
+                f.seek(start)
+                await self._send_chunks(send, lambda offset, n: f.read(n), length)
+
+    async def _send_chunks(self, send, read, length: int):
+        """Envia `length` bytes lidos por read(deslocamento, n) fora do loop de eventos."""
+        loop = asyncio.get_running_loop()
+        sent = 0
+        while sent < length:
+            chunk = await loop.run_in_executor(None, read, sent, min(self.chunk_size, length - sent))
+            if not chunk:
+                break
+            sent += len(chunk)
+            await send({"type": "http.response.body", "body": chunk, "more_body": sent < length})
+        if sent < length:
+            # Arquivo encolheu durante o envio: encerra a resposta
+            await send({"type": "http.response.body", "body": b""})
+
+
+class _Published:
+    """
+    Resultado publicado em memória; leituras com seek sob lock (downloads
+    simultâneos). Depois de spill, as leituras em andamento seguem do arquivo.
+    """
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.path: Optional[str] = None
+        self.mtime = time.time()
+        self._lock = threading.Lock()
+        h = hashlib.sha256()
+        fp.seek(0)
+        for chunk in iter(lambda: fp.read(1 << 20), b""):
+            h.update(chunk)
+        self.size = fp.tell()
+        self.etag = f'"{h.hexdigest()[:32]}"'
+
+    def read(self, offset: int, n: int) -> bytes:
+        with self._lock:
+            if self.path is not None:
+                with open(self.path, "rb") as f:
+                    f.seek(offset)
+                    return f.read(n)
+            if self.fp.closed:
+                return b""  # Descartado durante o download
+            self.fp.seek(offset)
+            return self.fp.read(n)
+
+    def spill(self, path: str):
+        """Copia o conteúdo para `path` (gravação atômica) e libera a memória."""
+        with self._lock:
+            if self.fp.closed:
+                return
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    self.fp.seek(0)
+                    shutil.copyfileobj(self.fp, f)
+                os.replace(tmp, path)
+            except OSError as e:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                print(f"[DEBUG] Falha ao gravar {path} (resultado descartado): {e}")
+                return
+            finally:
+                self.fp.close()
+            self.path = path
+
+    def close(self):
+        with self._lock:
+            self.fp.close()
+
+
+def spooled_output(spill_bytes: int):
+    """Buffer de saída em memória que passa para um arquivo temporário acima de `spill_bytes`."""
+    return tempfile.SpooledTemporaryFile(max_size=spill_bytes, mode="w+b")
+
+
+class PrefixRouter:
+    """Encaminha `prefix/...` para `mounted` e o resto para `app` (ex.: o app do Flet)."""
+
+    def __init__(self, app, prefix: str, mounted):
+        self.app = app
+        self.prefix = prefix.rstrip("/")
+        self.mounted = mounted
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "") if scope["type"] in ("http", "websocket") else ""
+        if scope["type"] == "http" and path.startswith(self.prefix + "/"):
+            scope = dict(scope, path=path[len(self.prefix):], root_path=scope.get("root_path", "") + self.prefix)
+            await self.mounted(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+
+def parse_range(header: str, size: int):
+    """
+    (início, fim) do header Range; None para ignorar (vários intervalos ou
+    formato desconhecido: responde o arquivo inteiro); "invalid" para 416.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first == "":
+            suffix = int(last)
+            if suffix <= 0:
+                return "invalid"
+            return max(0, size - suffix), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return "invalid"
+    return start, min(end, size - 1)
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(",")]
+    # Comparação fraca: W/"x" vale como "x"
+    return "*" in tags or etag in (t[2:] if t.startswith("W/") else t for t in tags)
+
+
+async def _respond(send, status: int, headers=None):
+    await send({"type": "http.response.start", "status": status,
+                "headers": (headers or []) + [(b"content-length", b"0")]})
+    await send({"type": "http.response.body", "body": b""})
@@ -0,0 +1,76 @@
+import fitz  # PyMuPDF
+from typing import Dict, List, Optional, Tuple
+
+# Operações do bboxlog que podem ficar ATRÁS de um preço
+BACKGROUND_KINDS = ("fill-path", "fill-image", "fill-shade")
+
+
+class DrawingIndex:
+    """
+    Índice dos desenhos vetoriais de uma página, para achar a cor de fundo
+    sob um preço sem renderizar pixels.
+
+    Construído uma vez por página a partir de page.get_bboxlog() (ordem de
+    pintura de caminhos, imagens e degradês) e page.get_drawings() (cor de
+    preenchimento de cada caminho; o `seqno` do desenho é a posição no
+    bboxlog). A consulta devolve o item mais ao topo sob a área:
+    - caminho com preenchimento sólido -> a cor do preenchimento;
+    - imagem/degradê (ou preenchimento transparente) -> precisa de pixels;
+    - nada -> fundo da página (branco).
+    """
+
+    def __init__(self, page, cell_size: float = 50.0):
+        self.cell_size = cell_size
+        # seqno -> cor RGB dos caminhos com preenchimento opaco
+        self._fills: Dict[int, Tuple[float, float, float]] = {}
+        for d in page.get_drawings():
+            fill = d.get("fill")
+            opacity = d.get("fill_opacity")
+            if fill is not None and (opacity is None or opacity >= 0.99):
+                if len(fill) == 1:  # Cinza
+                    fill = (fill[0],) * 3
+                self._fills[d["seqno"]] = tuple(fill[:3])
+
+        # Grade: célula -> [(seqno, tipo, rect)] dos itens que a tocam
+        self._cells: Dict[Tuple[int, int], List[tuple]] = {}
+        for seqno, (kind, bbox) in enumerate(page.get_bboxlog()):
+            if kind not in BACKGROUND_KINDS:
+                continue
+            r = fitz.Rect(bbox)
+            if r.is_empty:
+                continue
+            cx0, cy0 = self._cell(r.x0, r.y0)
+            cx1, cy1 = self._cell(r.x1, r.y1)
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    self._cells.setdefault((cx, cy), []).append((seqno, kind, r))
+
+    def _cell(self, x: float, y: float) -> Tuple[int, int]:
+        return (int(x // self.cell_size), int(y // self.cell_size))
+
+    def topmost_under(self, rect) -> Optional[tuple]:
+        """(seqno, tipo, rect) do item pintado por último que cobre a área."""
+        r = fitz.Rect(rect)
+        center = fitz.Point((r.x0 + r.x1) / 2, (r.y0 + r.y1) / 2)
+        area = abs(r) or 1.0
+        best = None
+        for entry in self._cells.get(self._cell(center.x, center.y), ()):
+            seqno, kind, e_rect = entry
+            # Cobre o centro e pelo menos metade da área do preço
+            if center in e_rect and abs(e_rect & r) >= 0.5 * area:
+                if best is None or seqno > best[0]:
+                    best = entry
+        return best
+
+    def fill_under(self, rect) -> Tuple[bool, Optional[Tuple[float, float, float]]]:
+        """
+        (resolvido, cor). Se `resolvido` for False a área está sobre imagem,
+        degradê ou preenchimento transparente e a cor deve vir dos pixels.
+        """
+        entry = self.topmost_under(rect)
+        if entry is None:
+            return True, (1.0, 1.0, 1.0)  # Fundo da página
+        seqno, kind, _ = entry
+        if kind == "fill-path" and seqno in self._fills:
+            return True, self._fills[seqno]
+        return False, None
@@ -0,0 +1,197 @@
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+# Degraus (DPI relativo ao pedido, qualidade JPEG) tentados até caber no tamanho-alvo
+SIZE_LADDER = [(1.0, 80), (0.8, 70), (0.65, 60), (0.5, 50)]
+MIN_DPI = 72
+# Só troca a imagem se a versão nova for ao menos 10% menor
+MIN_GAIN = 0.9
+
+
+@dataclass
+class ImageResult:
+    """Uma imagem do PDF antes/depois da otimização."""
+    xref: int
+    size_before: int
+    size_after: int
+    pixels_before: Tuple[int, int]
+    pixels_after: Tuple[int, int]
+
+    @property
+    def saved(self) -> int:
+        return self.size_before - self.size_after
+
+
+@dataclass
+class OptimizationReport:
+    """Resultado da otimização: imagens trocadas, tempo total e se o alvo foi atingido."""
+    dpi: float
+    quality: int
+    seconds: float = 0.0
+    target_bytes: Optional[int] = None
+    estimated_bytes: Optional[int] = None
+    images: List[ImageResult] = field(default_factory=list)
+
+    @property
+    def saved(self) -> int:
+        return sum(r.saved for r in self.images)
+
+    @property
+    def reached(self) -> bool:
+        return self.target_bytes is None or (self.estimated_bytes or 0) <= self.target_bytes
+
+    def __str__(self) -> str:
+        text = (f"{len(self.images)} imagens otimizadas ({self.dpi:.0f} DPI, qualidade {self.quality}): "
+                f"-{self.saved / (1024 * 1024):.1f} MB em {self.seconds:.2f}s")
+        if self.target_bytes is not None and not self.reached:
+            text += " (tamanho-alvo não atingido)"
+        return text
+
+
+def _effective_dpi(doc) -> Dict[int, float]:
+    """xref -> menor DPI em que a imagem é exibida (maior área de exibição)."""
+    dpi: Dict[int, float] = {}
+    for page in doc:
+        for info in page.get_image_info(xrefs=True):
+            xref = info.get("xref", 0)
+            x0, y0, x1, y1 = info["bbox"]
+            width_pt = max(x1 - x0, y1 - y0)
+            if xref <= 0 or width_pt <= 0:
+                continue
+            # DPI = pixels / polegadas exibidas; a maior exibição define a resolução necessária
+            pixels = max(info["width"], info["height"])
+            current = pixels / (width_pt / 72.0)
+            dpi[xref] = min(dpi.get(xref, current), current)
+    return dpi
+
+
+def _candidates(doc) -> List[dict]:
+    """Imagens que podem ser recomprimidas (sem transparência nem máscara)."""
+    jobs = []
+    for xref, dpi in _effective_dpi(doc).items():
+        # Máscaras (SMask, /Mask, ImageMask) ficariam desalinhadas/perdidas no JPEG
+        if doc.xref_get_key(xref, "SMask")[0] != "null" or doc.xref_get_key(xref, "Mask")[0] != "null":
+            continue
+        if doc.xref_get_key(xref, "ImageMask")[1] == "true":
+            continue
+        try:
+            image = doc.extract_image(xref)
+        except Exception:
+            continue
+        if not image or image.get("smask"):
+            continue
+        jobs.append({
+            "xref": xref,
+            "data": image["image"],
+            "size": len(doc.xref_stream_raw(xref) or b""),
+            "pixels": (image["width"], image["height"]),
+            "dpi": dpi,
+        })
+    return jobs
+
+
+def _recompress(job: dict, dpi: float, quality: int) -> Optional[Tuple[int, bytes, Tuple[int, int], str]]:
+    """Reduz para `dpi` e grava em JPEG. Roda em processo separado (só Pillow, sem fitz)."""
+    try:
+        img = Image.open(io.BytesIO(job["data"]))
+        img.load()
+    except Exception:
+        return None
+    mode = "L" if img.mode in ("1", "L", "LA") else "RGB"
+    img = img.convert(mode)
+    scale = min(1.0, dpi / job["dpi"]) if job["dpi"] > 0 else 1.0
+    if scale < 1.0:
+        size = (max(1, int(img.width * scale)), max(1, int(img.height * scale)))
+        img = img.resize(size, Image.LANCZOS)
+    out = io.BytesIO()
+    img.save(out, "JPEG", quality=quality, optimize=True)
+    return job["xref"], out.getvalue(), img.size, mode
+
+
+def _recompress_many(args) -> list:
+    jobs, dpi, quality = args
+    return [_recompress(job, dpi, quality) for job in jobs]
+
+
+def _run(jobs: List[dict], dpi: float, quality: int, max_workers: int) -> Dict[int, tuple]:
+    """Recomprime todas as imagens em paralelo; devolve xref -> (jpeg, pixels, modo)."""
+    if max_workers <= 1 or len(jobs) <= 1:
+        results = _recompress_many((jobs, dpi, quality))
+    else:
+        # Lotes por processo: menos idas e voltas de bytes entre processos
+        chunks = [jobs[i::max_workers] for i in range(max_workers)]
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            results = [r for part in pool.map(_recompress_many, [(c, dpi, quality) for c in chunks if c]) for r in part]
+    return {r[0]: r[1:] for r in results if r is not None}
+
+
+def _write_image(doc, xref: int, jpeg: bytes, pixels: Tuple[int, int], mode: str):
+    """Troca o stream da imagem no próprio objeto (as páginas continuam apontando para o mesmo xref)."""
+    doc.update_stream(xref, jpeg, compress=False)
+    doc.xref_set_key(xref, "Filter", "/DCTDecode")
+    doc.xref_set_key(xref, "Width", str(pixels[0]))
+    doc.xref_set_key(xref, "Height", str(pixels[1]))
+    doc.xref_set_key(xref, "BitsPerComponent", "8")
+    doc.xref_set_key(xref, "ColorSpace", "/DeviceGray" if mode == "L" else "/DeviceRGB")
+    for key in ("DecodeParms", "Decode", "Intent"):
+        doc.xref_set_key(xref, key, "null")
+
+
+def optimize_images(doc, dpi: float = 150, quality: int = 75, target_bytes: Optional[int] = None,
+                    max_workers: Optional[int] = None) -> OptimizationReport:
+    """
+    Reduz e recomprime as imagens do documento (só imagens: textos, capas
+    de preço e desenhos vetoriais não são tocados).
+
+    Cada imagem exibida acima de `dpi` é reduzida e regravada em JPEG. Com
+    `target_bytes` os degraus de SIZE_LADDER (menos DPI, menos qualidade)
+    são tentados, sempre a partir das imagens originais, até o tamanho
+    estimado do arquivo caber no alvo. A recompressão roda em paralelo em
+    `max_workers` processos (padrão: nº de CPUs).
+    """
+    start = time.perf_counter()
+    workers = max_workers or os.cpu_count() or 1
+    jobs = _candidates(doc)
+    report = OptimizationReport(dpi=dpi, quality=quality, target_bytes=target_bytes)
+    if not jobs:
+        report.seconds = time.perf_counter() - start
+        return report
+
+    original_images = sum(job["size"] for job in jobs)
+    # Tamanho de tudo que não é imagem otimizável (texto, fontes, vetores, logo)
+    other_bytes = len(doc.tobytes(garbage=1)) - original_images if target_bytes else 0
+
+    ladder = [(1.0, quality)] if target_bytes is None else SIZE_LADDER
+    for factor, step_quality in ladder:
+        step_dpi = max(MIN_DPI, dpi * factor)
+        results = _run(jobs, step_dpi, step_quality, workers)
+        chosen = {}
+        for job in jobs:
+            result = results.get(job["xref"])
+            if result is not None and len(result[0]) < job["size"] * MIN_GAIN:
+                chosen[job["xref"]] = result
+        images = sum(len(chosen[j["xref"]][0]) if j["xref"] in chosen else j["size"] for j in jobs)
+        report.dpi, report.quality = step_dpi, step_quality
+        report.estimated_bytes = other_bytes + images if target_bytes else None
+        if target_bytes is None or report.estimated_bytes <= target_bytes:
+            break
+
+    for job in jobs:
+        if job["xref"] not in chosen:
+            continue
+        jpeg, pixels, mode = chosen[job["xref"]]
+        _write_image(doc, job["xref"], jpeg, pixels, mode)
+        result = ImageResult(job["xref"], job["size"], len(jpeg), job["pixels"], pixels)
+        report.images.append(result)
+        print(f"[DEBUG] Imagem {result.xref}: {result.pixels_before} -> {result.pixels_after}, "
+              f"{result.size_before / 1024:.0f} KB -> {result.size_after / 1024:.0f} KB")
+
+    report.seconds = time.perf_counter() - start
+    print(f"[DEBUG] {report}")
+    return report
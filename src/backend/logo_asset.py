@@ -0,0 +1,84 @@
+import io
+import os
+from typing import Dict, Tuple
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+
+class LogoAsset:
+    """
+    Logo carregada uma vez (Pillow), reduzida ao maior tamanho realmente
+    usado e embutida UMA vez por documento.
+
+    A primeira inserção num documento grava a imagem (stream); as seguintes
+    reaproveitam o mesmo xref (insert_image(xref=...)), então o MuPDF não
+    relê o arquivo a cada posição e o PDF leva uma só cópia da logo. Se
+    aparecer uma posição maior que a preparada, a logo é re-preparada no
+    tamanho novo (por isso vale chamar `reserve` antes com o maior tamanho).
+    """
+
+    def __init__(self, path: str, dpi: float = 200):
+        self.path = path
+        self.dpi = dpi
+        img = Image.open(path)
+        img.load()
+        self.original_size = img.size
+        # Mantém transparência (vira SMask no PDF); paletas/CMYK viram RGB(A)
+        has_alpha = img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info)
+        self._image = img.convert("RGBA" if has_alpha else "RGB")
+        self._prepared_px = 0
+        self._data = b""
+        # id(documento) -> (documento, xref, tamanho preparado)
+        self._xrefs: Dict[int, Tuple[object, int, int]] = {}
+        # Contadores para medição
+        self.encodes = 0
+
+    def _needed_px(self, rect) -> int:
+        r = fitz.Rect(rect)
+        return max(1, int(round(max(r.width, r.height) * self.dpi / 72.0)))
+
+    def reserve(self, rect):
+        """Garante que a logo preparada tenha resolução para `rect` (em pontos)."""
+        needed = min(self._needed_px(rect), max(self.original_size))
+        if needed <= self._prepared_px:
+            return
+        img = self._image
+        if max(img.size) > needed:
+            img = img.copy()
+            img.thumbnail((needed, needed), Image.LANCZOS)
+        out = io.BytesIO()
+        img.save(out, "PNG", optimize=True)
+        self._data = out.getvalue()
+        self._prepared_px = needed
+        self.encodes += 1
+
+    @property
+    def data(self) -> bytes:
+        return self._data
+
+    def insert(self, page, rect, overlay: bool = True) -> int:
+        """Insere a logo em `rect` mantendo a proporção; devolve o xref usado."""
+        self.reserve(rect)
+        doc = page.parent
+        entry = self._xrefs.get(id(doc))
+        if entry is not None and entry[0] is doc and entry[2] == self._prepared_px:
+            xref = entry[1]
+            page.insert_image(rect, xref=xref, keep_proportion=True, overlay=overlay)
+        else:
+            xref = page.insert_image(rect, stream=self._data, keep_proportion=True, overlay=overlay)
+            self._xrefs[id(doc)] = (doc, xref, self._prepared_px)
+        return xref
+
+    def forget(self, doc=None):
+        """Esquece o xref de um documento (ou de todos); chamar antes de fechá-lo."""
+        if doc is None:
+            self._xrefs.clear()
+        else:
+            self._xrefs.pop(id(doc), None)
+
+
+def logo_key(path: str) -> tuple:
+    """Chave de cache de uma logo: caminho + tamanho + mtime (arquivo trocado = logo nova)."""
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_size, st.st_mtime_ns)
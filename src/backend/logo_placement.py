@@ -0,0 +1,79 @@
+from typing import Dict, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+
+# Logo no canto inferior esquerdo de cada foto grande: 15% da largura visível
+LOGO_SCALE = 0.15
+LOGO_PADDING = 20
+# Fotos menores que isso (ícones, a própria logo de uma execução anterior) são ignoradas
+MIN_PHOTO_SIDE = 100
+MIN_ASPECT, MAX_ASPECT = 0.3, 3
+
+
+def logo_slot(bbox: tuple, cropbox: tuple) -> Optional[tuple]:
+    """Posição da logo para uma foto exibida em `bbox`, ou None se a foto não serve."""
+    # Só a parte visível conta: fotos com sangria passam da página
+    x0, y0 = max(bbox[0], cropbox[0]), max(bbox[1], cropbox[1])
+    x1, y1 = min(bbox[2], cropbox[2]), min(bbox[3], cropbox[3])
+    width, height = x1 - x0, y1 - y0
+    if width < MIN_PHOTO_SIDE or height < MIN_PHOTO_SIDE:
+        return None
+    aspect_ratio = width / height
+    if aspect_ratio > MAX_ASPECT or aspect_ratio < MIN_ASPECT:
+        return None
+    logo_w = width * LOGO_SCALE
+    return (x0 + LOGO_PADDING, y1 - logo_w - LOGO_PADDING, x0 + logo_w + LOGO_PADDING, y1 - LOGO_PADDING)
+
+
+class PlacementCache:
+    """
+    Decisões de posição da logo por (xref da imagem, matriz, área visível).
+
+    Catálogos repetem o mesmo layout de fotos em muitas páginas: a mesma
+    imagem com a mesma matriz dá sempre a mesma posição, então o filtro
+    (sangria, tamanho, proporção) roda uma vez por combinação. As imagens
+    da página vêm de UM get_image_info por página, em vez de um
+    get_image_rects (que relê o conteúdo da página) por imagem.
+    """
+
+    def __init__(self):
+        self._slots: Dict[tuple, Optional[tuple]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def slots(self, page) -> List[tuple]:
+        cropbox = tuple(page.cropbox)
+        slots = []
+        for info in page.get_image_info(xrefs=True):
+            xref = info.get("xref", 0)
+            if xref <= 0:
+                continue  # Imagem inline: não é foto de produto
+            key = (xref, tuple(info["transform"]), cropbox)
+            if key in self._slots:
+                self.hits += 1
+                slot = self._slots[key]
+            else:
+                self.misses += 1
+                slot = self._slots[key] = logo_slot(tuple(info["bbox"]), cropbox)
+            if slot is not None:
+                slots.append(slot)
+        return slots
+
+    def clear(self):
+        self._slots.clear()
+
+
+def logo_destinations(doc, page_nums: List[int], cache: Optional[PlacementCache] = None) -> Dict[int, List[tuple]]:
+    """Pré-passo: posições da logo de todas as páginas `page_nums` de uma vez."""
+    cache = cache if cache is not None else PlacementCache()
+    return {page_num: cache.slots(doc[page_num]) for page_num in page_nums}
+
+
+def logo_destinations_job(args: Tuple[str, List[int]]) -> Dict[int, List[tuple]]:
+    """Uma faixa de páginas do pré-passo, em processo separado."""
+    input_path, page_nums = args
+    doc = fitz.open(input_path)
+    try:
+        return logo_destinations(doc, page_nums)
+    finally:
+        doc.close()
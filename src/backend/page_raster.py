@@ -0,0 +1,92 @@
+import fitz  # PyMuPDF
+import numpy as np
+from collections import OrderedDict
+from typing import Optional
+
+from backend import color_analysis
+
+
+class PageRaster:
+    """Página renderizada uma única vez, com recortes sem cópia via NumPy."""
+
+    def __init__(self, page, dpi: float = 72, display_list=None):
+        self.page = page
+        self.zoom = dpi / 72.0
+        self.origin = (page.rect.x0, page.rect.y0)
+        self.display_list = display_list
+        source = display_list if display_list is not None else page
+        self.pix = source.get_pixmap(matrix=fitz.Matrix(self.zoom, self.zoom), alpha=False)
+        # Visão sobre o buffer do Pixmap (que fica vivo junto com o raster)
+        self.array = color_analysis.pixmap_array(self.pix)
+
+    def crop(self, rect) -> np.ndarray:
+        """Pixels (altura, largura, 3) da área `rect` em coordenadas da página."""
+        return color_analysis.crop(self.array, rect, self.zoom, self.origin)
+
+    def thumbnail(self, zoom: float):
+        """
+        Pixmap reduzido da página. Se o raster já tem resolução suficiente
+        ele é só reamostrado; senão renderiza de novo (pela DisplayList, se houver).
+        """
+        if zoom > self.zoom:
+            source = self.display_list if self.display_list is not None else self.page
+            return source.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+        if abs(zoom - self.zoom) < 1e-6:
+            return self.pix
+        width = max(1, int(round(self.pix.width * zoom / self.zoom)))
+        height = max(1, int(round(self.pix.height * zoom / self.zoom)))
+        return fitz.Pixmap(self.pix, width, height, None)
+
+
+class PageRasterCache:
+    """
+    Cache de rasters por página, compartilhado pelos helpers de cor.
+
+    Cada página é renderizada uma vez (na DPI configurada) e os helpers leem
+    recortes desse raster em vez de chamar page.get_pixmap de novo. O
+    processador descarta o raster assim que a página é gravada (`drop`), e
+    `max_pages` limita a memória caso alguém esqueça de descartar.
+    """
+
+    def __init__(self, dpi: float = 72, use_display_list: bool = False, max_pages: int = 4):
+        self.dpi = dpi
+        self.use_display_list = use_display_list
+        self.max_pages = max_pages
+        self._rasters: "OrderedDict[tuple, PageRaster]" = OrderedDict()
+        # Contador de renderizações feitas pelo MuPDF, para medição
+        self.renders = 0
+
+    def _key(self, page) -> tuple:
+        return (id(page.parent), page.number)
+
+    def get(self, page) -> PageRaster:
+        key = self._key(page)
+        raster = self._rasters.get(key)
+        if raster is None:
+            display_list = page.get_displaylist() if self.use_display_list else None
+            raster = PageRaster(page, self.dpi, display_list)
+            self.renders += 1
+            self._rasters[key] = raster
+            while len(self._rasters) > self.max_pages:
+                self._rasters.popitem(last=False)
+        else:
+            self._rasters.move_to_end(key)
+        return raster
+
+    def peek(self, page) -> Optional[PageRaster]:
+        """Raster da página se já estiver no cache (sem renderizar)."""
+        return self._rasters.get(self._key(page))
+
+    def thumbnail(self, page, zoom: float):
+        """Miniatura a partir do raster em cache, ou uma renderização direta."""
+        raster = self.peek(page)
+        if raster is not None:
+            return raster.thumbnail(zoom)
+        self.renders += 1
+        return page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+
+    def drop(self, page):
+        self._rasters.pop(self._key(page), None)
+
+    def clear(self):
+        self._rasters.clear()
@@ -0,0 +1,216 @@
+import fitz  # PyMuPDF
+from typing import Dict, List, Optional
+
+
+def _union(a: tuple, b: tuple) -> tuple:
+    # União de bboxes como tuplas (fitz.Rect |= é caro em laços por caractere)
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+def _is_empty(box: tuple) -> bool:
+    return box[2] <= box[0] or box[3] <= box[1]
+
+
+class CharIndex:
+    """
+    Índice de geometria por caractere, construído a partir do "rawdict".
+
+    `text` é o texto da página (linhas separadas por "\n") e cada posição
+    de `text` tem a bbox do caractere que a originou. Assim um match de regex
+    sobre `text` vira retângulo(s) exato(s) direto pelos offsets, sem
+    precisar de page.search_for (que varre a página inteira a cada chamada
+    e devolve todas as ocorrências iguais do preço).
+    """
+
+    def __init__(self, entries: List[tuple]):
+        # entries: (caractere, bbox, chave_da_linha, span) na ordem de leitura
+        parts = []
+        self.boxes: List[Optional[tuple]] = []
+        self.line_keys: List[Optional[tuple]] = []
+        self.spans: List[Optional[dict]] = []
+        # chave_da_linha -> [inicio, fim, bbox] no texto
+        self.line_ranges: Dict[tuple, list] = {}
+        
+        prev_line = None
+        for c, bbox, line_key, span in entries:
+            if prev_line is not None and line_key != prev_line:
+                parts.append("\n")
+                self.boxes.append(None)
+                self.line_keys.append(None)
+                self.spans.append(None)
+            if line_key not in self.line_ranges:
+                self.line_ranges[line_key] = [len(self.boxes), len(self.boxes), tuple(bbox)]
+            line_range = self.line_ranges[line_key]
+            # Ligaduras podem vir como mais de um caractere com a mesma bbox
+            for ch in c:
+                parts.append(ch)
+                self.boxes.append(bbox)
+                self.line_keys.append(line_key)
+                self.spans.append(span)
+            line_range[1] = len(self.boxes)
+            line_range[2] = _union(line_range[2], bbox)
+            prev_line = line_key
+        self.text = "".join(parts)
+
+    @classmethod
+    def from_rawdict(cls, blocks: List[dict]) -> "CharIndex":
+        entries = []
+        for b_no, b in enumerate(blocks):
+            for l_no, l in enumerate(b.get("lines", [])):
+                for s in l["spans"]:
+                    for ch in s["chars"]:
+                        entries.append((ch["c"], ch["bbox"], (b_no, l_no), s))
+        return cls(entries)
+
+    def rects_for(self, start: int, end: int) -> List[fitz.Rect]:
+        """Retângulos (um por linha) cobertos pelo intervalo [start, end) de `text`."""
+        boxes = []
+        current_line = None
+        for i in range(start, end):
+            box = self.boxes[i]
+            if box is None or _is_empty(box):
+                continue
+            if self.line_keys[i] != current_line:
+                boxes.append(box)
+                current_line = self.line_keys[i]
+            else:
+                boxes[-1] = _union(boxes[-1], box)
+        return [fitz.Rect(box) for box in boxes]
+
+    def bbox_for(self, start: int, end: int) -> Optional[fitz.Rect]:
+        """Retângulo único envolvendo o intervalo [start, end) de `text`."""
+        bbox = None
+        for i in range(start, end):
+            box = self.boxes[i]
+            if box is None or _is_empty(box):
+                continue
+            bbox = box if bbox is None else _union(bbox, box)
+        return fitz.Rect(bbox) if bbox is not None else None
+
+    def spans_for(self, start: int, end: int) -> List[dict]:
+        """Spans de origem (sem repetição, em ordem) do intervalo [start, end)."""
+        spans = []
+        seen = set()
+        for span in self.spans[start:end]:
+            if span is not None and id(span) not in seen:
+                seen.add(id(span))
+                spans.append(span)
+        return spans
+
+    def line_matches(self, pattern):
+        """
+        Matches de `pattern` linha a linha, com offsets de `text`. O `\\s` das
+        regex casaria o "\n" entre linhas e juntaria "R$" de uma linha com o
+        número da seguinte; assim um match nunca atravessa a quebra.
+        """
+        for start, end, _ in self.line_ranges.values():
+            yield from pattern.finditer(self.text, start, end)
+
+    def span_ranges(self):
+        """(span, inicio, fim) de cada span, na ordem do texto."""
+        start = None
+        current = None
+        for i, span in enumerate(self.spans):
+            if span is not current:
+                if current is not None:
+                    yield current, start, i
+                current = span
+                start = i
+        if current is not None:
+            yield current, start, len(self.spans)
+
+    def region(self, rect) -> "CharIndex":
+        """
+        Sub-índice com os caracteres cujo centro está dentro da área.
+        Só as linhas que intersectam a área são percorridas.
+        """
+        x0, y0, x1, y1 = tuple(rect)
+        entries = []
+        for line_key, (start, end, lb) in self.line_ranges.items():
+            # Linha inteira fora da área (mesmo critério de Rect.intersects)
+            if _is_empty(lb) or lb[0] >= x1 or lb[2] <= x0 or lb[1] >= y1 or lb[3] <= y0:
+                continue
+            for i in range(start, end):
+                box = self.boxes[i]
+                cx = (box[0] + box[2]) / 2
+                cy = (box[1] + box[3]) / 2
+                if x0 <= cx <= x1 and y0 <= cy <= y1:
+                    entries.append((self.text[i], box, line_key, self.spans[i]))
+        return CharIndex(entries)
+
+
+class PageTextContext:
+    """
+    Camada de extração de texto compartilhada por página.
+
+    Constrói UMA única TextPage do MuPDF (sem blocos de imagem) e deriva dela,
+    de forma preguiçosa, as visões "text", "dict", "words" e o índice de
+    caracteres ("rawdict") usados pelas estratégias de detecção de preço.
+    Assim cada página é lida pelo MuPDF uma vez só, em vez de uma vez por
+    estratégia/preço.
+
+    Obs: a TextPage reflete o conteúdo da página no momento da construção.
+    Textos inseridos depois (preços novos) não aparecem aqui, o que evita que
+    uma estratégia reprocesse o preço que outra acabou de escrever.
+    """
+
+    # Flags do "dict" sem TEXT_PRESERVE_IMAGES: imagens não entram na TextPage
+    TEXT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+    def __init__(self, page):
+        self.page = page
+        self._textpage = None
+        self._text: Optional[str] = None
+        self._blocks: Optional[List[dict]] = None
+        self._words: Optional[List[tuple]] = None
+        self._chars: Optional[CharIndex] = None
+        # Contador de chamadas ao MuPDF (construção + extrações), para medição
+        self.extraction_calls = 0
+
+    @property
+    def textpage(self):
+        if self._textpage is None:
+            self._textpage = self.page.get_textpage(flags=self.TEXT_FLAGS)
+            self.extraction_calls += 1
+        return self._textpage
+
+    @property
+    def text(self) -> str:
+        """Texto corrido da página (equivalente a page.get_text("text"))."""
+        if self._text is None:
+            self._text = self.page.get_text("text", textpage=self.textpage)
+            self.extraction_calls += 1
+        return self._text
+
+    @property
+    def blocks(self) -> List[dict]:
+        """Blocos de texto (equivalente a page.get_text("dict")["blocks"])."""
+        if self._blocks is None:
+            self._blocks = self.page.get_text("dict", textpage=self.textpage)["blocks"]
+            self.extraction_calls += 1
+        return self._blocks
+
+    @property
+    def words(self) -> List[tuple]:
+        """Palavras (x0, y0, x1, y1, "word", block_no, line_no, word_no)."""
+        if self._words is None:
+            self._words = self.page.get_text("words", textpage=self.textpage)
+            self.extraction_calls += 1
+        return self._words
+
+    @property
+    def chars(self) -> CharIndex:
+        """Índice de geometria por caractere (derivado do "rawdict")."""
+        if self._chars is None:
+            raw = self.page.get_text("rawdict", textpage=self.textpage)
+            self.extraction_calls += 1
+            self._chars = CharIndex.from_rawdict(raw["blocks"])
+        return self._chars
+
+    def close(self):
+        """Libera a TextPage (e as visões derivadas)."""
+        self._textpage = None
+        self._text = None
+        self._blocks = None
+        self._words = None
+        self._chars = None
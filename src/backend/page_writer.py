@@ -0,0 +1,48 @@
+from typing import Dict, List, Tuple
+
+Color = Tuple[float, float, float]
+
+
+class PageWriter:
+    """
+    Acumula as capas (retângulos) e os textos novos de uma página e grava
+    tudo de uma vez, com um único Shape.
+
+    Cada page.draw_rect / page.insert_text cria um Shape próprio e anexa um
+    novo fragmento ao /Contents da página. Com 200 preços isso vira 400
+    edições incrementais; aqui vira UM stream: primeiro todas as capas
+    (agrupadas por cor) e por cima todos os textos.
+    """
+
+    def __init__(self):
+        # cor de preenchimento -> retângulos a cobrir
+        self._covers: Dict[Color, List] = {}
+        self._texts: List[tuple] = []
+
+    def cover(self, rect, fill: Color):
+        self._covers.setdefault(tuple(fill), []).append(rect)
+
+    def text(self, point, text: str, fontsize: float, fontname: str, color: Color):
+        self._texts.append((point, text, fontsize, fontname, color))
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    def commit(self, page) -> int:
+        """Grava capas e textos na página e limpa o acumulado. Retorna nº de textos."""
+        if not self._covers and not self._texts:
+            return 0
+        shape = page.new_shape()
+        for fill, rects in self._covers.items():
+            for rect in rects:
+                shape.draw_rect(rect)
+            # Um único operador de preenchimento por cor
+            shape.finish(color=None, fill=fill)
+        for point, text, fontsize, fontname, color in self._texts:
+            shape.insert_text(point, text, fontsize=fontsize, fontname=fontname, color=color)
+        shape.commit(overlay=True)
+
+        count = len(self._texts)
+        self._covers = {}
+        self._texts = []
+        return count
@@ -1,12 +1,92 @@
 
 import fitz  # PyMuPDF
+import io
 import re
 import os
 import datetime
-from typing import Optional, List, Tuple
+import time
+from typing import Dict, Iterable, Iterator, Optional, List, Tuple, Union
+from backend.page_text import PageTextContext
+from backend.spatial_index import RectGrid
+from backend import color_analysis
+from backend.page_raster import PageRasterCache
+from backend.drawing_index import DrawingIndex
+from backend.strategy_stats import StrategyStats
+from backend.price_detection import PriceCandidate, resolve_overlaps
+from backend.page_writer import PageWriter
+from backend.price_report import PriceReportWriter, candidate_record
+from backend.catalog_analysis import ANALYSIS_VERSION, CatalogAnalysis, CatalogVariant
+from backend.disk_cache import DiskCache, data_digest, file_digest
+from backend.save_profiles import SaveReport, check_profile, open_for_profile, save_document
+from backend.image_optimizer import OptimizationReport, optimize_images
+from backend.logo_asset import LogoAsset, logo_key
+from backend.logo_placement import PlacementCache, logo_destinations, logo_destinations_job
+from backend.thumbnails import (SPRITE_FORMATS, THUMB_CACHE_BYTES, THUMB_CACHE_ENTRIES, THUMB_ZOOM,
+                                SpriteSheet, ThumbnailReport, build_sprite_sheet, check_sprite_format,
+                                load_sprite_sheet, render_thumbnail_range, spill_thumbnail, sprite_groups,
+                                thumbnail_key, thumbnail_ranges)
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Marcador temporário do preço dentro de uma linha (Estratégia 6)
+PRICE_MARK = "\x00"
 
 class PdfProcessor:
-    def __init__(self):
+    # Estratégias de detecção de preço, na ordem em que rodam em cada página
+    STRATEGY_NAMES = ["spans", "adjacent_words", "lines", "currency_expansion", "context", "letterspacing"]
+    
+    def __init__(self, raster_dpi: float = 72, use_display_list: bool = False,
+                 adaptive: bool = False, profile_pages: int = 5, batch_writes: bool = True,
+                 cache_dir: Optional[str] = None, cache_max_bytes: int = 200 * 1024 * 1024,
+                 save_profile: Optional[str] = None,
+                 image_dpi: Optional[float] = None, image_quality: int = 75,
+                 target_size_mb: Optional[float] = None, image_workers: Optional[int] = None,
+                 thumbnail_cache_dir: Optional[str] = None):
+        # Raster por página compartilhado pelos helpers de cor (fundo/texto/capa).
+        # raster_dpi controla a resolução usada para amostrar as cores.
+        self.raster_cache = PageRasterCache(dpi=raster_dpi, use_display_list=use_display_list)
+        # Índice de desenhos vetoriais por página (cor de fundo sem renderizar)
+        self._drawing_indexes = {}
+        
+        # Modo adaptativo: depois de `profile_pages` páginas, estratégias que
+        # não acharam nenhum preço no documento deixam de rodar.
+        self.adaptive = adaptive
+        self.profile_pages = profile_pages
+        self.strategy_stats = StrategyStats(self.STRATEGY_NAMES)
+        # Perfil feito em outro processo (faixas do V2): se presente, decide o modo adaptativo
+        self.profiled_stats: Optional[StrategyStats] = None
+        
+        # Gravar capas e textos de cada página em uma única operação (PageWriter)
+        self.batch_writes = batch_writes
+        
+        # Cache em disco da análise (preços, logo, cores) por conteúdo do PDF.
+        # Reprocessar o mesmo arquivo com outro markup só refaz a gravação.
+        self.raster_dpi = raster_dpi
+        self.analysis_cache = DiskCache(cache_dir, max_bytes=cache_max_bytes) if cache_dir else None
+        
+        # Perfil de gravação (save_profiles.SAVE_PROFILES). None = padrão de cada
+        # fluxo: "fast" no process_catalog, "balanced" no V2.
+        self.save_profile = check_profile(save_profile) if save_profile else None
+        # Tempo e tamanho da última gravação
+        self.last_save: Optional[SaveReport] = None
+        
+        # Otimização de imagens antes de salvar (para compartilhar no WhatsApp):
+        # reduz para image_dpi e/ou até o arquivo caber em target_size_mb.
+        self.image_dpi = image_dpi
+        self.image_quality = image_quality
+        self.target_size_mb = target_size_mb
+        self.image_workers = image_workers
+        self.last_optimization: Optional[OptimizationReport] = None
+        # Posições da logo já decididas (xref + matriz da foto)
+        self.logo_placements = PlacementCache()
+        # Miniaturas em cache por conteúdo do PDF (padrão: junto do cache da análise
+        # ou no diretório temporário)
+        self.thumbnail_cache_dir = thumbnail_cache_dir
+        self.thumbnail_cache: Optional[DiskCache] = None
+        # Tempo até a primeira miniatura / total da última iter_thumbnails
+        self.last_thumbnails: Optional[ThumbnailReport] = None
+        # Logos já carregadas/reduzidas (chave: caminho + tamanho + mtime)
+        self._logo_assets: Dict[tuple, LogoAsset] = {}
+        
         # Regex aprimorado para múltiplos formatos de preço:
         # - R$ 14,00 (formato brasileiro padrão)
         # - R$ 14.00 (formato com ponto decimal)
@@ -32,6 +112,9 @@ class PdfProcessor:
             re.IGNORECASE
         )
         
+        # Símbolo da moeda isolado (ponto de partida da Estratégia 4)
+        self.currency_regex = re.compile(r"R\$", re.IGNORECASE)
+        
         # Palavras-chave que indicam contexto de preço
         self.price_context_keywords = [
             "ATACADO", "PEÇAS", "PÇS", "REAIS", "UNIDADE", "PEÇA", 
@@ -41,11 +124,9 @@ class PdfProcessor:
     def _get_page_bg_color(self, page) -> Tuple[float, float, float]:
         """Tenta descobrir a cor de fundo predominante da página."""
         try:
-            # Reduzir drasticamente para pegar a média/fundo
-            pix = page.get_pixmap(matrix=fitz.Matrix(0.01, 0.01), alpha=False)
-            # Pegar pixel do canto (geralmente fundo)
-            r, g, b = pix.pixel(0, 0)
-            return (r/255.0, g/255.0, b/255.0)
+            # Cor dominante da borda do raster da página (já em cache)
+            raster = self.raster_cache.get(page)
+            return color_analysis.background_color(raster.array)
         except:
             return (1.0, 1.0, 1.0) # Branco padrão
 
@@ -71,14 +152,20 @@ class PdfProcessor:
         if not os.path.exists(input_path):
             return False, f"Arquivo de entrada não encontrado: {input_path}"
 
+        profile = self.save_profile or "fast"
         try:
-            doc = fitz.open(input_path)
+            # No perfil incremental a edição é feita numa cópia em output_path
+            doc = open_for_profile(input_path, output_path, profile)
             total_pages = len(doc)
         except Exception as e:
             return False, f"Erro ao abrir PDF: {str(e)}"
 
         total_prices_updated = 0
         total_logos_inserted = 0
+        self.strategy_stats = StrategyStats(self.STRATEGY_NAMES)
+        # Logo ilegível: o catálogo sai sem logo em vez de falhar
+        if logo_path and os.path.exists(logo_path) and self._logo_asset(logo_path) is None:
+            logo_path = None
 
         for page_num, page in enumerate(doc):
             # Reportar Progresso
@@ -95,39 +182,159 @@ class PdfProcessor:
             if logo_path and os.path.exists(logo_path):
                 inserted_count = self._insert_logo_on_page(page, logo_path)
                 total_logos_inserted += inserted_count
+            
+            # Página pronta: liberar os caches dela
+            self._release_page(page)
 
+        print(self.strategy_stats.report())
+        self._forget_logo_xrefs()
         if progress_callback:
             progress_callback(0.95) # Salvando...
 
         try:
-            # save args: garbage=0 (não reescrever streams não usados), deflate=False (não reprimir)
+            self._optimize_output(doc, profile)
+            # Padrão "fast": garbage=0 (não reescrever streams não usados), deflate=False (não reprimir)
             # Para manter qualidade máxima, ideal é não mexer.
-            doc.save(output_path, garbage=0, deflate=False)
+            self.last_save = save_document(doc, output_path, profile)
             doc.close()
-            return True, f"Processamento concluído! Preços atualizados: {total_prices_updated}. Logos inseridas: {total_logos_inserted}."
+            return True, f"Processamento concluído! Preços atualizados: {total_prices_updated}. Logos inseridas: {total_logos_inserted}. ({self.last_save})"
         except Exception as e:
             return False, f"Erro ao salvar PDF: {str(e)}"
 
-    def get_thumbnails(self, input_path: str) -> List[str]:
+    def get_thumbnails(self, input_path: str, max_workers: Optional[int] = None) -> List[str]:
         """Gera thumbnails de cada página e retorna lista de caminhos temporários."""
-        thumbs = []
+        thumbs = {}
         try:
-            doc = fitz.open(input_path)
-            import tempfile
-            temp_dir = tempfile.gettempdir()
-            
-            # Limitar a resolução para não pesar a UI (scale 0.15)
-            mat = fitz.Matrix(0.15, 0.15)
-            
-            for i, page in enumerate(doc):
-                pix = page.get_pixmap(matrix=mat, alpha=False)
-                thumb_path = os.path.join(temp_dir, f"thumb_{os.path.basename(input_path)}_{i}.jpg")
-                pix.save(thumb_path)
-                thumbs.append(thumb_path)
-            doc.close()
+            for page_num, thumb_path in self.iter_thumbnails(input_path, max_workers):
+                thumbs[page_num] = thumb_path
         except Exception as e:
             print(f"Erro ao gerar thumbnails: {e}")
-        return thumbs
+        return [thumbs[n] for n in sorted(thumbs)]
+
+    def iter_thumbnails(self, input_path: str, max_workers: Optional[int] = None,
+                        zoom: float = THUMB_ZOOM, pages: Optional[List[int]] = None) -> Iterator[Tuple[int, str]]:
+        """
+        Gera (nº da página, caminho) de cada miniatura assim que ela fica pronta.
+        
+        As miniaturas ficam no cache em disco (thumbnail_cache), chaveadas
+        pelo conteúdo do PDF + página + zoom: arquivos diferentes com o mesmo
+        nome não se misturam e reabrir um catálogo devolve tudo do cache, na
+        hora. As que faltam são renderizadas; com max_workers > 1 (o padrão
+        é serial), em faixas pequenas num pool, que chegam na ordem em que
+        terminam (não necessariamente na ordem das páginas). Tempo até a primeira
+        miniatura e tempo total ficam em self.last_thumbnails. `pages` limita
+        a geração a essas páginas (ex.: só as que a grade vai mostrar agora).
+        """
+        start = time.perf_counter()
+        report = self.last_thumbnails = ThumbnailReport()
+        cache = self._thumbnail_cache()
+        digest = file_digest(input_path)
+        
+        def ready(page_num, thumb_path):
+            if report.first_seconds is None:
+                report.first_seconds = time.perf_counter() - start
+            report.pages += 1
+            return page_num, thumb_path
+        
+        def store(page_num, data):
+            # Despejo (LRU) uma vez só, no fim
+            key = thumbnail_key(digest, page_num, zoom)
+            thumb_path = cache.put(key, data, evict=False)
+            if thumb_path is None:
+                # Não coube no cache (ou falha ao gravar): arquivo avulso, fora do cache
+                thumb_path = spill_thumbnail(key, data)
+            if thumb_path is None:
+                print(f"[DEBUG] Miniatura da página {page_num + 1} não gravada; página ignorada")
+                return
+            yield ready(page_num, thumb_path)
+        
+        doc = fitz.open(input_path)
+        missing = []
+        try:
+            for i in (range(len(doc)) if pages is None else pages):
+                thumb_path = cache.get_path(thumbnail_key(digest, i, zoom))
+                if thumb_path is None:
+                    missing.append(i)
+                else:
+                    report.cached += 1
+                    yield ready(i, thumb_path)
+            
+            # Padrão serial: no servidor web um pool por chamada (por aba) disputaria as CPUs
+            workers = max_workers or 1
+            ranges = thumbnail_ranges(missing, workers)
+            if workers <= 1 or len(ranges) <= 1:
+                for i in missing:
+                    # Reaproveita o raster da página se já estiver em cache
+                    yield from store(i, self.raster_cache.thumbnail(doc[i], zoom).tobytes("jpg"))
+            else:
+                doc.close()  # Cada processo abre o arquivo
+                pool = ProcessPoolExecutor(max_workers=workers)
+                try:
+                    futures = [pool.submit(render_thumbnail_range, input_path, r, zoom) for r in ranges]
+                    for future in as_completed(futures):
+                        for page_num, data in future.result():
+                            yield from store(page_num, data)
+                finally:
+                    # Consumidor parou no meio: não renderiza o resto
+                    pool.shutdown(wait=True, cancel_futures=True)
+        finally:
+            # Também quando o consumidor para no meio (gerador fechado)
+            if not doc.is_closed:
+                doc.close()
+            if missing:
+                cache.evict()
+        
+        report.seconds = time.perf_counter() - start
+        print(f"[DEBUG] {report}")
+
+    def iter_sprite_sheets(self, input_path: str, out_dir: str, per_sheet: int = 100, columns: int = 10,
+                           fmt: str = "webp", quality: int = 70, max_workers: Optional[int] = None,
+                           sheets: Optional[List[int]] = None) -> Iterator[SpriteSheet]:
+        """
+        Miniaturas empacotadas em folhas de `per_sheet` páginas (com índice
+        de recorte por página), gravadas em out_dir. Cada folha sai assim
+        que todas as suas miniaturas ficam prontas: a grade carrega poucos
+        arquivos em vez de um por página e continua enchendo aos poucos.
+        `sheets` limita a geração a essas folhas (nº da folha = página // per_sheet).
+        Folhas já gravadas em out_dir (mesmo conteúdo e parâmetros, com o
+        índice JSON ao lado) são reaproveitadas sem gerar miniaturas.
+        """
+        check_sprite_format(fmt)
+        doc = fitz.open(input_path)
+        groups = sprite_groups(len(doc), per_sheet)
+        doc.close()
+        # Nome pelo conteúdo + parâmetros: arquivos de catálogos diferentes não se misturam
+        stem = f"sprite_{file_digest(input_path)[:16]}_{per_sheet}x{columns}_q{quality}"
+        numbers = range(len(groups)) if sheets is None else [n for n in sheets if 0 <= n < len(groups)]
+        paths = {number: os.path.join(out_dir, f"{stem}_{number}{SPRITE_FORMATS[fmt][1]}") for number in numbers}
+        # Folhas já gravadas (mesmo conteúdo e parâmetros) saem na hora, sem miniaturas
+        pending = []
+        for number in numbers:
+            sheet = load_sprite_sheet(number, paths[number])
+            if sheet is None:
+                pending.append(number)
+            else:
+                yield sheet
+        pages = [page_num for number in pending for page_num in groups[number]]
+        ready: Dict[int, str] = {}
+        for page_num, thumb_path in self.iter_thumbnails(input_path, max_workers, pages=pages):
+            ready[page_num] = thumb_path
+            number = page_num // per_sheet
+            if all(n in ready for n in groups[number]):
+                yield build_sprite_sheet(number, [(n, ready[n]) for n in groups[number]], paths[number],
+                                         columns, fmt, quality)
+
+    def _thumbnail_cache(self) -> DiskCache:
+        """Cache de miniaturas (criado no primeiro uso; sobrevive a reinícios)."""
+        if self.thumbnail_cache is None:
+            directory = self.thumbnail_cache_dir
+            if directory is None:
+                import tempfile
+                base = self.analysis_cache.directory if self.analysis_cache is not None else tempfile.gettempdir()
+                directory = os.path.join(base, "editor_catalogo_thumbs")
+            self.thumbnail_cache = DiskCache(directory, max_bytes=THUMB_CACHE_BYTES,
+                                             max_entries=THUMB_CACHE_ENTRIES, suffix=".jpg")
+        return self.thumbnail_cache
 
     def process_catalog_v2(self, 
                            input_path: str, 
@@ -138,106 +345,491 @@ class PdfProcessor:
                            add_cover: bool,
                            add_intro: bool,
                            catalog_name: str,
-                           progress_callback=None) -> Tuple[bool, str]:
+                           progress_callback=None,
+                           max_workers: int = 1) -> Tuple[bool, str]:
         """
         Processamento V2: Reconstrói o PDF.
+        
+        output_path pode ser um arquivo aberto (ex.: SpooledTemporaryFile): o
+        PDF é escrito direto nele (ver save_document).
+        max_workers > 1 divide as páginas entre processos (ver _process_shards).
         """
         if not os.path.exists(input_path):
             return False, f"Arquivo não encontrado: {input_path}"
 
         try:
             src_doc = fitz.open(input_path)
-            out_doc = fitz.open() # Novo PDF vazio
-            
-            total_steps = len(src_doc)
-            current_step = 0
+            self.strategy_stats = StrategyStats(self.STRATEGY_NAMES)
+            analysis = None
+            if self.analysis_cache is not None:
+                analysis = self._cached_analysis(file_digest(input_path), src_doc, pages_to_exclude)
+            ok, message = self._write_catalog(
+                src_doc, output_path, price_markup, logo_path, pages_to_exclude,
+                add_cover, add_intro, catalog_name, analysis=analysis,
+                progress_callback=progress_callback, max_workers=max_workers
+            )
+            src_doc.close()
+            print(self.strategy_stats.report())
+            return ok, message
 
-            # 0. Descobrir Cor de Fundo da PRIMEIRA página real (que não será deletada)
-            bg_color = (1, 1, 1) # White default
-            for i in range(len(src_doc)):
-                if i not in pages_to_exclude:
-                    bg_color = self._get_page_bg_color(src_doc[i])
-                    break
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            return False, f"Erro Fatal: {str(e)}"
+
+    def process_catalog_v2_bytes(self,
+                                 source,
+                                 price_markup: float,
+                                 logo_path: Optional[str],
+                                 pages_to_exclude: List[int],
+                                 add_cover: bool,
+                                 add_intro: bool,
+                                 catalog_name: str,
+                                 output=None,
+                                 progress_callback=None,
+                                 max_workers: int = 1) -> Tuple[bool, str, Optional[bytes]]:
+        """
+        Processamento V2 sem arquivos temporários.
+        
+        `source` são os bytes do PDF ou um arquivo aberto (binário). Sem
+        `output` o PDF gerado volta como bytes; com `output` (BytesIO,
+        SpooledTemporaryFile, arquivo aberto...) ele é escrito lá e o
+        terceiro item volta None.
+        """
+        try:
+            data = source if isinstance(source, (bytes, bytearray)) else source.read()
+            src_doc = fitz.open(stream=data, filetype="pdf")
+            self.strategy_stats = StrategyStats(self.STRATEGY_NAMES)
+            analysis = None
+            if self.analysis_cache is not None:
+                analysis = self._cached_analysis(data_digest(data), src_doc, pages_to_exclude)
+            target = output if output is not None else io.BytesIO()
+            ok, message = self._write_catalog(
+                src_doc, target, price_markup, logo_path, pages_to_exclude,
+                add_cover, add_intro, catalog_name, analysis=analysis,
+                progress_callback=progress_callback, max_workers=max_workers, source_data=data
+            )
+            src_doc.close()
+            print(self.strategy_stats.report())
+            return ok, message, (target.getvalue() if ok and output is None else None)
+
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            return False, f"Erro Fatal: {str(e)}", None
+
+    def analyze_catalog(self, src_doc, pages_to_exclude: List[int], progress_callback=None) -> CatalogAnalysis:
+        """
+        Análise compartilhada (sem markup): cor da capa e, para cada página
+        que vai para a saída, os preços (com cor de fundo) e onde entra a logo.
+        """
+        analysis = CatalogAnalysis(page_count=len(src_doc))
+        self._cover_bg_color(src_doc, pages_to_exclude, analysis)
+        
+        for page_num, page in enumerate(src_doc):
+            if progress_callback: progress_callback((page_num + 1) / len(src_doc))
+            if page_num in pages_to_exclude:
+                continue
+            analysis.prices[page_num] = self.detect_prices(page)
+            self._release_page(page)
+        # Posições da logo: pré-passo próprio, para o catálogo todo
+        analysis.logo_slots = logo_destinations(src_doc, list(analysis.prices), self.logo_placements)
+        return analysis
+
+    def _analysis_key(self, digest: str, pages_to_exclude: Iterable[int] = ()) -> str:
+        # Conteúdo do PDF (SHA-256) + versão da análise + opções que mudam o resultado
+        # (no modo adaptativo, profile_pages decide quais estratégias continuam rodando)
+        key = (f"analysis:{digest}:v{ANALYSIS_VERSION}:dpi{self.raster_dpi}"
+               f":adaptive{int(self.adaptive)}:profile{self.profile_pages}")
+        if self.adaptive:
+            # O perfil sai das primeiras páginas analisadas: depende das removidas
+            key += ":exclude" + ",".join(str(n) for n in sorted(set(pages_to_exclude)))
+        return key
+
+    def _cached_analysis(self, digest: str, src_doc, pages_to_exclude: List[int],
+                         progress_callback=None) -> CatalogAnalysis:
+        """
+        Análise do catálogo vinda do cache em disco, ou feita agora e guardada.
+        
+        A análise em cache cobre TODAS as páginas, então continua válida se o
+        usuário mudar as páginas removidas entre um processamento e outro.
+        No modo adaptativo não: as páginas analisadas são as mesmas do
+        processamento sem cache (o perfil de estratégias depende delas) e as
+        removidas entram na chave.
+        """
+        key = self._analysis_key(digest, pages_to_exclude)
+        analysis = self._load_analysis(key)
+        if analysis is not None and analysis.page_count == len(src_doc):
+            print(f"[DEBUG] Análise em cache: {analysis.price_count} preços")
+            if progress_callback: progress_callback(1.0)
+            # Cor da capa para esta seleção de páginas (pode ser outra página)
+            colors_known = len(analysis.page_bg_colors)
+            self._cover_bg_color(src_doc, pages_to_exclude, analysis)
+            if len(analysis.page_bg_colors) != colors_known:
+                self.analysis_cache.put_object(key, analysis.to_dict())
+            return analysis
+        analysis = self.analyze_catalog(src_doc, pages_to_exclude if self.adaptive else [], progress_callback)
+        self._cover_bg_color(src_doc, pages_to_exclude, analysis)
+        self.analysis_cache.put_object(key, analysis.to_dict())
+        return analysis
+
+    def _load_analysis(self, key: str) -> Optional[CatalogAnalysis]:
+        data = self.analysis_cache.get_object(key)
+        if data is None:
+            return None
+        try:
+            return CatalogAnalysis.from_dict(data)
+        except (KeyError, TypeError, ValueError, AttributeError):
+            # Entrada de outro formato: refaz a análise (e sobrescreve)
+            self.analysis_cache.discard(key)
+            return None
+
+    def _cover_bg_color(self, src_doc, pages_to_exclude: List[int],
+                        analysis: Optional[CatalogAnalysis] = None) -> Tuple[float, float, float]:
+        """Cor de fundo da PRIMEIRA página real (que não será deletada)."""
+        for i in range(len(src_doc)):
+            if i in pages_to_exclude:
+                continue
+            if analysis is not None and i in analysis.page_bg_colors:
+                return analysis.page_bg_colors[i]
+            color = self._get_page_bg_color(src_doc[i])
+            if analysis is not None:
+                analysis.page_bg_colors[i] = color
+            return color
+        return (1, 1, 1) # White default
+
+    def _write_catalog(self, src_doc, output_path, price_markup: float,
+                       logo_path: Optional[str], pages_to_exclude: List[int],
+                       add_cover: bool, add_intro: bool, catalog_name: str,
+                       analysis: Optional[CatalogAnalysis] = None,
+                       progress_callback=None, max_workers: int = 1,
+                       source_data: Optional[bytes] = None) -> Tuple[bool, str]:
+        """
+        Monta e salva o catálogo de saída (capa, intro, páginas com preços e logo).
+        
+        Com `analysis` os preços vêm da análise compartilhada; sem ela cada
+        página é analisada na hora (process_catalog_v2). Com max_workers > 1
+        as páginas são divididas em faixas processadas em paralelo; se src_doc
+        foi aberto da memória, `source_data` são os bytes originais que os
+        processos abrem. output_path pode ser um arquivo aberto (ver save_document).
+        """
+        out_doc = fitz.open() # Novo PDF vazio
+        # Logo ilegível: o catálogo sai sem logo (nem na capa) em vez de falhar
+        if logo_path and self._logo_asset(logo_path) is None:
+            logo_path = None
+
+        # 0. Descobrir Cor de Fundo da PRIMEIRA página real (que não será deletada)
+        bg_color = self._cover_bg_color(src_doc, pages_to_exclude, analysis)
+        
+        text_color = self._get_contrast_color(bg_color)
+
+        # 1. Gerar CAPA (Logo Centralizada)
+        if add_cover and logo_path:
+            cover_page = out_doc.new_page() 
+            cover_page.draw_rect(cover_page.rect, color=None, fill=bg_color)
+            
+            # Inserir logo grande no centro
+            w, h = cover_page.rect.width, cover_page.rect.height
+            logo_w = w * 0.5
+            logo_h = logo_w 
             
-            text_color = self._get_contrast_color(bg_color)
+            logo_rect = fitz.Rect(
+                (w - logo_w)/2,
+                (h - logo_w)/2 - 50, 
+                (w + logo_w)/2,
+                (h + logo_w)/2 - 50
+            )
+            try:
+                self._logo_asset(logo_path).insert(cover_page, logo_rect, overlay=True)
+            except Exception as e:
+                print(f"[DEBUG] Logo da capa não inserida: {e}")
+            
+        # 2. Gerar INTRO (Texto)
+        if add_intro:
+            intro_page = out_doc.new_page()
+            intro_page.draw_rect(intro_page.rect, color=None, fill=bg_color)
+            
+            # Setup Titulo
+            font_size_title = 30
+            font_size_date = 18
+            margin_top = 300
+            
+            w = intro_page.rect.width
+            
+            # Centralizar Texto: Precisamos da largura da string
+            # PyMuPDF insert_text não centraliza nativo.
+            # Solução: text_length
+            
+            title_text = f"{catalog_name}"
+            date_text = f"Gerado em: {datetime.datetime.now().strftime('%d/%m/%Y')}"
+            
+            # Usar font helv para calcular largura
+            font = fitz.Font("helv")
+            
+            tw_title = font.text_length(title_text, fontsize=font_size_title)
+            tw_date = font.text_length(date_text, fontsize=font_size_date)
+            
+            x_title = (w - tw_title) / 2
+            x_date = (w - tw_date) / 2
+            
+            intro_page.insert_text((x_title, margin_top), title_text, fontsize=font_size_title, fontname="helv", color=text_color)
+            intro_page.insert_text((x_date, margin_top + 50), date_text, fontsize=font_size_date, fontname="helv", color=text_color)
 
-            # 1. Gerar CAPA (Logo Centralizada)
-            if add_cover and logo_path:
-                cover_page = out_doc.new_page() 
-                cover_page.draw_rect(cover_page.rect, color=None, fill=bg_color)
-                
-                # Inserir logo grande no centro
-                w, h = cover_page.rect.width, cover_page.rect.height
-                logo_w = w * 0.5
-                logo_h = logo_w 
-                
-                logo_rect = fitz.Rect(
-                    (w - logo_w)/2,
-                    (h - logo_w)/2 - 50, 
-                    (w + logo_w)/2,
-                    (h + logo_w)/2 - 50
-                )
-                cover_page.insert_image(logo_rect, filename=logo_path, keep_proportion=True)
-                
-            # 2. Gerar INTRO (Texto)
-            if add_intro:
-                intro_page = out_doc.new_page()
-                intro_page.draw_rect(intro_page.rect, color=None, fill=bg_color)
-                
-                # Setup Titulo
-                font_size_title = 30
-                font_size_date = 18
-                margin_top = 300
-                
-                w = intro_page.rect.width
-                
-                # Centralizar Texto: Precisamos da largura da string
-                # PyMuPDF insert_text não centraliza nativo.
-                # Solução: text_length
-                
-                title_text = f"{catalog_name}"
-                date_text = f"Gerado em: {datetime.datetime.now().strftime('%d/%m/%Y')}"
-                
-                # Usar font helv para calcular largura
-                font = fitz.Font("helv")
-                
-                tw_title = font.text_length(title_text, fontsize=font_size_title)
-                tw_date = font.text_length(date_text, fontsize=font_size_date)
-                
-                x_title = (w - tw_title) / 2
-                x_date = (w - tw_date) / 2
-                
-                intro_page.insert_text((x_title, margin_top), title_text, fontsize=font_size_title, fontname="helv", color=text_color)
-                intro_page.insert_text((x_date, margin_top + 50), date_text, fontsize=font_size_date, fontname="helv", color=text_color)
+        # 3. Processar páginas originais
+        kept_pages = [n for n in range(len(src_doc)) if n not in pages_to_exclude]
+        # PDF aberto da memória não tem caminho: os processos recebem os bytes originais
+        source = src_doc.name or source_data
+        shards = _split_shards(kept_pages, max_workers) if source else [kept_pages]
+        if len(shards) <= 1:
+            self._process_pages(src_doc, out_doc, kept_pages, price_markup, logo_path, analysis,
+                                lambda p: progress_callback(p * 0.9) if progress_callback else None)
+        else:
+            head = []
+            if self.adaptive and analysis is None:
+                # O perfil do modo adaptativo (primeiras páginas) roda aqui; as faixas
+                # partem da mesma decisão, como na execução serial
+                head = kept_pages[:self.profile_pages]
+                shards = _split_shards(kept_pages[len(head):], max_workers)
+            share = len(head) / len(kept_pages)
+            if head:
+                self._process_pages(src_doc, out_doc, head, price_markup, logo_path, None,
+                                    lambda p: progress_callback(p * share * 0.9) if progress_callback else None)
+            if shards:
+                self._process_shards(source, out_doc, shards, price_markup, logo_path, analysis,
+                                     lambda p: progress_callback((share + p * (1 - share)) * 0.9) if progress_callback else None,
+                                     profiled=self.strategy_stats if head else None)
 
-            # 3. Processar páginas originais
-            for page_num, page in enumerate(src_doc):
-                current_step += 1
-                if progress_callback: progress_callback(current_step / total_steps * 0.9)
+        self.raster_cache.clear()
+        self._drawing_indexes.clear()
+        self._forget_logo_xrefs()
+        if progress_callback: progress_callback(0.95)
+        profile = self.save_profile or "balanced"
+        self._optimize_output(out_doc, profile)
+        # Ao salvar um doc reconstruído, deflate=True ajuda a comprimir os novos assets
+        # (perfil "balanced"; o incremental não se aplica a um documento novo)
+        self.last_save = save_document(out_doc, output_path, profile)
+        out_doc.close()
+        
+        return True, f"Processamento V2 Concluído! ({self.last_save})"
 
-                if page_num in pages_to_exclude:
-                    continue # Pula página deletada
-                
-                # Processar Preço e Logo Visualmente na página ORIGINAL
-                self._update_prices_on_page(page, price_markup)
-                if logo_path:
-                    self._insert_logo_on_page(page, logo_path)
-                
-                # Inserir essa página processada no novo doc
-                out_doc.insert_pdf(src_doc, from_page=page_num, to_page=page_num)
+    def _optimize_output(self, doc, profile: str):
+        """Otimiza as imagens do documento de saída, se configurado (image_dpi / target_size_mb)."""
+        self.last_optimization = None
+        if self.image_dpi is None and self.target_size_mb is None:
+            return
+        if profile == "incremental":
+            # Anexar imagens novas só aumentaria o arquivo (as originais continuam nele)
+            print("[DEBUG] Otimização de imagens ignorada no perfil incremental")
+            return
+        target = int(self.target_size_mb * 1024 * 1024) if self.target_size_mb else None
+        self.last_optimization = optimize_images(
+            doc, dpi=self.image_dpi or 150, quality=self.image_quality,
+            target_bytes=target, max_workers=self.image_workers
+        )
 
-            if progress_callback: progress_callback(0.95)
-            # Ao salvar um doc reconstruído, deflate=True ajuda a comprimir os novos assets
-            out_doc.save(output_path, garbage=4, deflate=True) 
-            src_doc.close()
-            out_doc.close()
+    def _worker_options(self) -> dict:
+        """Configuração do processador repassada aos processos de faixa/variante."""
+        return dict(
+            # Detecção: as mesmas opções, senão faixas/variantes acham outros preços
+            raster_dpi=self.raster_cache.dpi, use_display_list=self.raster_cache.use_display_list,
+            adaptive=self.adaptive, profile_pages=self.profile_pages,
+            batch_writes=self.batch_writes, save_profile=self.save_profile,
+            image_dpi=self.image_dpi, image_quality=self.image_quality,
+            target_size_mb=self.target_size_mb,
+            # Dentro de um processo de variante a recompressão não abre outro pool
+            image_workers=1,
+        )
+
+    def _process_pages(self, src_doc, out_doc, page_nums: List[int], price_markup: float,
+                       logo_path: Optional[str], analysis: Optional[CatalogAnalysis] = None,
+                       progress_callback=None):
+        """
+        Atualiza preços e logo das páginas `page_nums` e as copia, em ordem, para out_doc.
+        
+        A cópia é feita por faixas contíguas (um insert_pdf por faixa, não por
+        página): cada chamada percorre de novo os recursos compartilhados
+        (fontes, imagens), então menos chamadas = montagem bem mais rápida.
+        """
+        logo_slots = {}
+        asset = self._logo_asset(logo_path) if logo_path else None
+        if asset is None:
+            logo_path = None  # Sem logo ou logo ilegível
+        else:
+            # Pré-passo: posições da logo de todas as páginas (as da análise ou calculadas agora)
+            missing = [n for n in page_nums if analysis is None or not analysis.covers_page(n)]
+            logo_slots = logo_destinations(src_doc, missing, self.logo_placements)
+            if analysis is not None:
+                logo_slots.update({n: analysis.logo_slots.get(n, []) for n in page_nums if analysis.covers_page(n)})
+            # Prepara a logo já no maior tamanho usado: um só encode e um só xref
+            for slots in logo_slots.values():
+                for slot in slots:
+                    asset.reserve(slot)
+
+        for step, page_num in enumerate(page_nums, start=1):
+            if progress_callback: progress_callback(step / len(page_nums))
+            page = src_doc[page_num]
+            
+            # Processar Preço e Logo Visualmente na página ORIGINAL
+            if analysis is not None and analysis.covers_page(page_num):
+                self._apply_price_candidates(page, analysis.candidates_for(page_num), price_markup)
+            else:
+                self._update_prices_on_page(page, price_markup)
+            if logo_path:
+                self._insert_logo_on_page(page, logo_path, logo_slots.get(page_num, []))
             
-            return True, "Processamento V2 Concluído!"
+            # Página pronta: os caches dela não são mais necessários
+            self._release_page(page)
+        
+        # Inserir as páginas processadas no novo doc, uma faixa por vez
+        for first, last in _page_runs(page_nums):
+            out_doc.insert_pdf(src_doc, from_page=first, to_page=last)
 
-        except Exception as e:
-            import traceback
-            traceback.print_exc()
-            return False, f"Erro Fatal: {str(e)}"
+    def _process_shards(self, source: Union[str, bytes], out_doc, shards: List[List[int]], price_markup: float,
+                        logo_path: Optional[str], analysis: Optional[CatalogAnalysis] = None,
+                        progress_callback=None, profiled: Optional[StrategyStats] = None):
+        """
+        Processa faixas de páginas em processos separados (o fitz segura o GIL,
+        então threads não paralelizam). Cada processo abre o PDF de origem
+        (`source`: caminho ou bytes), processa sua faixa e devolve um PDF
+        parcial; as partes são anexadas a out_doc na ordem original.
+        `profiled`: estatísticas do perfil adaptativo já feito (ver _strategy_enabled).
+        """
+        options = self._worker_options()
+        parts: List[Optional[bytes]] = [None] * len(shards)
+        with ProcessPoolExecutor(max_workers=len(shards)) as pool:
+            futures = {
+                pool.submit(_write_shard, source, shard, price_markup, logo_path,
+                            _analysis_subset(analysis, shard), options, profiled): i
+                for i, shard in enumerate(shards)
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                i = futures[future]
+                parts[i], entries, pages = future.result()
+                self.strategy_stats.merge(entries, pages)
+                if progress_callback: progress_callback(done / len(shards))
+        
+        for data in parts:
+            part = fitz.open("pdf", data)
+            out_doc.insert_pdf(part)
+            part.close()
+
+    def process_variants(self,
+                         input_path: str,
+                         variants: List[CatalogVariant],
+                         pages_to_exclude: Optional[List[int]] = None,
+                         add_cover: bool = False,
+                         add_intro: bool = False,
+                         max_workers: Optional[int] = None,
+                         progress_callback=None) -> List[Tuple[bool, str]]:
+        """
+        Gera várias saídas do mesmo catálogo (um markup/logo/nome por variante).
+        
+        A análise (texto, preços, cores) roda uma vez só; cada variante só
+        aplica o markup e grava. Com mais de uma variante as gravações rodam
+        em processos separados (max_workers, padrão = nº de CPUs).
+        
+        Returns:
+            List[Tuple[bool, str]]: (Sucesso, Mensagem) de cada variante, na ordem recebida.
+        """
+        if not os.path.exists(input_path):
+            return [(False, f"Arquivo não encontrado: {input_path}")] * len(variants)
+        
+        pages_to_exclude = list(pages_to_exclude or [])
+        self.strategy_stats = StrategyStats(self.STRATEGY_NAMES)
+        src_doc = fitz.open(input_path)
+        analysis_progress = lambda p: progress_callback(p * 0.5) if progress_callback else None
+        if self.analysis_cache is not None:
+            analysis = self._cached_analysis(file_digest(input_path), src_doc, pages_to_exclude, analysis_progress)
+        else:
+            analysis = self.analyze_catalog(src_doc, pages_to_exclude, analysis_progress)
+        src_doc.close()
+        self.raster_cache.clear()
+        self._drawing_indexes.clear()
+        print(self.strategy_stats.report())
+        
+        options = (pages_to_exclude, add_cover, add_intro, self._worker_options())
+        jobs = [(input_path, analysis, variant, options) for variant in variants]
+        results: List[Tuple[bool, str]] = [(False, "")] * len(variants)
+        finished = []
+        workers = min(max_workers or os.cpu_count() or 1, len(variants))
+        
+        def done(i, result):
+            results[i] = result
+            finished.append(i)
+            if progress_callback:
+                progress_callback(0.5 + 0.5 * len(finished) / len(variants))
+        
+        if workers <= 1:
+            for i, job in enumerate(jobs):
+                done(i, _write_variant(*job))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {pool.submit(_write_variant, *job): i for i, job in enumerate(jobs)}
+                for future in as_completed(futures):
+                    i = futures[future]
+                    try:
+                        done(i, future.result())
+                    except Exception as e:
+                        done(i, (False, f"Erro Fatal: {str(e)}"))
+        return results
+
+    def analyze_prices(self,
+                       input_path: str,
+                       report_path: Optional[str] = None,
+                       report_format: str = "json",
+                       pages_to_exclude: Optional[List[int]] = None,
+                       progress_callback=None) -> dict:
+        """
+        Modo de análise (dry-run): detecta os preços sem alterar nem salvar o PDF.
+        
+        Só roda a detecção (sem amostrar cor de fundo, sem escrever nada).
+        Se `report_path` for dado, o relatório é gravado página a página em
+        JSON ou CSV (ver price_report.REPORT_FIELDS).
+        
+        Returns:
+            dict: {"file", "prices": [registro por preço], "summary"}
+        """
+        if not os.path.exists(input_path):
+            raise FileNotFoundError(f"Arquivo não encontrado: {input_path}")
+        # Antes de abrir (e truncar) report_path: formato inválido não apaga relatório existente
+        PriceReportWriter.check_format(report_format)
+        
+        pages_to_exclude = set(pages_to_exclude or [])
+        start = time.perf_counter()
+        self.strategy_stats = StrategyStats(self.STRATEGY_NAMES)
+        records = []
+        
+        report_file = open(report_path, "w", encoding="utf-8", newline="") if report_path else None
+        try:
+            writer = PriceReportWriter(report_file, report_format, input_path) if report_file else None
+            doc = fitz.open(input_path)
+            total_pages = len(doc)
+            for page_num, page in enumerate(doc):
+                if progress_callback: progress_callback((page_num + 1) / total_pages)
+                if page_num in pages_to_exclude:
+                    continue
+                page_records = [candidate_record(c) for c in self.detect_prices(page, with_colors=False)]
+                records.extend(page_records)
+                if writer:
+                    writer.write(page_records)
+                self._release_page(page)
+            doc.close()
+            
+            summary = {
+                "pages": total_pages,
+                "analyzed_pages": self.strategy_stats.pages,
+                "prices": len(records),
+                "seconds": round(time.perf_counter() - start, 3),
+                "strategies": {name: self.strategy_stats.hits(name) for name in self.STRATEGY_NAMES},
+            }
+            if writer:
+                writer.close(summary)
+        finally:
+            if report_file:
+                report_file.close()
+        
+        print(self.strategy_stats.report())
+        return {"file": input_path, "prices": records, "summary": summary}
 
     def _parse_price(self, price_str: str) -> float:
         """
@@ -296,18 +888,44 @@ class PdfProcessor:
 
     def _format_price(self, value: float) -> str:
         """Converte float 1234.56 para string 'R$ 1.234,56'"""
-        return f"R$ {value:,.2f}".replace(",", "_").replace(".", ",").replace("_", ".")
+        return f"R$ {self._format_number(value)}"
+
+    def _format_number(self, value: float) -> str:
+        """Converte float 1234.56 para string '1.234,56' (sem R$)"""
+        return f"{value:,.2f}".replace(",", "_").replace(".", ",").replace("_", ".")
 
     def _update_prices_on_page(self, page, markup: float) -> int:
         """
         Atualiza preços na página com detecção aprimorada.
         Suporta múltiplos formatos e preserva formatação visual.
+        
+        Em dois estágios: detect_prices (só lê a página) e
+        _apply_price_candidates (cobre e escreve os preços novos).
         """
-        count = 0
-        processed_rects = []  # Para evitar processar a mesma área duas vezes
+        candidates = self.detect_prices(page)
+        count = self._apply_price_candidates(page, candidates, markup)
+        print(f"[DEBUG] Total de preços atualizados: {count}")
+        return count
+    
+    def detect_prices(self, page, with_colors: bool = True) -> List[PriceCandidate]:
+        """
+        Detecta os preços da página sem modificá-la.
+        
+        Todas as estratégias leem a mesma extração de texto e emitem
+        candidatos (valor, bbox, estilo, estratégia). As sobreposições são
+        resolvidas uma vez no final, e só então a cor de fundo é amostrada
+        (apenas para os candidatos que sobraram). Com with_colors=False a
+        amostragem de fundo é pulada (modo de análise).
+        """
+        # Áreas já reivindicadas por candidatos (evita redetectar o mesmo preço)
+        claimed = RectGrid()
+        found: List[PriceCandidate] = []
+        
+        # Uma única extração de texto por página, compartilhada pelas estratégias
+        text_ctx = PageTextContext(page)
         
         # DEBUG: Log do texto extraído
-        full_text = page.get_text("text")
+        full_text = text_ctx.text
         print(f"[DEBUG] Página - texto total: {len(full_text)} chars")
         if "R$" in full_text or "r$" in full_text.lower():
             print(f"[DEBUG] Contém R$!")
@@ -319,140 +937,220 @@ class PdfProcessor:
             print(f"[DEBUG] NÃO contém R$ no texto!")
             print(f"[DEBUG] Preview: {full_text[:500]}")
         
-        # ============================================
-        # ESTRATÉGIA 1: Buscar em spans (texto junto)
-        # ============================================
-        blocks = page.get_text("dict")["blocks"]
-        print(f"[DEBUG] Total de blocos: {len(blocks)}")
+        for name, strategy, has_work in self._price_strategies():
+            # Pular estratégias desligadas ou que não têm o que achar na página
+            if not self._strategy_enabled(name) or not has_work(text_ctx, claimed):
+                self.strategy_stats.skip(name)
+                continue
+            start = time.perf_counter()
+            candidates = strategy(page, text_ctx, claimed)
+            self.strategy_stats.record(name, len(candidates), time.perf_counter() - start)
+            found.extend(candidates)
+        self.strategy_stats.pages += 1
         
-        for b in blocks:
-            if "lines" not in b: 
+        candidates = resolve_overlaps(found)
+        for cand in candidates:
+            cand.page = page.number
+            if with_colors:
+                cand.bg_color = self._sample_background_color(page, cand.rect)
+        
+        print(f"[DEBUG] Candidatos: {len(found)} detectados, {len(candidates)} após sobreposições")
+        print(f"[DEBUG] Extrações de texto na página: {text_ctx.extraction_calls}")
+        text_ctx.close()
+        return candidates
+    
+    def _apply_price_candidates(self, page, candidates: List[PriceCandidate], markup: float) -> int:
+        """Cobre cada preço antigo com a cor de fundo e escreve o valor com markup."""
+        # Com batch_writes todas as capas e textos vão para um único stream
+        writer = PageWriter() if self.batch_writes else None
+        for cand in candidates:
+            new_val = cand.value + markup
+            price_text = self._format_price(new_val) if cand.currency else self._format_number(new_val)
+            bg_color = cand.bg_color if cand.bg_color is not None else (1, 1, 1)
+            text = cand.replacement(price_text)
+            style = cand.style
+            
+            if writer is not None:
+                writer.cover(cand.rect, bg_color)
+                writer.text(style["origin"], text, fontsize=style["size"],
+                            fontname=style["fontname"], color=style["color"])
                 continue
-            for l in b["lines"]:
-                for s in l["spans"]:
-                    text = s["text"]
-                    text_lower = text.lower()
+            
+            # Cobrir área original
+            page.draw_rect(cand.rect, color=None, fill=bg_color)
+            
+            # Inserir novo texto mantendo estilo original
+            page.insert_text(
+                style["origin"],
+                text,
+                fontsize=style["size"],
+                fontname=style["fontname"],
+                color=style["color"]
+            )
+        if writer is not None:
+            writer.commit(page)
+        return len(candidates)
+    
+    def _make_candidate(self, page, rect, original: str, value: float, strategy: str,
+                        spans, claimed, **kwargs) -> PriceCandidate:
+        """Cria o candidato (estilo a partir dos spans) e reivindica a área."""
+        claimed.append(rect)
+        return PriceCandidate(
+            value=value,
+            bbox=tuple(rect),
+            original=original,
+            strategy=strategy,
+            style=self._resolve_style(page, rect, spans),
+            **kwargs
+        )
+    
+    def _price_strategies(self) -> list:
+        """(nome, estratégia, pré-condição) na ordem de execução."""
+        always = lambda text_ctx, claimed: True
+        return [
+            ("spans", self._detect_spans, always),
+            ("adjacent_words", self._detect_adjacent_words, self._has_unprocessed_currency),
+            ("lines", self._detect_lines, self._has_unprocessed_currency),
+            ("currency_expansion", self._detect_currency_expansion, self._has_unprocessed_currency),
+            ("context", self._detect_context, self._has_context_price),
+            ("letterspacing", self._detect_letterspacing, self._has_spaced_text),
+        ]
+    
+    def _strategy_enabled(self, name: str) -> bool:
+        """No modo adaptativo, após o perfil, só roda o que já achou algo."""
+        if not self.adaptive or name == "spans":
+            return True
+        # Depois do perfil a decisão não muda: uma estratégia desligada não acha mais nada
+        stats = self.profiled_stats or self.strategy_stats
+        if stats.pages < self.profile_pages:
+            return True
+        return stats.hits(name) > 0
+    
+    def _has_unprocessed_currency(self, text_ctx, claimed) -> bool:
+        """Existe algum "R$" na página que ainda não está coberto por um candidato?"""
+        chars = text_ctx.chars
+        for match in self.currency_regex.finditer(chars.text):
+            rect = chars.bbox_for(*match.span())
+            if rect is not None and not claimed.covers((rect.x0 + rect.x1) / 2, (rect.y0 + rect.y1) / 2):
+                return True
+        return False
+    
+    def _has_context_price(self, text_ctx, claimed) -> bool:
+        return self.price_context_regex.search(text_ctx.chars.text) is not None
+    
+    def _has_spaced_text(self, text_ctx, claimed) -> bool:
+        return self._normalize_spaced_text(text_ctx.text) != text_ctx.text
+    
+    def _detect_spans(self, page, text_ctx, claimed) -> List[PriceCandidate]:
+        """Estratégia 1: preço inteiro dentro de um span."""
+        candidates = []
+        chars = text_ctx.chars
+        print(f"[DEBUG] Total de blocos: {len(text_ctx.blocks)}")
+        
+        for span, start, end in chars.span_ranges():
+            text = chars.text[start:end]
+            
+            # Verificar se contém indicador de preço
+            if "r$" in text.lower() or self._looks_like_price(text):
+                print(f"[DEBUG] Span com preço: '{text}'")
+                matches = list(self.price_regex.finditer(text))
+                if not matches:
+                    print(f"[DEBUG] Regex NÃO casou com: '{text}'")
+                
+                for match in matches:
+                    print(f"[DEBUG] Regex match: '{match.group(0)}'")
                     
-                    # Verificar se contém indicador de preço
-                    if "r$" in text_lower or self._looks_like_price(text):
-                        print(f"[DEBUG] Span com preço: '{text}'")
-                        match = self.price_regex.search(text)
-                        if match:
-                            print(f"[DEBUG] Regex match: '{match.group(0)}'")
-                            result = self._process_price_match(page, s, match, markup, processed_rects)
-                            if result:
-                                count += 1
-                                print(f"[DEBUG] Preço processado com sucesso!")
-                        else:
-                            print(f"[DEBUG] Regex NÃO casou com: '{text}'")
-        
-        # ============================================
-        # ESTRATÉGIA 2: Buscar palavras adjacentes
-        # (quando R$ está separado do número)
-        # ============================================
-        words = page.get_text("words")  # (x0, y0, x1, y1, "word", block_no, line_no, word_no)
+                    # Cobrir só o preço, não o span inteiro (que pode ter o nome do produto)
+                    bbox = chars.bbox_for(start + match.start(), start + match.end())
+                    if bbox is None or self._rect_already_processed(bbox, claimed):
+                        continue
+                    
+                    old_price_str = match.group(0)
+                    current_val = self._parse_price(old_price_str)
+                    if current_val == 0.0:
+                        current_val = self._parse_price(match.group(1))
+                    if current_val <= 0:
+                        continue
+                    
+                    candidates.append(self._make_candidate(
+                        page, bbox, old_price_str, current_val, "spans", [span], claimed
+                    ))
+        return candidates
+    
+    def _detect_adjacent_words(self, page, text_ctx, claimed) -> List[PriceCandidate]:
+        """Estratégia 2: "R$" e número em palavras separadas."""
+        candidates = []
+        words = text_ctx.words  # (x0, y0, x1, y1, "word", block_no, line_no, word_no)
+        chars = text_ctx.chars
         
         for i, word in enumerate(words):
             word_text = word[4].strip().lower()
             
-            # Se é "R$" ou "r$" sozinho
-            if word_text in ["r$", "r$:", "r$."]:
-                # Procurar próxima palavra na mesma linha
-                if i + 1 < len(words):
-                    next_word = words[i + 1]
-                    
-                    # Verificar se está na mesma linha (y similar)
-                    if abs(word[1] - next_word[1]) < 10:  # Tolerância de 10pts
-                        number_match = self.price_number_regex.search(next_word[4])
-                        if number_match:
-                            # Criar um span artificial combinando ambos
-                            combined_rect = fitz.Rect(
-                                word[0],      # x0 do R$
-                                min(word[1], next_word[1]),  # y menor
-                                next_word[2], # x1 do número
-                                max(word[3], next_word[3])   # y maior
-                            )
-                            
-                            # Verificar se já foi processado
-                            if self._rect_already_processed(combined_rect, processed_rects):
-                                continue
-                            
-                            # Extrair informações de estilo da área
-                            original_text = f"R$ {next_word[4]}"
-                            current_val = self._parse_price(original_text)
-                            
-                            if current_val > 0:
-                                new_val = current_val + markup
-                                new_text = self._format_price(new_val)
-                                
-                                # Obter cor de fundo e texto
-                                bg_color = self._sample_background_color(page, combined_rect)
-                                text_color = self._detect_text_color(page, combined_rect)
-                                font_size = self._estimate_font_size(combined_rect)
-                                
-                                # Cobrir área original
-                                page.draw_rect(combined_rect, color=None, fill=bg_color)
-                                
-                                # Inserir novo texto
-                                page.insert_text(
-                                    (combined_rect.x0, combined_rect.y1 - 2),
-                                    new_text,
-                                    fontsize=font_size,
-                                    fontname="helv",
-                                    color=text_color
-                                )
-                                
-                                processed_rects.append(combined_rect)
-                                count += 1
-        
-        # ============================================
-        # ESTRATÉGIA 3: Buscar linhas completas
-        # (fallback para layouts complexos)
-        # ============================================
-        lines = page.get_text("text").split('\n')
-        for line in lines:
-            if 'r$' in line.lower():
-                all_matches = list(self.price_regex.finditer(line))
-                for match in all_matches:
-                    # Tentar localizar via search_for
-                    full_price = match.group(0)
-                    rects = page.search_for(full_price)
-                    
-                    for rect in rects:
-                        if self._rect_already_processed(rect, processed_rects):
-                            continue
-                        
-                        current_val = self._parse_price(full_price)
-                        if current_val > 0:
-                            new_val = current_val + markup
-                            new_text = self._format_price(new_val)
-                            
-                            bg_color = self._sample_background_color(page, rect)
-                            text_color = self._detect_text_color(page, rect)
-                            font_size = self._estimate_font_size(rect)
-                            
-                            page.draw_rect(rect, color=None, fill=bg_color)
-                            page.insert_text(
-                                (rect.x0, rect.y1 - 2),
-                                new_text,
-                                fontsize=font_size,
-                                fontname="helv",
-                                color=text_color
-                            )
-                            
-                            processed_rects.append(rect)
-                            count += 1
-        
-        # ============================================
-        # ESTRATÉGIA 4: Busca direta por "R$" e expansão
-        # (para PDFs onde o texto está fragmentado)
-        # ============================================
-        # Buscar todas as ocorrências de "R$" diretamente
-        rs_rects = page.search_for("R$")
-        print(f"[DEBUG] Encontrado {len(rs_rects)} ocorrências de 'R$' via search_for")
-        
-        for rs_rect in rs_rects:
-            if self._rect_already_processed(rs_rect, processed_rects, tolerance=20):
+            # Se é "R$" ou "r$" sozinho, olhar a próxima palavra
+            if word_text not in ["r$", "r$:", "r$."] or i + 1 >= len(words):
+                continue
+            next_word = words[i + 1]
+            
+            # Verificar se está na mesma linha (y similar) - tolerância de 10pts
+            if abs(word[1] - next_word[1]) >= 10:
+                continue
+            if not self.price_number_regex.search(next_word[4]):
+                continue
+            
+            # Criar um span artificial combinando ambos
+            combined_rect = fitz.Rect(
+                word[0],      # x0 do R$
+                min(word[1], next_word[1]),  # y menor
+                next_word[2], # x1 do número
+                max(word[3], next_word[3])   # y maior
+            )
+            if self._rect_already_processed(combined_rect, claimed):
+                continue
+            
+            original_text = f"R$ {next_word[4]}"
+            current_val = self._parse_price(original_text)
+            if current_val > 0:
+                # Estilo vem dos spans de origem das duas palavras
+                area = chars.region(combined_rect)
+                candidates.append(self._make_candidate(
+                    page, combined_rect, original_text, current_val, "adjacent_words",
+                    area.spans_for(0, len(area.text)), claimed
+                ))
+        return candidates
+    
+    def _detect_lines(self, page, text_ctx, claimed) -> List[PriceCandidate]:
+        """Estratégia 3: regex de preço sobre o texto de cada linha."""
+        candidates = []
+        # O índice de caracteres leva cada match direto ao seu retângulo,
+        # sem search_for (que devolveria todas as ocorrências iguais do preço)
+        chars = text_ctx.chars
+        
+        for match in chars.line_matches(self.price_regex):
+            full_price = match.group(0)
+            rect = chars.bbox_for(*match.span())
+            if rect is None or self._rect_already_processed(rect, claimed):
+                continue
+            
+            current_val = self._parse_price(full_price)
+            if current_val > 0:
+                candidates.append(self._make_candidate(
+                    page, rect, full_price, current_val, "lines",
+                    chars.spans_for(*match.span()), claimed
+                ))
+        return candidates
+    
+    def _detect_currency_expansion(self, page, text_ctx, claimed) -> List[PriceCandidate]:
+        """Estratégia 4: cada "R$" é expandido para a direita até achar o número."""
+        candidates = []
+        chars = text_ctx.chars
+        
+        # Buscar todas as ocorrências de "R$" diretamente no índice
+        rs_matches = list(self.currency_regex.finditer(chars.text))
+        print(f"[DEBUG] Encontrado {len(rs_matches)} ocorrências de 'R$' no índice")
+        
+        for rs_match in rs_matches:
+            rs_rect = chars.bbox_for(*rs_match.span())
+            if rs_rect is None or self._rect_already_processed(rs_rect, claimed, tolerance=20):
                 continue
             
             # Expandir a área para a direita para capturar o número
@@ -464,185 +1162,113 @@ class PdfProcessor:
                 rs_rect.y1 + 2
             )
             
-            # Extrair texto dessa área expandida
-            text_in_area = page.get_text("text", clip=expanded_rect).strip()
-            print(f"[DEBUG] Área expandida: '{text_in_area}'")
+            # Caracteres dessa área expandida (com geometria)
+            area = chars.region(expanded_rect)
+            print(f"[DEBUG] Área expandida: '{area.text.strip()}'")
             
-            if text_in_area:
-                # Tentar encontrar preço no texto
-                match = self.price_regex.search(text_in_area)
-                if match:
-                    full_price = match.group(0)
-                    current_val = self._parse_price(full_price)
-                    
-                    print(f"[DEBUG] Preço encontrado: '{full_price}' = {current_val}")
-                    
-                    if current_val > 0:
-                        new_val = current_val + markup
-                        new_text = self._format_price(new_val)
-                        
-                        # Procurar o rect exato do preço completo
-                        price_rects = page.search_for(full_price)
-                        
-                        for price_rect in price_rects:
-                            if self._rect_already_processed(price_rect, processed_rects):
-                                continue
-                            
-                            bg_color = self._sample_background_color(page, price_rect)
-                            text_color = self._detect_text_color(page, price_rect)
-                            font_size = self._estimate_font_size(price_rect)
-                            
-                            page.draw_rect(price_rect, color=None, fill=bg_color)
-                            page.insert_text(
-                                (price_rect.x0, price_rect.y1 - 2),
-                                new_text,
-                                fontsize=font_size,
-                                fontname="helv",
-                                color=text_color
-                            )
-                            
-                            processed_rects.append(price_rect)
-                            count += 1
-                            print(f"[DEBUG] Preço atualizado via Estratégia 4!")
-        
-        # ============================================
-        # ESTRATÉGIA 5: Buscar preços SEM R$ mas com contexto
-        # (para PDFs onde o R$ está na imagem, não no texto)
-        # ============================================
-        full_text = page.get_text("text")
+            match = next(area.line_matches(self.price_regex), None)
+            if not match:
+                continue
+            full_price = match.group(0)
+            current_val = self._parse_price(full_price)
+            print(f"[DEBUG] Preço encontrado: '{full_price}' = {current_val}")
+            
+            # Rect exato do preço dentro da área
+            price_rect = area.bbox_for(*match.span())
+            if current_val <= 0 or price_rect is None:
+                continue
+            if self._rect_already_processed(price_rect, claimed):
+                continue
+            
+            candidates.append(self._make_candidate(
+                page, price_rect, full_price, current_val, "currency_expansion",
+                area.spans_for(*match.span()), claimed
+            ))
+        return candidates
+    
+    def _detect_context(self, page, text_ctx, claimed) -> List[PriceCandidate]:
+        """Estratégia 5: preços sem "R$" identificados pelo contexto."""
+        candidates = []
+        chars = text_ctx.chars
         
         # Buscar padrões como "DE 15,00 NO ATACADO" ou "14,00 NO ATACADO"
-        context_matches = list(self.price_context_regex.finditer(full_text))
+        context_matches = list(self.price_context_regex.finditer(chars.text))
         print(f"[DEBUG] Estratégia 5: {len(context_matches)} preços em contexto encontrados")
         
         for match in context_matches:
             price_str = match.group(1)  # Apenas o número
-            full_match = match.group(0)  # Match completo com contexto
+            current_val = self._parse_price(price_str)
+            print(f"[DEBUG] Contexto: '{match.group(0)}' -> Preço: {price_str} = {current_val}")
+            if current_val <= 0:
+                continue
+            
+            # Onde ESTE número aparece (só a ocorrência do match)
+            price_rect = chars.bbox_for(*match.span(1))
+            if price_rect is None or self._rect_already_processed(price_rect, claimed, tolerance=10):
+                continue
             
+            # Sem "R$" no texto novo, já que no original não tinha
+            candidates.append(self._make_candidate(
+                page, price_rect, price_str, current_val, "context",
+                chars.spans_for(*match.span(1)), claimed, currency=False
+            ))
+        return candidates
+    
+    def _detect_letterspacing(self, page, text_ctx, claimed) -> List[PriceCandidate]:
+        """Estratégia 6: texto com letterspacing ("R $  1 4 , 0 0")."""
+        candidates = []
+        full_text = text_ctx.text
+        normalized_text = self._normalize_spaced_text(full_text)
+        print(f"[DEBUG] Estratégia 6: Texto normalizado detectado")
+        
+        # Buscar preços no texto normalizado
+        all_price_matches = list(self.price_regex.finditer(normalized_text))
+        print(f"[DEBUG] Estratégia 6: {len(all_price_matches)} preços no texto normalizado")
+        
+        for match in all_price_matches:
+            price_str = match.group(0)
             current_val = self._parse_price(price_str)
-            print(f"[DEBUG] Contexto: '{full_match}' -> Preço: {price_str} = {current_val}")
+            if current_val <= 0:
+                continue
             
-            if current_val > 0:
-                new_val = current_val + markup
-                # Formatar SEM o R$ já que no original não tinha
-                new_price_only = f"{new_val:,.2f}".replace(",", "_").replace(".", ",").replace("_", ".")
-                
-                # Buscar onde o número original aparece
-                price_rects = page.search_for(price_str)
-                
-                for price_rect in price_rects:
-                    if self._rect_already_processed(price_rect, processed_rects, tolerance=10):
+            # Para texto com letterspacing não dá para casar caractere a
+            # caractere: procurar a linha que contém o preço sem espaços
+            price_no_space = price_str.replace(" ", "")
+            for b in text_ctx.blocks:
+                if "lines" not in b:
+                    continue
+                for l in b["lines"]:
+                    line_spans = l["spans"]
+                    line_text = "".join(s["text"] for s in line_spans)
+                    if not line_spans or price_no_space not in line_text.replace(" ", ""):
                         continue
                     
-                    bg_color = self._sample_background_color(page, price_rect)
-                    text_color = self._detect_text_color(page, price_rect)
-                    font_size = self._estimate_font_size(price_rect)
-                    
-                    page.draw_rect(price_rect, color=None, fill=bg_color)
-                    page.insert_text(
-                        (price_rect.x0, price_rect.y1 - 2),
-                        new_price_only,  # Só o número, sem R$
-                        fontsize=font_size,
-                        fontname="helv",
-                        color=text_color
-                    )
+                    # Calcular bbox da linha inteira
+                    line_bbox = fitz.Rect(line_spans[0]["bbox"])
+                    for s in line_spans[1:]:
+                        line_bbox |= s["bbox"]
+                    if self._rect_already_processed(line_bbox, claimed, tolerance=15):
+                        continue
                     
-                    processed_rects.append(price_rect)
-                    count += 1
-                    print(f"[DEBUG] Preço SEM R$ atualizado via Estratégia 5: {price_str} -> {new_price_only}")
-        
-        # ============================================
-        # ESTRATÉGIA 6: Texto com letterspacing (espaços entre caracteres)
-        # Exemplo: "R $  1 4 . 0 0" ao invés de "R$ 14.00"
-        # ============================================
-        # Verificar se o texto tem padrão de espaçamento (letras isoladas com espaços)
-        normalized_text = self._normalize_spaced_text(full_text)
-        
-        if normalized_text != full_text:
-            print(f"[DEBUG] Estratégia 6: Texto normalizado detectado")
-            
-            # Buscar preços no texto normalizado
-            all_price_matches = list(self.price_regex.finditer(normalized_text))
-            print(f"[DEBUG] Estratégia 6: {len(all_price_matches)} preços no texto normalizado")
-            
-            for match in all_price_matches:
-                price_str = match.group(0)
-                current_val = self._parse_price(price_str)
-                
-                if current_val > 0:
-                    new_val = current_val + markup
-                    new_text = self._format_price(new_val)
+                    # Substituir apenas o preço no texto ORIGINAL (preservando espaços)
+                    # Ex: "R $  1 4 . 0 0" ou "R$ 14.00" -> marcador no lugar do preço
+                    price_pattern = r'R\s*\$\s*' + r'\s*'.join(re.escape(c) for c in price_str.replace("R$", "").replace(" ", ""))
+                    marked = re.sub(price_pattern, PRICE_MARK, line_text, count=1, flags=re.IGNORECASE)
                     
-                    print(f"[DEBUG] Estratégia 6: Preço '{price_str}' = {current_val} -> {new_val}")
+                    # Se não conseguiu com regex, tentar na linha sem espaços extras
+                    if PRICE_MARK not in marked:
+                        marked = ' '.join(line_text.split()).replace(price_str, PRICE_MARK, 1)
+                    if PRICE_MARK not in marked:
+                        continue
+                    prefix, suffix = marked.split(PRICE_MARK, 1)
                     
-                    # Para texto com letterspacing, não podemos usar search_for
-                    # Precisamos encontrar os spans que contêm números
-                    blocks = page.get_text("dict")["blocks"]
-                    for b in blocks:
-                        if "lines" not in b:
-                            continue
-                        for l in b["lines"]:
-                            # Combinar todos os spans da linha
-                            line_text = ""
-                            line_spans = []
-                            for s in l["spans"]:
-                                line_text += s["text"]
-                                line_spans.append(s)
-                            
-                            # Normalizar e verificar se contém o preço
-                            norm_line = line_text.replace(" ", "")
-                            price_no_space = price_str.replace(" ", "")
-                            
-                            if price_no_space in norm_line:
-                                # Calcular bbox da linha inteira
-                                if line_spans:
-                                    x0 = min(s["bbox"][0] for s in line_spans)
-                                    y0 = min(s["bbox"][1] for s in line_spans)
-                                    x1 = max(s["bbox"][2] for s in line_spans)
-                                    y1 = max(s["bbox"][3] for s in line_spans)
-                                    line_bbox = fitz.Rect(x0, y0, x1, y1)
-                                    
-                                    if self._rect_already_processed(line_bbox, processed_rects, tolerance=15):
-                                        continue
-                                    
-                                    bg_color = self._sample_background_color(page, line_bbox)
-                                    text_color = self._detect_text_color(page, line_bbox)
-                                    font_size = self._estimate_font_size(line_bbox)
-                                    
-                                    # Cobrir a linha original
-                                    page.draw_rect(line_bbox, color=None, fill=bg_color)
-                                    
-                                    # CORREÇÃO: Substituir apenas o preço no texto ORIGINAL (preservando espaços)
-                                    # Encontrar e substituir padrão como "R $  1 4 . 0 0" por "R$ 34,00"
-                                    import re
-                                    # Criar padrão para encontrar o preço com espaços
-                                    # Exemplo: "R $  1 4 . 0 0" ou "R$ 14.00"
-                                    price_pattern = r'R\s*\$\s*' + r'\s*'.join(list(price_str.replace("R$", "").replace(" ", "")))
-                                    new_line = re.sub(price_pattern, new_text, line_text, flags=re.IGNORECASE)
-                                    
-                                    # Se não conseguiu substituir com regex, tentar abordagem mais simples
-                                    if new_line == line_text:
-                                        # Remover espaços extras mas preservar palavras
-                                        new_line = ' '.join(line_text.split())
-                                        # Substituir preço normalizado
-                                        new_line = new_line.replace(price_str, new_text)
-                                    
-                                    # Inserir novo texto com fonte BOLD
-                                    page.insert_text(
-                                        (line_bbox.x0, line_bbox.y1 - 2),
-                                        new_line,
-                                        fontsize=font_size,
-                                        fontname="hebo",  # Helvetica Bold
-                                        color=text_color
-                                    )
-                                    
-                                    processed_rects.append(line_bbox)
-                                    count += 1
-                                    print(f"[DEBUG] Preço com letterspacing atualizado: {price_str} -> {new_text}")
-                                    break
-        
-        print(f"[DEBUG] Total de preços atualizados: {count}")
-        return count
+                    candidates.append(self._make_candidate(
+                        page, line_bbox, price_str, current_val, "letterspacing",
+                        line_spans, claimed, prefix=prefix, suffix=suffix
+                    ))
+                    print(f"[DEBUG] Preço com letterspacing: {price_str} = {current_val}")
+                    break
+        return candidates
     
     def _normalize_spaced_text(self, text: str) -> str:
         """
@@ -682,91 +1308,47 @@ class PdfProcessor:
         # Padrões comuns de preço
         return bool(self.price_number_regex.search(text))
     
-    def _process_price_match(self, page, span, match, markup, processed_rects) -> bool:
-        """Processa um match de preço encontrado em um span"""
-        bbox = fitz.Rect(span["bbox"])
-        
-        # Verificar se já foi processado
-        if self._rect_already_processed(bbox, processed_rects):
-            return False
-        
-        old_price_str = match.group(0)
-        val_str = match.group(1)
-        
-        current_val = self._parse_price(old_price_str)
-        if current_val == 0.0:
-            current_val = self._parse_price(val_str)
-        
-        if current_val <= 0:
-            return False
-        
-        new_val = current_val + markup
-        new_text = self._format_price(new_val)
-        
-        # Obter cores
-        bg_color = self._sample_background_color(page, bbox)
-        
-        # Usar cor original do span se disponível
-        text_color = self._extract_span_color(span)
-        
-        # Cobrir área original
-        page.draw_rect(bbox, color=None, fill=bg_color)
-        
-        # Inserir novo texto mantendo estilo original
-        page.insert_text(
-            (bbox.x0, bbox.y1 - 2),
-            new_text,
-            fontsize=span["size"],
-            fontname="helv",
-            color=text_color
-        )
-        
-        processed_rects.append(bbox)
-        return True
-    
     def _rect_already_processed(self, new_rect, processed_rects, tolerance=5) -> bool:
         """Verifica se um retângulo já foi processado (com tolerância)"""
-        for rect in processed_rects:
-            if (abs(rect.x0 - new_rect.x0) < tolerance and
-                abs(rect.y0 - new_rect.y0) < tolerance and
-                abs(rect.x1 - new_rect.x1) < tolerance and
-                abs(rect.y1 - new_rect.y1) < tolerance):
-                return True
-        return False
+        return processed_rects.contains_near(new_rect, tolerance)
     
     def _sample_background_color(self, page, rect) -> Tuple[float, float, float]:
-        """Amostra a cor de fundo de uma área"""
+        """Amostra a cor de fundo de uma área (desenho vetorial sob ela ou pixels)"""
         try:
+            # Preço sobre forma vetorial (selo, faixa): a cor vem do desenho
+            resolved, fill = self._drawing_index(page).fill_under(rect)
+            if resolved:
+                return fill
+            
+            # Sobre imagem/degradê: amostrar os pixels
             # Expandir ligeiramente para pegar o fundo
             sample_rect = fitz.Rect(rect.x0 - 5, rect.y0 - 5, rect.x1 + 5, rect.y1 + 5)
-            pix = page.get_pixmap(clip=sample_rect, alpha=False)
-            
-            # Pegar pixel do canto (geralmente é fundo)
-            r, g, b = pix.pixel(0, 0)
-            return (r/255.0, g/255.0, b/255.0)
+            raster = self.raster_cache.get(page)
+            return color_analysis.background_color(raster.crop(sample_rect))
         except:
             return (1, 1, 1)  # Branco padrão
     
+    def _drawing_index(self, page) -> DrawingIndex:
+        """Índice de desenhos da página (construído uma vez por página)."""
+        key = (id(page.parent), page.number)
+        index = self._drawing_indexes.get(key)
+        if index is None:
+            index = DrawingIndex(page)
+            self._drawing_indexes[key] = index
+        return index
+    
+    def _release_page(self, page):
+        """Descarta os caches da página (raster e desenhos) depois de gravada."""
+        self.raster_cache.drop(page)
+        self._drawing_indexes.pop((id(page.parent), page.number), None)
+    
     def _detect_text_color(self, page, rect) -> Tuple[float, float, float]:
         """Tenta detectar a cor do texto na área"""
         try:
-            pix = page.get_pixmap(clip=rect, alpha=False)
-            
-            # Coletar cores que parecem ser texto (diferente do fundo)
-            bg_r, bg_g, bg_b = pix.pixel(0, 0)
-            
-            # Procurar por pixels que diferem significativamente do fundo
-            for y in range(pix.height):
-                for x in range(pix.width):
-                    r, g, b = pix.pixel(x, y)
-                    # Se a diferença for significativa, provavelmente é texto
-                    diff = abs(r - bg_r) + abs(g - bg_g) + abs(b - bg_b)
-                    if diff > 100:
-                        return (r/255.0, g/255.0, b/255.0)
-            
-            # Se não encontrou, usar cor contrastante
-            bg_lum = 0.299 * bg_r + 0.587 * bg_g + 0.114 * bg_b
-            return (0, 0, 0) if bg_lum > 128 else (1, 1, 1)
+            raster = self.raster_cache.get(page)
+            # Cluster contrastante dominante (ou preto/branco pelo fundo)
+            _, text_color = color_analysis.analyze_array(raster.crop(rect))
+            return text_color
         except:
             return (0, 0, 0)  # Preto padrão
     
@@ -787,64 +1369,180 @@ class PdfProcessor:
             pass
         return (0, 0, 0)  # Preto padrão
     
+    def _resolve_style(self, page, rect, spans) -> dict:
+        """
+        Estilo do texto novo a partir dos spans de origem do preço:
+        cor, tamanho, negrito (flags) e baseline (origin) vêm da camada de texto.
+        Só sem spans é que cai para a detecção por pixels / altura do retângulo.
+        """
+        spans = [s for s in spans if s]
+        if not spans:
+            return {
+                "color": self._detect_text_color(page, rect),
+                "size": self._estimate_font_size(rect),
+                "fontname": "helv",
+                "origin": (rect.x0, rect.y1 - 2),
+            }
+        
+        # Span principal: o primeiro com dígitos (o número do preço)
+        def span_text(s):
+            return s.get("text") or "".join(c["c"] for c in s.get("chars", []))
+        main = next((s for s in spans if any(ch.isdigit() for ch in span_text(s))), spans[0])
+        
+        bold = bool(main.get("flags", 0) & fitz.TEXT_FONT_BOLD) or "bold" in main.get("font", "").lower()
+        return {
+            "color": self._extract_span_color(main),
+            "size": main["size"],
+            "fontname": "hebo" if bold else "helv",  # Helvetica Bold / Helvetica
+            "origin": (rect.x0, main["origin"][1]),
+        }
+    
     def _estimate_font_size(self, rect) -> float:
         """Estima o tamanho da fonte baseado na altura do retângulo"""
         height = rect.height
         # Fonte geralmente é ~70-80% da altura do retângulo
         return max(8, min(72, height * 0.75))
 
-    def _insert_logo_on_page(self, page, logo_path: str) -> int:
-        count = 0
-        img_list = page.get_images()
-        
-        # Para evitar colocar logo na própria logo (se rodar 2x) ou em ícones pequenos
-        # Podemos filtrar por tamanho mínimo.
-        
-        for img in img_list:
-            xref = img[0]
-            # Obter retângulo(s) onde essa imagem aparece
-            rects = page.get_image_rects(xref)
-            
-            for rect in rects:
-                # --- Correção de Sangria (Bleed) ---
-                # As imagens podem ser maiores que a página. Precisamos da interseção.
-                page_rect = page.cropbox # Área visível da página
-                visible_rect = rect & page_rect # Interseção
-                
-                # Se a interseção for vazia ou inválida, pular
-                if visible_rect.is_empty or visible_rect.width < 100 or visible_rect.height < 100:
-                    continue
+    def _logo_slots(self, page) -> List[fitz.Rect]:
+        """Retângulos onde a logo entra: canto inferior esquerdo de cada foto grande da página."""
+        return [fitz.Rect(slot) for slot in self.logo_placements.slots(page)]
 
-                aspect_ratio = visible_rect.width / visible_rect.height
-                if aspect_ratio > 3 or aspect_ratio < 0.3: 
-                    continue
-                
-                # Definir tamanho da logo baseado na área VISÍVEL
-                logo_scale = 0.15
-                logo_w = visible_rect.width * logo_scale
-                logo_h = logo_w 
-                
-                # Margem de segurança AUMENTADA
-                padding = 20 # Era 10, aumentei para garantir
-                
-                # Calcular posição: Canto inferior esquerdo da área VISÍVEL
-                dest_rect = fitz.Rect(
-                    visible_rect.x0 + padding,
-                    visible_rect.y1 - logo_h - padding,
-                    visible_rect.x0 + logo_w + padding,
-                    visible_rect.y1 - padding
-                )
-                
-                # Inserir Logo
-                # overlay=True põe por cima. keep_proportion garante que não distorça.
-                try:
-                   page.insert_image(dest_rect, filename=logo_path, keep_proportion=True, overlay=True)
-                   count += 1
-                except:
-                   pass # Ignora erros de inserção pontuais
+    def plan_logo_destinations(self, input_path: str, pages_to_exclude: Optional[List[int]] = None,
+                               max_workers: int = 1) -> Dict[int, List[tuple]]:
+        """
+        Pré-passo da logo: posições em todas as páginas mantidas, como etapa
+        separada. Com max_workers > 1 as faixas de páginas rodam em paralelo.
+        """
+        pages_to_exclude = pages_to_exclude or []
+        doc = fitz.open(input_path)
+        page_nums = [n for n in range(len(doc)) if n not in pages_to_exclude]
+        shards = _split_shards(page_nums, max_workers)
+        if len(shards) <= 1:
+            destinations = logo_destinations(doc, page_nums, self.logo_placements)
+            doc.close()
+            return destinations
+        doc.close()
+        destinations = {}
+        with ProcessPoolExecutor(max_workers=len(shards)) as pool:
+            for part in pool.map(logo_destinations_job, [(input_path, shard) for shard in shards]):
+                destinations.update(part)
+        return destinations
+
+    def _logo_asset(self, logo_path: str) -> Optional[LogoAsset]:
+        """
+        LogoAsset do arquivo, carregada uma vez (recarrega se o arquivo mudar).
+        None se a logo não abre (arquivo corrompido ou formato desconhecido).
+        """
+        try:
+            key = logo_key(logo_path)
+            asset = self._logo_assets.get(key)
+            if asset is None:
+                asset = self._logo_assets[key] = LogoAsset(logo_path)
+            return asset
+        except Exception as e:
+            print(f"[DEBUG] Logo ignorada ({logo_path}): {e}")
+            return None
+
+    def _forget_logo_xrefs(self):
+        """Esquece os xrefs por documento (os documentos desta execução serão fechados)."""
+        for asset in self._logo_assets.values():
+            asset.forget()
+        self.logo_placements.clear()
+
+    def _insert_logo_on_page(self, page, logo_path: str, slots: Optional[List[tuple]] = None) -> int:
+        """Insere a logo em cada posição (de `slots` ou calculada agora por _logo_slots)."""
+        count = 0
+        if slots is None:
+            slots = self._logo_slots(page)
+        if not slots:
+            return 0
+        asset = self._logo_asset(logo_path)
+        if asset is None:
+            return 0
+        for dest_rect in slots:
+            # Inserir Logo (mesmo xref em todas as posições do documento)
+            # overlay=True põe por cima. keep_proportion garante que não distorça.
+            try:
+               asset.insert(page, fitz.Rect(dest_rect), overlay=True)
+               count += 1
+            except:
+               pass # Ignora erros de inserção pontuais
                 
         return count
 
+
+def _split_shards(page_nums: List[int], max_workers: Optional[int]) -> List[List[int]]:
+    """Divide as páginas em até `max_workers` faixas contíguas de tamanho parecido."""
+    workers = max(1, min(max_workers or 1, len(page_nums)))
+    size, extra = divmod(len(page_nums), workers)
+    shards, start = [], 0
+    for i in range(workers):
+        end = start + size + (1 if i < extra else 0)
+        if end > start:
+            shards.append(page_nums[start:end])
+        start = end
+    return shards
+
+
+def _page_runs(page_nums: List[int]) -> List[Tuple[int, int]]:
+    """Faixas contíguas (primeira, última) de uma lista ordenada de páginas."""
+    runs = []
+    for n in page_nums:
+        if runs and runs[-1][1] == n - 1:
+            runs[-1] = (runs[-1][0], n)
+        else:
+            runs.append((n, n))
+    return runs
+
+
+def _analysis_subset(analysis: Optional[CatalogAnalysis], page_nums: List[int]) -> Optional[CatalogAnalysis]:
+    """Só a parte da análise de uma faixa (menos dados para enviar ao processo)."""
+    if analysis is None:
+        return None
+    subset = CatalogAnalysis(page_count=analysis.page_count)
+    for n in page_nums:
+        if analysis.covers_page(n):
+            subset.prices[n] = analysis.prices[n]
+            subset.logo_slots[n] = analysis.logo_slots.get(n, [])
+    return subset
+
+
+def _write_shard(source: Union[str, bytes], page_nums: List[int], price_markup: float, logo_path: Optional[str],
+                 analysis: Optional[CatalogAnalysis], options: dict,
+                 profiled: Optional[StrategyStats] = None) -> Tuple[bytes, dict, int]:
+    """Processa uma faixa de páginas e devolve (PDF parcial, estatísticas, nº de páginas detectadas)."""
+    processor = PdfProcessor(**options)
+    processor.profiled_stats = profiled
+    src_doc = fitz.open(source) if isinstance(source, str) else fitz.open(stream=source, filetype="pdf")
+    part = fitz.open()
+    processor._process_pages(src_doc, part, page_nums, price_markup, logo_path, analysis)
+    # Sem compressão: o documento final é que é compactado ao salvar
+    data = part.tobytes(garbage=0, deflate=False)
+    part.close()
+    src_doc.close()
+    return data, processor.strategy_stats.entries, processor.strategy_stats.pages
+
+
+def _write_variant(input_path: str, analysis: CatalogAnalysis, variant: CatalogVariant,
+                   options: tuple) -> Tuple[bool, str]:
+    """Grava uma variante a partir da análise compartilhada (roda em processo separado)."""
+    pages_to_exclude, add_cover, add_intro, processor_options = options
+    try:
+        processor = PdfProcessor(**processor_options)
+        src_doc = fitz.open(input_path)
+        logo_path = variant.logo_path if variant.logo_path and os.path.exists(variant.logo_path) else None
+        result = processor._write_catalog(
+            src_doc, variant.output_path, variant.markup, logo_path, pages_to_exclude,
+            add_cover, add_intro, variant.catalog_name, analysis=analysis
+        )
+        src_doc.close()
+        return result
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return False, f"Erro Fatal: {str(e)}"
+
+
 if __name__ == "__main__":
     # Teste rápido manual
     print("Módulo de Processamento PDF carregado.")
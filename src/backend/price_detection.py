@@ -0,0 +1,99 @@
+import fitz  # PyMuPDF
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Tuple
+
+Color = Tuple[float, float, float]
+
+
+@dataclass
+class PriceCandidate:
+    """
+    Preço detectado em uma página, independente do markup e da escrita.
+
+    A detecção só produz candidatos; quem cobre o preço antigo e escreve o
+    novo é o estágio de aplicação. Por isso a lista pode ser medida,
+    guardada em cache ou gerada em paralelo sem tocar no PDF.
+    """
+    value: float                      # Valor original do preço
+    bbox: Tuple[float, float, float, float]  # Área a cobrir
+    original: str                     # Texto original do preço
+    strategy: str                     # Estratégia que encontrou
+    style: dict                       # color, size, fontname, origin
+    currency: bool = True             # O texto novo leva "R$ "?
+    prefix: str = ""                  # Texto antes do preço (linha inteira, Estratégia 6)
+    suffix: str = ""                  # Texto depois do preço
+    bg_color: Optional[Color] = None  # Cor de fundo sob o preço
+    page: Optional[int] = None        # Número da página de origem
+
+    @property
+    def rect(self) -> fitz.Rect:
+        return fitz.Rect(self.bbox)
+
+    def replacement(self, price_text: str) -> str:
+        """Texto final a escrever, dado o preço novo já formatado."""
+        return f"{self.prefix}{price_text}{self.suffix}"
+
+    def to_dict(self) -> dict:
+        """Forma serializável em JSON (cache da análise)."""
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PriceCandidate":
+        """Inverso de to_dict: o JSON devolve listas, a escrita espera tuplas."""
+        data = dict(data)
+        data["bbox"] = tuple(data["bbox"])
+        if data.get("bg_color") is not None:
+            data["bg_color"] = tuple(data["bg_color"])
+        data["style"] = {k: tuple(v) if isinstance(v, list) else v for k, v in data["style"].items()}
+        return cls(**data)
+
+
+def _cells(box: tuple, cell_size: float):
+    cx0, cy0 = int(box[0] // cell_size), int(box[1] // cell_size)
+    cx1, cy1 = int(box[2] // cell_size), int(box[3] // cell_size)
+    for cx in range(cx0, cx1 + 1):
+        for cy in range(cy0, cy1 + 1):
+            yield (cx, cy)
+
+
+def _area(box: tuple) -> float:
+    return max(0.0, box[2] - box[0]) * max(0.0, box[3] - box[1])
+
+
+def _intersection_area(a: tuple, b: tuple) -> float:
+    w = min(a[2], b[2]) - max(a[0], b[0])
+    h = min(a[3], b[3]) - max(a[1], b[1])
+    return w * h if w > 0 and h > 0 else 0.0
+
+
+def resolve_overlaps(candidates: List[PriceCandidate], min_overlap: float = 0.3,
+                     cell_size: float = 50.0) -> List[PriceCandidate]:
+    """
+    Resolve sobreposições de uma vez: percorre os candidatos na ordem das
+    estratégias e descarta o que cobre (em pelo menos `min_overlap` da menor
+    área) um candidato já aceito. Evita capas sobrepostas e preço escrito
+    duas vezes no mesmo lugar.
+    """
+    accepted: List[PriceCandidate] = []
+    grid: Dict[Tuple[int, int], List[tuple]] = {}
+    for cand in candidates:
+        # Tuplas em vez de fitz.Rect: a comparação roda para cada vizinho
+        r = tuple(cand.bbox)
+        area = _area(r)
+        if area <= 0:
+            continue
+        overlaps = False
+        for cell in _cells(r, cell_size):
+            for other in grid.get(cell, ()):
+                inter = _intersection_area(r, other)
+                if inter > 0 and inter >= min_overlap * min(area, _area(other)):
+                    overlaps = True
+                    break
+            if overlaps:
+                break
+        if overlaps:
+            continue
+        accepted.append(cand)
+        for cell in _cells(r, cell_size):
+            grid.setdefault(cell, []).append(r)
+    return accepted
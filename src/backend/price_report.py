@@ -0,0 +1,62 @@
+import csv
+import json
+from typing import Iterable, Optional
+
+from backend.price_detection import PriceCandidate
+
+# Colunas do relatório (mesma ordem no CSV e nas chaves do JSON)
+REPORT_FIELDS = ["page", "x0", "y0", "x1", "y1", "original", "value", "strategy", "currency"]
+
+
+def candidate_record(cand: PriceCandidate) -> dict:
+    """Linha do relatório para um candidato (página começa em 1, como no visualizador)."""
+    x0, y0, x1, y1 = (round(v, 2) for v in cand.bbox)
+    return {
+        "page": (cand.page or 0) + 1,
+        "x0": x0, "y0": y0, "x1": x1, "y1": y1,
+        "original": cand.original,
+        "value": cand.value,
+        "strategy": cand.strategy,
+        "currency": cand.currency,
+    }
+
+
+class PriceReportWriter:
+    """
+    Grava o relatório de preços à medida que as páginas são analisadas.
+
+    "json" gera {"file", "prices": [...], "summary"}; "csv" gera uma linha
+    por preço com REPORT_FIELDS. Nada fica acumulado em memória.
+    """
+
+    FORMATS = ("json", "csv")
+
+    @classmethod
+    def check_format(cls, fmt: str) -> str:
+        if fmt not in cls.FORMATS:
+            raise ValueError(f"Formato de relatório inválido: {fmt}")
+        return fmt
+
+    def __init__(self, fp, fmt: str = "json", source: Optional[str] = None):
+        self.check_format(fmt)
+        self.fp = fp
+        self.fmt = fmt
+        self.count = 0
+        if fmt == "csv":
+            self._csv = csv.DictWriter(fp, fieldnames=REPORT_FIELDS)
+            self._csv.writeheader()
+        else:
+            fp.write('{"file": %s, "prices": [' % json.dumps(source))
+
+    def write(self, records: Iterable[dict]):
+        for record in records:
+            if self.fmt == "csv":
+                self._csv.writerow(record)
+            else:
+                self.fp.write(("," if self.count else "") + "\n  " + json.dumps(record, ensure_ascii=False))
+            self.count += 1
+
+    def close(self, summary: Optional[dict] = None):
+        if self.fmt == "json":
+            self.fp.write('\n], "summary": %s}\n' % json.dumps(summary or {}, ensure_ascii=False))
+        self.fp.flush()
@@ -0,0 +1,188 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from dataclasses import dataclass
+
+import fitz  # PyMuPDF
+
+# Perfis de gravação (argumentos de Document.save)
+SAVE_PROFILES = {
+    # Tempo mínimo: não coleta objetos órfãos nem comprime nada
+    "fast": dict(garbage=0, deflate=False),
+    # Padrão do V2: remove órfãos/duplicados e comprime os streams novos
+    "balanced": dict(garbage=4, deflate=True),
+    # Menor arquivo: coleta máxima, comprime imagens e fontes, object streams
+    "compact": dict(garbage=4, deflate=True, deflate_images=True, deflate_fonts=True,
+                    clean=True, use_objstms=True),
+    # Anexa só os objetos alterados ao arquivo original (ver save_document)
+    "incremental": dict(incremental=True, encryption=0),  # 0 = PDF_ENCRYPT_KEEP
+    # Para download no celular: linearizado ("fast web view"), página 1 primeiro
+    "web": dict(garbage=3, deflate=True, linear=True),
+}
+
+
+@dataclass
+class SaveReport:
+    """Tempo e tamanho de uma gravação, para comparar perfis."""
+    profile: str
+    seconds: float
+    size: int
+    linearized: bool = False
+
+    def __str__(self) -> str:
+        text = f"perfil {self.profile}: {self.seconds:.2f}s, {self.size / (1024 * 1024):.1f} MB"
+        if self.profile == "web" and not self.linearized:
+            text += ", sem linearização"
+        return text
+
+
+def check_profile(profile: str) -> str:
+    if profile not in SAVE_PROFILES:
+        raise ValueError(f"Perfil de gravação inválido: {profile} (use {', '.join(SAVE_PROFILES)})")
+    return profile
+
+
+def save_document(doc, output_path, profile: str) -> SaveReport:
+    """
+    Salva `doc` em output_path com o perfil escolhido e mede tempo e tamanho.
+
+    output_path pode ser um caminho ou um arquivo aberto em modo binário
+    (BytesIO, SpooledTemporaryFile...): aí o PDF é escrito direto nele
+    (só o perfil "web" passa por um temporário, ver _write_stream).
+
+    "incremental" só vale para um documento aberto do próprio output_path
+    (quem edita no lugar, como o process_catalog, copia o original antes);
+    em qualquer outro caso cai para "fast", que é o mais próximo em tempo.
+    """
+    check_profile(profile)
+    if profile == "incremental" and not (_same_file(doc.name, output_path) and doc.can_save_incrementally()):
+        print("[DEBUG] Gravação incremental exige o arquivo original; usando perfil fast")
+        profile = "fast"
+    start = time.perf_counter()
+    linearized = False
+    if not isinstance(output_path, str):
+        size, linearized = _write_stream(doc, output_path, profile)
+        report = SaveReport(profile, time.perf_counter() - start, size, linearized)
+        print(f"[DEBUG] Salvo em memória ({report})")
+        return report
+    if profile == "incremental":
+        doc.save(doc.name, **SAVE_PROFILES[profile])
+    elif profile == "web":
+        linearized = _save_linearized(doc, output_path)
+    else:
+        doc.save(output_path, **SAVE_PROFILES[profile])
+    report = SaveReport(profile, time.perf_counter() - start, os.path.getsize(output_path), linearized)
+    print(f"[DEBUG] Salvo ({report})")
+    return report
+
+
+def _write_stream(doc, fp, profile: str):
+    """
+    Escreve o PDF em um arquivo aberto; devolve (bytes escritos, linearizado).
+
+    O MuPDF escreve direto em fp (sem montar o PDF inteiro em bytes antes),
+    então um SpooledTemporaryFile passa para o disco ao atingir o limite.
+    O perfil "web" é a exceção: a linearização (qpdf) só trabalha sobre
+    arquivos, então ele é gravado num temporário por _save_linearized e
+    copiado em blocos para fp.
+    """
+    start = fp.tell()
+    if profile == "web":
+        fd, tmp = tempfile.mkstemp(suffix=".pdf")
+        os.close(fd)
+        try:
+            linearized = _save_linearized(doc, tmp)
+            with open(tmp, "rb") as f:
+                shutil.copyfileobj(f, fp)
+        finally:
+            os.remove(tmp)
+        return fp.tell() - start, linearized
+    doc.save(_StreamWriter(fp), **SAVE_PROFILES[profile])
+    return fp.tell() - start, False
+
+
+class _StreamWriter:
+    """
+    Repassa as escritas do MuPDF para `fp`. O save do fitz trata objetos com
+    `.name` (ex.: SpooledTemporaryFile) como caminho; este não tem `.name`.
+    """
+
+    def __init__(self, fp):
+        self._fp = fp
+
+    def write(self, data):
+        return self._fp.write(data)
+
+    def seek(self, *args):
+        return self._fp.seek(*args)
+
+    def tell(self):
+        return self._fp.tell()
+
+    def truncate(self, *args):
+        return self._fp.truncate(*args)
+
+    def flush(self):
+        self._fp.flush()
+
+
+def _save_linearized(doc, output_path: str) -> bool:
+    """
+    Salva linearizado. O MuPDF recente não lineariza mais (erro ao pedir
+    linear=True); nesse caso usa o `qpdf --linearize` se estiver instalado
+    e, sem ele, salva normal (o download com Range continua funcionando,
+    só sem a página 1 no começo do arquivo).
+    """
+    options = dict(SAVE_PROFILES["web"])
+    try:
+        doc.save(output_path, **options)
+        return True
+    except Exception as e:
+        print(f"[DEBUG] Linearização pelo MuPDF indisponível: {e}")
+    options.pop("linear")
+    doc.save(output_path, **options)
+
+    qpdf = shutil.which("qpdf")
+    if not qpdf:
+        print("[DEBUG] qpdf não encontrado: PDF salvo sem linearização")
+        return False
+    tmp = output_path + ".lin"
+    try:
+        result = subprocess.run([qpdf, "--linearize", output_path, tmp], capture_output=True)
+    except OSError as e:
+        result = None
+        print(f"[DEBUG] qpdf --linearize falhou: {e}")
+    # qpdf: 0 = ok, 3 = ok com avisos
+    if result is not None and result.returncode in (0, 3) and os.path.exists(tmp):
+        os.replace(tmp, output_path)
+        return True
+    print("[DEBUG] qpdf --linearize falhou; PDF salvo sem linearização")
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    return False
+
+
+def open_for_profile(input_path: str, output_path: str, profile: str):
+    """
+    Abre o documento a editar. No perfil incremental o original é copiado
+    para output_path e editado lá, para que a gravação só anexe as mudanças.
+    """
+    doc = fitz.open(input_path)
+    if profile != "incremental" or _same_file(input_path, output_path):
+        return doc
+    # PDF reparado ao abrir não aceita gravação incremental: save_document cai para "fast"
+    if not doc.can_save_incrementally():
+        return doc
+    doc.close()
+    shutil.copyfile(input_path, output_path)
+    return fitz.open(output_path)
+
+
+def _same_file(a, b) -> bool:
+    if not isinstance(a, str) or not isinstance(b, str):
+        return False
+    if not a or not b or not os.path.exists(a) or not os.path.exists(b):
+        return False
+    return os.path.samefile(a, b)
@@ -0,0 +1,65 @@
+from typing import Dict, Iterator, List, Tuple
+
+
+class RectGrid:
+    """
+    Índice espacial (grade uniforme) para os retângulos já processados.
+
+    Substitui a lista `processed_rects`: em vez de comparar o candidato com
+    todos os retângulos da página, só os retângulos cujo canto superior
+    esquerdo cai nas células vizinhas são verificados. A consulta
+    "já coberto dentro da tolerância" fica ~O(1) mesmo com milhares de preços.
+
+    Mantém a interface de lista usada pelo processador (append, len, iter).
+    """
+
+    def __init__(self, cell_size: float = 20.0):
+        # A célula deve ser >= maior tolerância usada (20pt na Estratégia 4),
+        # assim cada consulta olha no máximo 3x3 células.
+        self.cell_size = cell_size
+        self._cells: Dict[Tuple[int, int], List[tuple]] = {}
+        # Cobertura: célula -> retângulos que a tocam (consulta por ponto)
+        self._coverage: Dict[Tuple[int, int], List[tuple]] = {}
+        self._count = 0
+
+    def _cell(self, x: float, y: float) -> Tuple[int, int]:
+        return (int(x // self.cell_size), int(y // self.cell_size))
+
+    def append(self, rect):
+        r = (rect[0], rect[1], rect[2], rect[3])
+        self._cells.setdefault(self._cell(r[0], r[1]), []).append(r)
+        cx0, cy0 = self._cell(r[0], r[1])
+        cx1, cy1 = self._cell(r[2], r[3])
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                self._coverage.setdefault((cx, cy), []).append(r)
+        self._count += 1
+
+    def contains_near(self, rect, tolerance: float = 5) -> bool:
+        """True se existe retângulo com as 4 coordenadas a menos de `tolerance`."""
+        x0, y0, x1, y1 = rect[0], rect[1], rect[2], rect[3]
+        cx0, cy0 = self._cell(x0 - tolerance, y0 - tolerance)
+        cx1, cy1 = self._cell(x0 + tolerance, y0 + tolerance)
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                for r in self._cells.get((cx, cy), ()):
+                    if (abs(r[0] - x0) < tolerance and
+                        abs(r[1] - y0) < tolerance and
+                        abs(r[2] - x1) < tolerance and
+                        abs(r[3] - y1) < tolerance):
+                        return True
+        return False
+
+    def covers(self, x: float, y: float) -> bool:
+        """True se algum retângulo registrado contém o ponto (x, y)."""
+        for r in self._coverage.get(self._cell(x, y), ()):
+            if r[0] <= x <= r[2] and r[1] <= y <= r[3]:
+                return True
+        return False
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[tuple]:
+        for rects in self._cells.values():
+            yield from rects
@@ -0,0 +1,43 @@
+from typing import Dict, List
+
+
+class StrategyStats:
+    """Acertos, execuções, pulos e tempo de cada estratégia de preço em uma execução."""
+
+    def __init__(self, names: List[str]):
+        self.names = list(names)
+        self.pages = 0
+        self.entries: Dict[str, dict] = {
+            name: {"hits": 0, "runs": 0, "skipped": 0, "seconds": 0.0} for name in self.names
+        }
+
+    def record(self, name: str, hits: int, seconds: float):
+        entry = self.entries[name]
+        entry["runs"] += 1
+        entry["hits"] += hits
+        entry["seconds"] += seconds
+
+    def skip(self, name: str):
+        self.entries[name]["skipped"] += 1
+
+    def merge(self, entries: Dict[str, dict], pages: int):
+        """Soma os números de outra execução (ex.: de um processo de faixa de páginas)."""
+        self.pages += pages
+        for name, other in entries.items():
+            entry = self.entries.setdefault(name, {"hits": 0, "runs": 0, "skipped": 0, "seconds": 0.0})
+            for key, value in other.items():
+                entry[key] += value
+
+    def hits(self, name: str) -> int:
+        return self.entries[name]["hits"]
+
+    def report(self) -> str:
+        """Tabela legível com os números de cada estratégia."""
+        lines = [f"Estratégias de preço ({self.pages} páginas):"]
+        for i, name in enumerate(self.names, start=1):
+            e = self.entries[name]
+            lines.append(
+                f"  {i}. {name:<20} acertos={e['hits']:<5} execuções={e['runs']:<5} "
+                f"puladas={e['skipped']:<5} tempo={e['seconds'] * 1000:.1f}ms"
+            )
+        return "\n".join(lines)
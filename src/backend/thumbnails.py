@@ -0,0 +1,159 @@
+import hashlib
+import json
+import math
+import os
+import tempfile
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+# Escala das miniaturas da grade (0.15 = ~90px de largura numa página A4)
+THUMB_ZOOM = 0.15
+# Páginas por tarefa do pool: faixas pequenas = primeira miniatura mais cedo
+RANGE_SIZE = 8
+# Limites do cache de miniaturas (~5 KB cada: milhares de páginas de vários catálogos)
+THUMB_CACHE_BYTES = 200 * 1024 * 1024
+THUMB_CACHE_ENTRIES = 20000
+# Folhas de sprites: formato do Pillow e extensão do arquivo
+SPRITE_FORMATS = {"webp": ("WEBP", ".webp"), "jpeg": ("JPEG", ".jpg")}
+
+
+@dataclass
+class ThumbnailReport:
+    """Tempo até a primeira miniatura (o que o usuário sente) e tempo total."""
+    pages: int = 0
+    cached: int = 0
+    first_seconds: Optional[float] = None
+    seconds: float = 0.0
+
+    def __str__(self) -> str:
+        first = f"{self.first_seconds:.2f}s" if self.first_seconds is not None else "-"
+        return (f"{self.pages} miniaturas em {self.seconds:.2f}s (primeira em {first}, "
+                f"{self.cached} do cache)")
+
+
+def thumbnail_key(digest: str, page_num: int, zoom: float) -> str:
+    """Chave da miniatura: conteúdo do PDF + página + parâmetros de renderização."""
+    return f"thumb:{digest}:p{page_num}:z{zoom:g}:jpg"
+
+
+def spill_thumbnail(key: str, data: bytes) -> Optional[str]:
+    """
+    Grava uma miniatura que não coube no cache num diretório temporário
+    próprio (nome pela chave: regravar a mesma página não acumula arquivos).
+    None se nem isso foi possível.
+    """
+    directory = os.path.join(tempfile.gettempdir(), "editor_catalogo_thumbs_avulsas")
+    path = os.path.join(directory, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".jpg")
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+    except OSError as e:
+        print(f"[DEBUG] Falha ao gravar miniatura avulsa: {e}")
+        return None
+    return path
+
+
+def thumbnail_ranges(page_nums: List[int], workers: int, range_size: int = RANGE_SIZE) -> List[List[int]]:
+    """Faixas de páginas, em ordem, com ao menos uma faixa por processo."""
+    size = max(1, min(range_size, math.ceil(len(page_nums) / max(1, workers))))
+    return [page_nums[i:i + size] for i in range(0, len(page_nums), size)]
+
+
+def render_thumbnail_range(input_path: str, page_nums: List[int], zoom: float) -> List[Tuple[int, bytes]]:
+    """Miniaturas (JPEG) de uma faixa de páginas. Roda em processo separado."""
+    doc = fitz.open(input_path)
+    try:
+        matrix = fitz.Matrix(zoom, zoom)
+        return [(n, doc[n].get_pixmap(matrix=matrix, alpha=False).tobytes("jpg")) for n in page_nums]
+    finally:
+        doc.close()
+
+
+@dataclass
+class SpriteSheet:
+    """
+    Uma folha com as miniaturas de várias páginas e o índice de onde cada
+    uma está: página -> (x, y, largura, altura) em pixels da folha.
+    """
+    number: int
+    path: str
+    size: Tuple[int, int]
+    cells: Dict[int, Tuple[int, int, int, int]] = field(default_factory=dict)
+
+    @property
+    def pages(self) -> List[int]:
+        return sorted(self.cells)
+
+    @property
+    def index_path(self) -> str:
+        return sprite_index_path(self.path)
+
+
+def sprite_index_path(path: str) -> str:
+    """Índice (JSON) gravado ao lado da folha: `sprite_..._3.webp` -> `sprite_..._3.json`."""
+    return os.path.splitext(path)[0] + ".json"
+
+
+def load_sprite_sheet(number: int, path: str) -> Optional[SpriteSheet]:
+    """
+    Folha já gravada em `path` (nome pelo conteúdo do PDF + parâmetros),
+    com o índice lido do JSON ao lado; None se falta algum dos dois.
+    """
+    try:
+        with open(sprite_index_path(path), encoding="utf-8") as f:
+            index = json.load(f)
+        if not os.path.isfile(path):
+            return None
+        cells = {int(page_num): tuple(cell) for page_num, cell in index["cells"].items()}
+        return SpriteSheet(number, path, tuple(index["size"]), cells)
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def check_sprite_format(fmt: str) -> str:
+    if fmt not in SPRITE_FORMATS:
+        raise ValueError(f"Formato de sprite inválido: {fmt} (use {', '.join(SPRITE_FORMATS)})")
+    return fmt
+
+
+def sprite_groups(page_count: int, per_sheet: int) -> List[List[int]]:
+    """Páginas de cada folha, em ordem (a última pode ter menos)."""
+    return [list(range(i, min(i + per_sheet, page_count))) for i in range(0, page_count, per_sheet)]
+
+
+def build_sprite_sheet(number: int, thumbs: List[Tuple[int, str]], path: str, columns: int = 10,
+                       fmt: str = "webp", quality: int = 70) -> SpriteSheet:
+    """
+    Junta as miniaturas `thumbs` [(página, arquivo)] numa grade de `columns`
+    colunas (células do tamanho da maior miniatura, cada uma centralizada)
+    e grava em `path` no formato `fmt` (webp/jpeg) com a qualidade pedida,
+    mais o índice em JSON ao lado.
+    """
+    check_sprite_format(fmt)
+    images = []
+    for page_num, thumb_path in thumbs:
+        img = Image.open(thumb_path)
+        img.load()
+        images.append((page_num, img.convert("RGB")))
+    cell_w = max(img.width for _, img in images)
+    cell_h = max(img.height for _, img in images)
+    columns = max(1, min(columns, len(images)))
+    rows = math.ceil(len(images) / columns)
+    sheet = Image.new("RGB", (cell_w * columns, cell_h * rows), "white")
+    result = SpriteSheet(number, path, sheet.size)
+    for slot, (page_num, img) in enumerate(images):
+        x = (slot % columns) * cell_w + (cell_w - img.width) // 2
+        y = (slot // columns) * cell_h + (cell_h - img.height) // 2
+        sheet.paste(img, (x, y))
+        result.cells[page_num] = (x, y, img.width, img.height)
+    sheet.save(path, SPRITE_FORMATS[fmt][0], quality=quality)
+    # Índice por último: se ele existe, a folha está completa (ver load_sprite_sheet)
+    tmp = result.index_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"size": result.size, "cells": result.cells}, f)
+    os.replace(tmp, result.index_path)
+    return result
@@ -15,7 +15,7 @@ def main(page: ft.Page):
     # Variáveis de Estado
     pdf_path = ft.Ref[str]()
     logo_path = ft.Ref[str]()
-    output_temp_path = ft.Ref[str]()
+    output_data = ft.Ref[bytes]()  # PDF gerado, em memória até Visualizar/Salvar
     
     # Configs V2
     markup_value = ft.Ref[ft.TextField]()
@@ -26,7 +26,9 @@ def main(page: ft.Page):
     # Lista de páginas para excluir (índices)
     pages_to_delete = set()
     
-    processor = PdfProcessor()
+    # Análise em cache: reprocessar o mesmo PDF com outro markup só regrava
+    import tempfile
+    processor = PdfProcessor(cache_dir=os.path.join(tempfile.gettempdir(), "editor_catalogo_cache"))
     
     # Elementos UI
     tabs = ft.Tabs(
@@ -62,33 +64,41 @@ def main(page: ft.Page):
         grid_pages.controls.append(ft.Text("Carregando miniaturas...", size=16))
         grid_pages.update()
         
+        def make_card(i, thumb):
+            # Container da Página
+            # Checkbox de "Deletar"
+            chk = ft.Checkbox(label=f"Pág {i+1}", on_change=lambda e, idx=i: toggle_page_delete(e, idx), fill_color="red")
+            
+            img = ft.Image(src=thumb, fit=ft.ImageFit.CONTAIN, border_radius=5)
+            
+            # Card visual
+            return ft.Container(
+                content=ft.Column([
+                    ft.Container(img, expand=True), # Imagem ocupa espaço
+                    ft.Container(chk, bgcolor="#ffeeee", padding=5, border_radius=5) # Footer com checkbox
+                ], spacing=2),
+                padding=5,
+                bgcolor="white",
+                border=ft.border.all(1, "#eeeeee"),
+                border_radius=8,
+                shadow=ft.BoxShadow(blur_radius=5, color="#10000000")
+            )
+
         # Gerar thumbs em thread para não travar
         def _load():
-            thumbs = processor.get_thumbnails(path)
-            grid_pages.controls.clear()
-            
-            for i, thumb in enumerate(thumbs):
-                # Container da Página
-                # Checkbox de "Deletar"
-                chk = ft.Checkbox(label=f"Pág {i+1}", on_change=lambda e, idx=i: toggle_page_delete(e, idx), fill_color="red")
-                
-                img = ft.Image(src=thumb, fit=ft.ImageFit.CONTAIN, border_radius=5)
-                
-                # Card visual
-                card = ft.Container(
-                    content=ft.Column([
-                        ft.Container(img, expand=True), # Imagem ocupa espaço
-                        ft.Container(chk, bgcolor="#ffeeee", padding=5, border_radius=5) # Footer com checkbox
-                    ], spacing=2),
-                    padding=5,
-                    bgcolor="white",
-                    border=ft.border.all(1, "#eeeeee"),
-                    border_radius=8,
-                    shadow=ft.BoxShadow(blur_radius=5, color="#10000000")
-                )
-                grid_pages.controls.append(card)
+            # Cards entram conforme as miniaturas ficam prontas (em ordem de página)
+            thumbs = {}
+            shown = 0
+            # App de um usuário só: pode usar todas as CPUs
+            for i, thumb in processor.iter_thumbnails(path, max_workers=os.cpu_count()):
+                thumbs[i] = thumb
+                if shown == 0 and 0 in thumbs:
+                    grid_pages.controls.clear()
+                while shown in thumbs:
+                    grid_pages.controls.append(make_card(shown, thumbs[shown]))
+                    shown += 1
+                grid_pages.update()
             
-            grid_pages.update()
             # Mudar para aba de páginas se estiver na 0
             tabs.selected_index = 0
             tabs.update()
@@ -126,27 +136,23 @@ def main(page: ft.Page):
         pb_prod.value = 0
         page.update()
         
-        # Paths
-        import tempfile
-        filename = f"v2_processed_{int(time.time())}.pdf"
-        out_path = os.path.join(tempfile.gettempdir(), filename)
-        
         def _run():
             def cb(p):
                 pb_prod.value = p
                 pb_prod.update()
                 
-            success, msg = processor.process_catalog_v2(
-                input_path=pdf_path.current,
-                output_path=out_path,
-                price_markup=markup,
-                logo_path=logo_path.current,
-                pages_to_exclude=list(pages_to_delete),
-                add_cover=chk_add_cover.current.value,
-                add_intro=chk_add_intro.current.value,
-                catalog_name=catalog_name_input.current.value,
-                progress_callback=cb
-            )
+            # Saída em memória: "Salvar Como" grava uma vez, sem arquivo temporário + cópia
+            with open(pdf_path.current, "rb") as f:
+                success, msg, data = processor.process_catalog_v2_bytes(
+                    f,
+                    price_markup=markup,
+                    logo_path=logo_path.current,
+                    pages_to_exclude=list(pages_to_delete),
+                    add_cover=chk_add_cover.current.value,
+                    add_intro=chk_add_intro.current.value,
+                    catalog_name=catalog_name_input.current.value,
+                    progress_callback=cb
+                )
             
             pb_prod.value = 1.0
             pb_prod.update()
@@ -157,7 +163,7 @@ def main(page: ft.Page):
             pb_prod.visible = False
             
             if success:
-                output_temp_path.current = out_path
+                output_data.current = data
                 col_result.visible = True
                 txt_result_msg.value = msg
             else:
@@ -223,18 +229,25 @@ def main(page: ft.Page):
         ft.Text("Sucesso!", color="green", size=20, weight="bold"),
         ft.Text("", ref=ft.Ref[ft.Text](), color="green"), # msg placeholder
         ft.Row([
-            ft.ElevatedButton("Visualizar", on_click=lambda _: os.startfile(output_temp_path.current)),
+            ft.ElevatedButton("Visualizar", on_click=lambda _: view_output()),
             ft.ElevatedButton("Salvar Como...", on_click=lambda _: picker_save.save_file(file_name="novo_catalogo.pdf"))
         ])
     ], visible=False)
     txt_result_msg = col_result.controls[1]
     
-    picker_save = ft.FilePicker(on_result=lambda e: [import_shutil(output_temp_path.current, e.path), page.snack_bar.open_true()] if e.path else None)
-    # Helper auxiliar pra lambda acima nao ficar complexa demais, mas deixarei simples
+    def view_output():
+        # Só para abrir no visualizador do sistema o PDF precisa de um arquivo
+        import tempfile
+        view_path = os.path.join(tempfile.gettempdir(), f"v2_processed_{int(time.time())}.pdf")
+        with open(view_path, "wb") as f:
+            f.write(output_data.current)
+        os.startfile(view_path)
+
+    picker_save = ft.FilePicker()
     def save_final(e):
         if e.path:
-            import shutil
-            shutil.copy2(output_temp_path.current, e.path)
+            with open(e.path, "wb") as f:
+                f.write(output_data.current)
             page.snack_bar = ft.SnackBar(ft.Text("Salvo!"))
             page.snack_bar.open = True
             page.update()
@@ -1,9 +1,14 @@
 import flet as ft
+import fitz  # PyMuPDF
+import atexit
+import math
 import os
 import time
 import threading
 import shutil
+import tempfile
 from backend.pdf_processor import PdfProcessor
+from backend.download_server import DownloadApp, PrefixRouter, spooled_output
 
 # Diretórios - Usa variável de ambiente ou fallback
 UPLOAD_DIR = os.environ.get("FLET_UPLOAD_DIR", "/app/uploads")
@@ -15,6 +20,40 @@ if not os.path.exists("/app"):
     UPLOAD_DIR = os.path.join(BASE, "uploads")
     ASSETS_DIR = os.path.join(BASE, "assets")
 
+# Rota dos downloads com Range/ETag (ver build_asgi_app)
+DOWNLOAD_PREFIX = "/download"
+
+# Tamanho-alvo do PDF otimizado para compartilhar no WhatsApp
+WHATSAPP_TARGET_MB = 15
+# Processos da recompressão de imagens por pedido (o padrão do backend, nº de CPUs,
+# abriria um pool desse tamanho a cada processamento no servidor)
+IMAGE_WORKERS = int(os.environ.get("FLET_IMAGE_WORKERS", 1))
+
+# Cache da análise dos PDFs (chaveado pelo conteúdo do arquivo)
+CACHE_DIR = os.environ.get("FLET_CACHE_DIR", os.path.join(tempfile.gettempdir(), "editor_catalogo_cache"))
+
+# Miniaturas da grade em folhas de sprites (poucos arquivos em vez de um por página)
+THUMB_SPRITES = os.environ.get("FLET_THUMB_SPRITES", "1") == "1"
+THUMB_FORMAT = os.environ.get("FLET_THUMB_FORMAT", "webp")  # webp ou jpeg
+THUMB_QUALITY = int(os.environ.get("FLET_THUMB_QUALITY", 70))
+SPRITE_SCALE = 1.3  # Miniatura de ~90px exibida com ~120px no card
+
+# Grade de páginas: cards criados em lotes (um lote = uma folha de sprites);
+# o próximo lote é pedido quando a rolagem chega a PREFETCH_PX do fim
+PAGE_BATCH = 40
+PREFETCH_PX = 600
+# Geometria da grade (para saber se ela já rola ou ainda precisa de mais cards)
+GRID_HEIGHT = 400
+GRID_EXTENT = 160
+GRID_ASPECT = 0.7
+GRID_SPACING = 10
+
+# PDFs gerados ficam em memória até este tamanho; acima disso, em arquivo temporário
+SPILL_MB = int(os.environ.get("FLET_SPILL_MB", 32))
+
+# Servidor de downloads (criado em build_asgi_app); sem ele os PDFs vão para ASSETS_DIR
+DOWNLOADS = None
+
 def main(page: ft.Page):
     print(f"[INIT] UPLOAD_DIR={UPLOAD_DIR}")
     print(f"[INIT] ASSETS_DIR={ASSETS_DIR}")
@@ -34,13 +73,17 @@ def main(page: ft.Page):
     catalog_name_input = ft.Ref[ft.TextField]()
     chk_add_cover = ft.Ref[ft.Checkbox]()
     chk_add_intro = ft.Ref[ft.Checkbox]()
+    chk_optimize = ft.Ref[ft.Checkbox]()
     
     pages_to_delete = set()
-    processor = PdfProcessor()
+    # Análise em cache: reprocessar o mesmo PDF com outro markup só regrava
+    # Perfil "web": PDF linearizado (quando suportado) para abrir no celular aos poucos
+    processor = PdfProcessor(cache_dir=CACHE_DIR, save_profile="web", image_workers=IMAGE_WORKERS)
     
     # UI
     tabs = ft.Tabs(selected_index=0, animation_duration=300, tabs=[], expand=True)
-    grid_pages = ft.GridView(expand=True, max_extent=160, child_aspect_ratio=0.7, spacing=10, run_spacing=10)
+    grid_pages = ft.GridView(expand=True, max_extent=GRID_EXTENT, child_aspect_ratio=GRID_ASPECT,
+                             spacing=GRID_SPACING, run_spacing=GRID_SPACING)
     pb_upload = ft.ProgressRing(width=20, height=20, visible=False)
     pb_prod = ft.ProgressBar(width=400, visible=False)
     txt_pdf = ft.Text("Nenhum arquivo")
@@ -56,6 +99,123 @@ def main(page: ft.Page):
         lbl_page_count.value = f"Remover: {len(pages_to_delete)}"
         lbl_page_count.update()
 
+    # Grade virtualizada: os cards são criados em lotes de PAGE_BATCH páginas,
+    # o primeiro lote + um de folga ao abrir e os próximos conforme a rolagem
+    # chega perto do fim. A seleção de páginas a remover fica em
+    # pages_to_delete, independente de quais cards já existem.
+    grid_state = {"path": None, "pages": 0, "loaded": 0, "busy": None, "pending": False,
+                  "generation": 0, "stamp": 0}
+    grid_lock = threading.Lock()
+
+    def card_for(i, view):
+        chk = ft.Checkbox(label=f"P{i+1}", value=i in pages_to_delete,
+                          on_change=lambda e, x=i: toggle_delete(e, x), fill_color="red")
+        return ft.Container(
+            content=ft.Column([ft.Container(view, expand=True, alignment=ft.alignment.center), chk], spacing=2),
+            padding=5, bgcolor="white", border=ft.border.all(1, "#ddd"), border_radius=8
+        )
+
+    def sprite_view(sheet, url, i):
+        # Recorte da folha: a folha inteira posicionada no Stack, cortada pelo Container
+        x, y, w, h = sheet.cells[i]
+        s = SPRITE_SCALE
+        img = ft.Image(src=url, width=sheet.size[0] * s, height=sheet.size[1] * s,
+                       left=-x * s, top=-y * s, fit=ft.ImageFit.FILL)
+        return ft.Container(ft.Stack([img], width=w * s, height=h * s), width=w * s, height=h * s,
+                            clip_behavior=ft.ClipBehavior.HARD_EDGE, border_radius=5)
+
+    def arrivals(path, first, last):
+        """(página, imagem) de cada miniatura pronta do lote: recorte de uma folha ou um arquivo por página."""
+        if THUMB_SPRITES:
+            # Uma folha por lote (per_sheet = PAGE_BATCH)
+            for sheet in processor.iter_sprite_sheets(path, ASSETS_DIR, per_sheet=PAGE_BATCH, fmt=THUMB_FORMAT,
+                                                      quality=THUMB_QUALITY, sheets=[first // PAGE_BATCH]):
+                url = f"/{os.path.basename(sheet.path)}"
+                for i in sheet.pages:
+                    yield i, sprite_view(sheet, url, i)
+        else:
+            for i, t in processor.iter_thumbnails(path, pages=list(range(first, last))):
+                fname = f"t_{grid_state['stamp']}_{i}.jpg"
+                shutil.copy2(t, os.path.join(ASSETS_DIR, fname))
+                yield i, ft.Image(src=f"/{fname}", fit=ft.ImageFit.CONTAIN, border_radius=5)
+
+    def grid_scrolls(count):
+        """
+        A grade com `count` cards já passa da altura visível? Sem isso nenhum
+        evento de rolagem chega e os próximos lotes nunca seriam pedidos.
+        Estimativa pela largura da página (inteira: erra para o lado de
+        carregar um lote a mais, nunca de parar).
+        """
+        width = page.width or 0
+        if width <= 0:
+            return False
+        columns = max(1, math.ceil(width / (GRID_EXTENT + GRID_SPACING)))
+        cell_w = (width - GRID_SPACING * (columns - 1)) / columns
+        rows = math.ceil(count / columns)
+        return rows * cell_w / GRID_ASPECT + GRID_SPACING * (rows - 1) > GRID_HEIGHT
+
+    def load_batch(generation):
+        """
+        Cria os cards do próximo lote. Roda em thread; pedido com um lote em
+        andamento fica pendente e vira mais um lote quando ele terminar. Depois
+        de cada lote, se a grade ainda não rola, o seguinte já é carregado.
+        """
+        with grid_lock:
+            # Um lote por vez por PDF (um lote de um PDF anterior não bloqueia o novo)
+            if generation != grid_state["generation"] or grid_state["loaded"] >= grid_state["pages"]:
+                return
+            if grid_state["busy"] == generation:
+                grid_state["pending"] = True
+                return
+            grid_state["busy"] = generation
+        try:
+            while True:
+                if not load_next_batch(generation):
+                    return
+                with grid_lock:
+                    again = grid_state["pending"] or not grid_scrolls(grid_state["loaded"])
+                    grid_state["pending"] = False
+                    if not again or grid_state["loaded"] >= grid_state["pages"]:
+                        return
+        finally:
+            with grid_lock:
+                if grid_state["busy"] == generation:
+                    grid_state["busy"] = None
+
+    def load_next_batch(generation):
+        """Cards das próximas PAGE_BATCH páginas; False se nada entrou (ou outro PDF foi aberto)."""
+        first = grid_state["loaded"]
+        last = min(first + PAGE_BATCH, grid_state["pages"])
+        # Miniaturas entram na grade conforme ficam prontas (em ordem de página)
+        ready = {}
+        shown = first
+        last_update = 0.0
+        for i, view in arrivals(grid_state["path"], first, last):
+            if generation != grid_state["generation"]:
+                return False  # Outro PDF foi aberto
+            ready[i] = view
+            if shown == 0 and 0 in ready:
+                grid_pages.controls.clear()
+            while shown in ready:
+                grid_pages.controls.append(card_for(shown, ready[shown]))
+                shown += 1
+            # Agrupa as atualizações: no máximo ~5 por segundo
+            if time.time() - last_update > 0.2:
+                grid_pages.update()
+                last_update = time.time()
+        grid_state["loaded"] = shown
+        grid_pages.update()
+        print(f"[LOAD] Páginas {first + 1}-{shown} de {grid_state['pages']} ({processor.last_thumbnails})")
+        return shown > first
+
+    def on_grid_scroll(e: ft.OnScrollEvent):
+        # Perto do fim do que já foi carregado: busca o próximo lote
+        if e.pixels >= e.max_scroll_extent - PREFETCH_PX:
+            threading.Thread(target=load_batch, args=(grid_state["generation"],), daemon=True).start()
+
+    grid_pages.on_scroll = on_grid_scroll
+    grid_pages.on_scroll_interval = 100
+
     def load_pages(filepath):
         grid_pages.controls.clear()
         grid_pages.controls.append(ft.Text("Carregando..."))
@@ -78,29 +238,25 @@ def main(page: ft.Page):
                     else:
                         raise Exception(f"Pasta vazia: {UPLOAD_DIR}")
                 
-                thumbs = processor.get_thumbnails(actual_path)
-                if not thumbs:
+                doc = fitz.open(actual_path)
+                page_count = len(doc)
+                doc.close()
+                if not page_count:
                     raise Exception("Falha ao gerar miniaturas")
-
-                print(f"[LOAD] {len(thumbs)} páginas geradas")
                 
-                web_thumbs = []
-                for i, t in enumerate(thumbs):
-                    fname = f"t_{int(time.time())}_{i}.png"
-                    dst = os.path.join(ASSETS_DIR, fname)
-                    shutil.copy2(t, dst)
-                    web_thumbs.append(f"/{fname}")
+                # PDF novo: seleção e grade recomeçam
+                with grid_lock:
+                    grid_state.update(path=actual_path, pages=page_count, loaded=0, pending=False,
+                                      stamp=int(time.time()), generation=grid_state["generation"] + 1)
+                    generation = grid_state["generation"]
+                pages_to_delete.clear()
+                lbl_page_count.value = "Remover: 0"
+                lbl_page_count.update()
+                
+                # Lote visível + um lote de folga
+                load_batch(generation)
+                load_batch(generation)
 
-                grid_pages.controls.clear()
-                for i, url in enumerate(web_thumbs):
-                    chk = ft.Checkbox(label=f"P{i+1}", on_change=lambda e, x=i: toggle_delete(e, x), fill_color="red")
-                    img = ft.Image(src=url, fit=ft.ImageFit.CONTAIN, border_radius=5)
-                    card = ft.Container(
-                        content=ft.Column([ft.Container(img, expand=True), chk], spacing=2),
-                        padding=5, bgcolor="white", border=ft.border.all(1, "#ddd"), border_radius=8
-                    )
-                    grid_pages.controls.append(card)
-                grid_pages.update()
                 btn_next.disabled = False
                 btn_next.update()
                 print("[LOAD] OK")
@@ -206,12 +362,17 @@ def main(page: ft.Page):
         page.update()
         
         fname = f"catalogo_{int(time.time())}.pdf"
-        out = os.path.join(ASSETS_DIR, fname)
+        # Com o servidor de downloads o PDF é servido da memória (sem gravar e reler do
+        # disco); sai para ASSETS_DIR quando é despejado ou o servidor encerra
+        out = spooled_output(SPILL_MB * 1024 * 1024) if DOWNLOADS is not None else os.path.join(ASSETS_DIR, fname)
+        
+        # Otimizar imagens para compartilhar (reduz DPI/qualidade até caber no alvo)
+        optimize = bool(chk_optimize.current.value)
+        processor.image_dpi = 150 if optimize else None
+        processor.target_size_mb = WHATSAPP_TARGET_MB if optimize else None
         
         def _run():
-            ok, msg = processor.process_catalog_v2(
-                input_path=pdf_path_ref["value"],
-                output_path=out,
+            options = dict(
                 price_markup=markup,
                 logo_path=logo_path_ref["value"],
                 pages_to_exclude=list(pages_to_delete),
@@ -220,13 +381,20 @@ def main(page: ft.Page):
                 catalog_name=catalog_name_input.current.value,
                 progress_callback=None
             )
+            # Entrada aberta pelo caminho (o upload não é lido inteiro para a memória)
+            ok, msg = processor.process_catalog_v2(input_path=pdf_path_ref["value"], output_path=out, **options)
+            if DOWNLOADS is not None:
+                if ok:
+                    DOWNLOADS.publish(fname, out)
+                else:
+                    out.close()
             
             pb_prod.visible = False
             btn_proc.disabled = False
             btn_proc.text = "PROCESSAR"
             
             if ok:
-                output_url_ref["value"] = f"/{fname}"
+                output_url_ref["value"] = f"{DOWNLOAD_PREFIX}/{fname}"
                 col_result.visible = True
                 page.open(ft.SnackBar(ft.Text("Pronto!"), bgcolor="green"))
             else:
@@ -250,7 +418,7 @@ def main(page: ft.Page):
         ]),
         ft.Row([ft.Container(expand=True), lbl_page_count, btn_next]),
         ft.Divider(),
-        ft.Container(grid_pages, height=400, bgcolor="#f5f5f5", padding=10, border_radius=10)
+        ft.Container(grid_pages, height=GRID_HEIGHT, bgcolor="#f5f5f5", padding=10, border_radius=10)
     ])
 
     # Tab 2
@@ -267,7 +435,7 @@ def main(page: ft.Page):
     # Tab 3 - Resultado com opções de compartilhamento
     def get_download_url():
         """Retorna URL do PDF"""
-        return output_url_ref["value"]  # Ex: /catalogo_123.pdf
+        return output_url_ref["value"]  # Ex: /download/catalogo_123.pdf
     
     def get_full_download_url():
         """URL completa para compartilhar"""
@@ -313,6 +481,7 @@ def main(page: ft.Page):
     tab3 = ft.Container(ft.Column([
         ft.Text("Finalizar", size=20, weight="bold"),
         ft.TextField(ref=markup_value, prefix_text="R$ ", value="20.00", label="Markup"),
+        ft.Checkbox(ref=chk_optimize, label=f"Otimizar para WhatsApp (até {WHATSAPP_TARGET_MB} MB)", value=False),
         ft.Container(height=20),
         pb_prod, btn_proc, col_result
     ], horizontal_alignment=ft.CrossAxisAlignment.CENTER), padding=20)
@@ -332,8 +501,37 @@ def main(page: ft.Page):
     page.add(ft.Column([tabs, footer], expand=True))
     page.update()
 
+def build_asgi_app():
+    """
+    App do Flet (FastAPI) + DOWNLOAD_PREFIX servindo com Range/ETag os PDFs
+    gerados (publicados em memória, com ASSETS_DIR como armazenamento de
+    fundo) e os arquivos de ASSETS_DIR.
+    None se o Flet instalado não tiver o modo FastAPI.
+    """
+    try:
+        import flet.fastapi as flet_fastapi
+    except ImportError:
+        try:
+            import flet_web.fastapi as flet_fastapi
+        except ImportError:
+            return None
+    global DOWNLOADS
+    flet_app = flet_fastapi.app(main, upload_dir=UPLOAD_DIR, assets_dir=ASSETS_DIR,
+                                secret_key=os.environ.get("FLET_SECRET_KEY"))
+    DOWNLOADS = DownloadApp(ASSETS_DIR)
+    # Resultados ainda em memória vão para ASSETS_DIR ao encerrar: os links continuam valendo
+    atexit.register(DOWNLOADS.spill_all)
+    return PrefixRouter(flet_app, DOWNLOAD_PREFIX, DOWNLOADS)
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 7860))
-    ft.app(target=main, view=ft.AppView.WEB_BROWSER, port=port, host="0.0.0.0",
-           upload_dir=UPLOAD_DIR, assets_dir=ASSETS_DIR)
+    asgi_app = build_asgi_app()
+    if asgi_app is not None:
+        import uvicorn
+        uvicorn.run(asgi_app, host="0.0.0.0", port=port)
+    else:
+        # Sem FastAPI: PDFs servidos como arquivos estáticos (sem Range/ETag)
+        DOWNLOAD_PREFIX = ""
+        ft.app(target=main, view=ft.AppView.WEB_BROWSER, port=port, host="0.0.0.0",
+               upload_dir=UPLOAD_DIR, assets_dir=ASSETS_DIR)
 
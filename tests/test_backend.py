@@ -6,6 +6,10 @@ from PIL import Image
 
 sys.path.append(os.path.join(os.getcwd(), 'src'))
 from backend.pdf_processor import PdfProcessor
+from backend.page_text import PageTextContext
+from backend.spatial_index import RectGrid
+from backend import color_analysis
+from backend.drawing_index import DrawingIndex
 
 def create_sample_resources():
     # 1. Criar imagem logo
@@ -75,5 +79,891 @@ def test_processor():
         
     doc.close()
 
+def test_page_text_context_single_extraction():
+    # Todas as visões (text/dict/words/recorte) saem da mesma TextPage
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((50, 50), "Produto Exemplo: R$ 10,00", fontsize=12)
+    page.insert_text((50, 80), "Outro Preço: R$ 1.234,56", fontsize=12)
+    
+    ctx = PageTextContext(page)
+    assert "R$ 10,00" in ctx.text
+    assert ctx.blocks and ctx.words and ctx.chars
+    # 1 TextPage + 4 visões derivadas, independente do número de consultas
+    assert ctx.extraction_calls == 5
+    
+    area = ctx.chars.region(fitz.Rect(40, 65, 300, 85))
+    assert area.text == "Outro Preço: R$ 1.234,56"
+    assert ctx.extraction_calls == 5
+    doc.close()
+
+def test_char_index_maps_each_match_to_its_rect():
+    # Preços idênticos: cada ocorrência vira exatamente um retângulo próprio
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((50, 50), "Blusa R$ 10,00", fontsize=12)
+    page.insert_text((50, 120), "Saia R$ 10,00", fontsize=12)
+    
+    processor = PdfProcessor()
+    chars = PageTextContext(page).chars
+    matches = list(processor.price_regex.finditer(chars.text))
+    rects = [chars.bbox_for(*m.span()) for m in matches]
+    
+    assert len(rects) == 2
+    expected = page.search_for("R$ 10,00")
+    for rect, exp in zip(rects, expected):
+        assert abs(rect.x0 - exp.x0) < 1 and abs(rect.y0 - exp.y0) < 1
+        assert abs(rect.x1 - exp.x1) < 1 and abs(rect.y1 - exp.y1) < 1
+    doc.close()
+
+def test_price_regex_does_not_cross_lines():
+    # "R$" no fim de uma linha e o número na linha de baixo não são um preço:
+    # o retângulo juntaria as duas linhas e apagaria o nome do produto
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((50, 120), "Preco R$", fontsize=12)
+    page.insert_text((50, 135), "19,90", fontsize=12)
+    page.insert_text((50, 200), "Blusa R$ 10", fontsize=12)
+    page.insert_text((50, 215), "250 unidades", fontsize=12)
+    
+    processor = PdfProcessor()
+    for candidate in processor.detect_prices(page, with_colors=False):
+        assert "\n" not in candidate.original
+        assert candidate.bbox[3] - candidate.bbox[1] < 20  # Uma linha só
+        assert candidate.value != 10250
+    assert "Preco" in page.get_text()
+    doc.close()
+
+def test_rect_grid_tolerance():
+    grid = RectGrid()
+    grid.append(fitz.Rect(100, 100, 150, 112))
+    
+    assert grid.contains_near(fitz.Rect(104, 96, 153, 115), tolerance=5)
+    assert not grid.contains_near(fitz.Rect(106, 100, 150, 112), tolerance=5)
+    # Tolerância maior que a célula da grade também funciona
+    assert grid.contains_near(fitz.Rect(125, 100, 175, 112), tolerance=30)
+    assert len(grid) == 1
+
+def test_color_analysis_batch():
+    # Preço vermelho sobre uma faixa azul (selo vetorial)
+    doc = fitz.open()
+    page = doc.new_page()
+    page.draw_rect(fitz.Rect(30, 10, 250, 90), color=None, fill=(0, 0, 1))
+    page.insert_text((50, 58), "R$ 10,00", fontsize=24, fontname="hebo", color=(1, 0, 0))
+    price_rect = page.search_for("R$ 10,00")[0]
+    
+    [(bg, text)] = color_analysis.analyze_page_rects(page, [price_rect], zoom=2)
+    assert bg[2] > 0.9 and bg[0] < 0.1
+    assert text[0] > 0.9 and text[2] < 0.1
+    
+    # Mesmo resultado pelos helpers do processador
+    processor = PdfProcessor()
+    assert processor._sample_background_color(page, price_rect)[2] > 0.9
+    assert processor._detect_text_color(page, price_rect)[0] > 0.9
+    doc.close()
+
+def test_raster_cache_renders_page_once():
+    create_sample_resources()
+    processor = PdfProcessor()
+    doc = fitz.open('tests/sample.pdf')
+    page = doc[0]
+    
+    processor._get_page_bg_color(page)
+    for rect in page.search_for("R$"):
+        processor._sample_background_color(page, rect)
+        processor._detect_text_color(page, rect)
+    assert processor.raster_cache.renders == 1
+    
+    # Depois de descartado, a página volta a ser renderizada sob demanda
+    processor.raster_cache.drop(page)
+    assert processor.raster_cache.peek(page) is None
+    doc.close()
+
+def test_style_comes_from_span_metadata():
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((60, 100), "Vestido R$ 89,90", fontsize=18, fontname="hebo", color=(1, 0, 0))
+    
+    processor = PdfProcessor()
+    chars = PageTextContext(page).chars
+    match = processor.price_regex.search(chars.text)
+    rect = chars.bbox_for(*match.span())
+    style = processor._resolve_style(page, rect, chars.spans_for(*match.span()))
+    
+    assert abs(style["size"] - 18) < 0.01
+    assert style["fontname"] == "hebo"
+    assert style["color"] == (1.0, 0.0, 0.0)
+    assert abs(style["origin"][1] - 100) < 0.01
+    # Nenhuma renderização foi necessária para descobrir o estilo
+    assert processor.raster_cache.renders == 0
+    doc.close()
+
+def test_drawing_index_background():
+    create_sample_resources()
+    doc = fitz.open()
+    page = doc.new_page()
+    page.draw_rect(fitz.Rect(10, 10, 200, 100), color=None, fill=(0, 0, 1))
+    page.draw_rect(fitz.Rect(20, 20, 90, 60), color=None, fill=(0, 1, 0))
+    page.insert_image(fitz.Rect(150, 300, 300, 450), filename='tests/logo_test.png')
+    
+    index = DrawingIndex(page)
+    # Forma mais ao topo sob o preço
+    assert index.fill_under(fitz.Rect(30, 30, 80, 45)) == (True, (0.0, 1.0, 0.0))
+    assert index.fill_under(fitz.Rect(120, 30, 180, 45)) == (True, (0.0, 0.0, 1.0))
+    # Página sem nada atrás: branco; sobre imagem: precisa de pixels
+    assert index.fill_under(fitz.Rect(300, 150, 350, 165)) == (True, (1.0, 1.0, 1.0))
+    assert index.fill_under(fitz.Rect(180, 350, 250, 365)) == (False, None)
+    
+    # Fundo vetorial resolvido sem renderizar a página
+    processor = PdfProcessor()
+    assert processor._sample_background_color(page, fitz.Rect(30, 30, 80, 45)) == (0.0, 1.0, 0.0)
+    assert processor.raster_cache.renders == 0
+    doc.close()
+
+def test_adaptive_strategies_skip_and_report():
+    doc = fitz.open()
+    for i in range(3):
+        doc.new_page().insert_text((50, 50), f"Blusa R$ {10 + i},00", fontsize=12)
+    
+    processor = PdfProcessor(adaptive=True, profile_pages=2)
+    total = sum(processor._update_prices_on_page(page, 5.0) for page in doc)
+    stats = processor.strategy_stats
+    
+    assert total == 3
+    assert stats.pages == 3
+    assert stats.entries["spans"]["hits"] == 3
+    # Todo "R$" já coberto pela Estratégia 1: as demais nem rodam
+    for name in PdfProcessor.STRATEGY_NAMES[1:]:
+        assert stats.entries[name]["runs"] == 0
+        assert stats.entries[name]["skipped"] == 3
+    # Após o perfil, estratégias sem acertos ficam desligadas
+    assert not processor._strategy_enabled("lines")
+    assert "spans" in stats.report()
+    doc.close()
+
+def test_detection_is_separate_from_apply():
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((50, 50), "Blusa R$ 10,00 e Saia R$ 10,00", fontsize=12)
+    page.insert_text((50, 100), "DE 15,00 NO ATACADO", fontsize=12)
+    page.insert_text((50, 150), "R $  1 4 , 0 0", fontsize=12)
+    
+    processor = PdfProcessor()
+    before = page.read_contents()
+    candidates = processor.detect_prices(page)
+    # Detectar não modifica a página
+    assert page.read_contents() == before
+    
+    found = sorted((c.strategy, c.value) for c in candidates)
+    assert found == [("context", 15.0), ("letterspacing", 14.0), ("spans", 10.0), ("spans", 10.0)]
+    # O preço em contexto volta sem "R$", como no original
+    assert [c.currency for c in candidates if c.strategy == "context"] == [False]
+    
+    assert processor._apply_price_candidates(page, candidates, 5.0) == 4
+    text = page.get_text()
+    assert text.count("R$ 15,00") == 2 and "20,00" in text and "R$ 19,00" in text
+    doc.close()
+
+def test_batched_write_back_single_stream():
+    results = {}
+    for batch in (False, True):
+        doc = fitz.open()
+        page = doc.new_page()
+        for i in range(20):
+            page.insert_text((50, 40 + i * 20), f"Item {i} R$ {i + 1},00", fontsize=10)
+        page.draw_rect(fitz.Rect(40, 200, 300, 260), color=None, fill=(0, 0, 1))
+        
+        processor = PdfProcessor(batch_writes=batch)
+        candidates = processor.detect_prices(page)
+        streams = len(page.get_contents())
+        assert processor._apply_price_candidates(page, candidates, 1.0) == 20
+        added = len(page.get_contents()) - streams
+        results[batch] = (added, sorted(page.get_text().split("\n")))
+        doc.close()
+    
+    # Lote: um único stream novo; por chamada: um por capa e um por texto
+    assert results[True][0] == 1
+    assert results[False][0] == 40
+    # O texto final é o mesmo nos dois modos
+    assert results[True][1] == results[False][1]
+    assert any("R$ 21,00" in t for t in results[True][1])
+
+def test_analyze_prices_report(tmp_path):
+    import csv
+    import json
+    pdf_path = str(tmp_path / "analise.pdf")
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((50, 50), "Blusa R$ 10,00", fontsize=12)
+    page = doc.new_page()
+    page.insert_text((50, 50), "DE 15,00 NO ATACADO", fontsize=12)
+    doc.save(pdf_path)
+    doc.close()
+    with open(pdf_path, "rb") as f:
+        original = f.read()
+    
+    processor = PdfProcessor()
+    json_path = str(tmp_path / "precos.json")
+    report = processor.analyze_prices(pdf_path, json_path)
+    # Nada é gravado no PDF
+    with open(pdf_path, "rb") as f:
+        assert f.read() == original
+    
+    rows = [(r["page"], r["value"], r["strategy"]) for r in report["prices"]]
+    assert rows == [(1, 10.0, "spans"), (2, 15.0, "context")]
+    with open(json_path, encoding="utf-8") as f:
+        saved = json.load(f)
+    assert saved["prices"] == report["prices"]
+    assert saved["summary"]["prices"] == 2
+    
+    csv_path = str(tmp_path / "precos.csv")
+    processor.analyze_prices(pdf_path, csv_path, report_format="csv", pages_to_exclude=[1])
+    with open(csv_path, encoding="utf-8") as f:
+        lines = list(csv.DictReader(f))
+    assert [(l["page"], l["original"]) for l in lines] == [("1", "R$ 10,00")]
+    
+    # Formato inválido falha antes de truncar o relatório existente
+    try:
+        processor.analyze_prices(pdf_path, json_path, report_format="xml")
+        assert False, "formato inválido deveria falhar"
+    except ValueError:
+        pass
+    with open(json_path, encoding="utf-8") as f:
+        assert json.load(f) == saved
+
+def test_process_variants_share_one_analysis(tmp_path):
+    from backend.catalog_analysis import CatalogVariant
+    pdf_path = str(tmp_path / "variantes.pdf")
+    doc = fitz.open()
+    for i in range(3):
+        page = doc.new_page()
+        page.insert_text((50, 50), f"Blusa R$ {i + 10},00", fontsize=12)
+    doc.save(pdf_path)
+    doc.close()
+    
+    variants = [
+        CatalogVariant(markup=5.0, output_path=str(tmp_path / "a.pdf"), catalog_name="Loja A"),
+        CatalogVariant(markup=20.0, output_path=str(tmp_path / "b.pdf")),
+    ]
+    processor = PdfProcessor()
+    results = processor.process_variants(pdf_path, variants, pages_to_exclude=[2], add_intro=True, max_workers=2)
+    assert [ok for ok, _ in results] == [True, True]
+    # Detecção uma vez só para todas as variantes
+    assert processor.strategy_stats.pages == 2
+    
+    expected = {"a.pdf": ["R$ 15,00", "R$ 16,00"], "b.pdf": ["R$ 30,00", "R$ 31,00"]}
+    for name, prices in expected.items():
+        out = fitz.open(str(tmp_path / name))
+        assert len(out) == 3  # intro + 2 páginas
+        for page, price in zip(list(out)[1:], prices):
+            assert price in page.get_text()
+        out.close()
+    
+    from backend.cli import parse_variant
+    variant = parse_variant("markup=7,5;output=c.pdf;name=Loja C, Verão")
+    assert (variant.markup, variant.output_path, variant.catalog_name) == (7.5, "c.pdf", "Loja C, Verão")
+
+def test_disk_cache_lru_eviction(tmp_path):
+    from backend.disk_cache import DiskCache
+    cache = DiskCache(str(tmp_path), max_bytes=250, max_entries=10)
+    cache.put("a", b"x" * 100)
+    cache.put("b", b"y" * 100)
+    # Ler "a" a torna a mais recente; "b" vira a candidata ao despejo
+    os.utime(cache._path("b"), (1, 1))
+    assert cache.get("a") == b"x" * 100
+    cache.put("c", b"z" * 100)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.size() <= 250
+    
+    cache.put_object("obj", {"v": 1})
+    assert cache.get_object("obj") == {"v": 1}
+    # Valores são JSON: um pickle plantado no diretório não é executado
+    import pickle
+    cache.put("evil", pickle.dumps(os.getcwd))
+    assert cache.get_object("evil") is None and cache.get("evil") is None
+
+def test_analysis_cache_skips_detection_on_rerun(tmp_path):
+    pdf_path = str(tmp_path / "cache.pdf")
+    doc = fitz.open()
+    for i in range(2):
+        page = doc.new_page()
+        page.insert_text((50, 50), f"Blusa R$ {i + 10},00", fontsize=12)
+    doc.save(pdf_path)
+    doc.close()
+    
+    cache_dir = str(tmp_path / "cache")
+    out_a, out_b = str(tmp_path / "a.pdf"), str(tmp_path / "b.pdf")
+    first = PdfProcessor(cache_dir=cache_dir)
+    assert first.process_catalog_v2(pdf_path, out_a, 5.0, None, [], False, False, "")[0]
+    assert first.strategy_stats.pages == 2
+    
+    # Outro processador (nova sessão), outro markup e outra seleção de páginas
+    second = PdfProcessor(cache_dir=cache_dir)
+    assert second.process_catalog_v2(pdf_path, out_b, 20.0, None, [0], False, False, "")[0]
+    assert second.strategy_stats.pages == 0
+    assert second.analysis_cache.hits == 1
+    out = fitz.open(out_b)
+    assert len(out) == 1 and "R$ 31,00" in out[0].get_text()
+    out.close()
+    
+    # Opções do modo adaptativo mudam a chave (outra análise)
+    adaptive = PdfProcessor(cache_dir=cache_dir, adaptive=True, profile_pages=1)
+    assert adaptive.process_catalog_v2(pdf_path, out_b, 20.0, None, [], False, False, "")[0]
+    assert adaptive.strategy_stats.pages == 2
+    assert adaptive._analysis_key("x") != PdfProcessor(adaptive=True, profile_pages=2)._analysis_key("x")
+    
+    # Adaptativo: análise em cache igual à sem cache para as mesmas páginas removidas.
+    # Páginas 0-1 (removidas) só têm preço em contexto; o perfil (2-3) só "R$", então
+    # o "DE 15,00 NO ATACADO" das páginas 4-5 fica como está nos dois caminhos
+    pdf_path = str(tmp_path / "perfil.pdf")
+    doc = fitz.open()
+    for i in range(6):
+        page = doc.new_page()
+        if i >= 2:
+            page.insert_text((50, 50), f"Blusa R$ {i + 10},00", fontsize=12)
+        if i < 2 or i >= 4:
+            page.insert_text((50, 100), "DE 15,00 NO ATACADO", fontsize=12)
+    doc.save(pdf_path)
+    doc.close()
+    texts = {}
+    for cached in (False, True):
+        processor = PdfProcessor(adaptive=True, profile_pages=2,
+                                 cache_dir=str(tmp_path / "cache_perfil") if cached else None)
+        out_path = str(tmp_path / f"perfil_{cached}.pdf")
+        assert processor.process_catalog_v2(pdf_path, out_path, 5.0, None, [0, 1], False, False, "")[0]
+        out = fitz.open(out_path)
+        texts[cached] = [p.get_text() for p in out]
+        out.close()
+    assert texts[True] == texts[False]
+    assert "15,00 NO ATACADO" in texts[True][-1]
+    assert adaptive._analysis_key("x", [1]) != adaptive._analysis_key("x", [])
+    assert PdfProcessor()._analysis_key("x", [1]) == PdfProcessor()._analysis_key("x", [])
+
+def test_sharded_v2_matches_serial(tmp_path):
+    from backend.pdf_processor import _split_shards, _page_runs
+    assert _page_runs([0, 2, 3, 5, 6, 7]) == [(0, 0), (2, 3), (5, 7)]
+    assert _split_shards(list(range(7)), 3) == [[0, 1, 2], [3, 4], [5, 6]]
+    assert _split_shards([1, 2], 8) == [[1], [2]]
+    
+    pdf_path = str(tmp_path / "faixas.pdf")
+    doc = fitz.open()
+    for i in range(6):
+        page = doc.new_page()
+        page.insert_text((50, 50), f"Blusa R$ {i + 10},00", fontsize=12)
+    doc.save(pdf_path)
+    doc.close()
+    
+    outputs = {}
+    for workers in (1, 3):
+        out_path = str(tmp_path / f"saida_{workers}.pdf")
+        processor = PdfProcessor()
+        ok, _ = processor.process_catalog_v2(pdf_path, out_path, 5.0, None, [1, 4], False, True,
+                                             "Coleção", max_workers=workers)
+        assert ok and processor.strategy_stats.pages == 4
+        out = fitz.open(out_path)
+        outputs[workers] = [(p.read_contents(), p.get_text()) for p in list(out)[1:]]
+        out.close()
+    
+    # Mesmas páginas, na mesma ordem, com o mesmo conteúdo
+    assert outputs[1] == outputs[3]
+    for (_, text), price in zip(outputs[3], ["R$ 15,00", "R$ 17,00", "R$ 18,00", "R$ 20,00"]):
+        assert price in text
+
+def test_sharded_v2_adaptive_matches_serial(tmp_path):
+    # Perfil (2 páginas) só com "R$"; depois disso a Estratégia 5 (contexto) fica
+    # desligada, então "DE 15,00 NO ATACADO" das páginas seguintes não muda
+    pdf_path = str(tmp_path / "adaptativo.pdf")
+    doc = fitz.open()
+    for i in range(6):
+        page = doc.new_page()
+        page.insert_text((50, 50), f"Blusa R$ {i + 10},00", fontsize=12)
+        if i >= 2:
+            page.insert_text((50, 100), "DE 15,00 NO ATACADO", fontsize=12)
+    doc.save(pdf_path)
+    doc.close()
+    with open(pdf_path, "rb") as f:
+        data = f.read()
+    
+    outputs = {}
+    for workers in (1, 3):
+        processor = PdfProcessor(adaptive=True, profile_pages=2)
+        ok, _ = processor.process_catalog_v2(pdf_path, str(tmp_path / f"a_{workers}.pdf"), 5.0, None, [],
+                                             False, False, "", max_workers=workers)
+        assert ok and processor.strategy_stats.pages == 6
+        # Da memória: as faixas abrem os bytes originais
+        ok, _, out_data = PdfProcessor(adaptive=True, profile_pages=2).process_catalog_v2_bytes(
+            data, 5.0, None, [], False, False, "", max_workers=workers)
+        assert ok
+        for key, out in ((workers, fitz.open(str(tmp_path / f"a_{workers}.pdf"))),
+                         (("bytes", workers), fitz.open("pdf", out_data))):
+            outputs[key] = [p.get_text() for p in out]
+            out.close()
+    
+    assert outputs[1] == outputs[3] == outputs[("bytes", 1)] == outputs[("bytes", 3)]
+    assert all("15,00 NO ATACADO" in text for text in outputs[3][2:])
+    assert "R$ 20,00" in outputs[3][5]
+
+def test_save_profiles(tmp_path):
+    pdf_path = str(tmp_path / "perfis.pdf")
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((50, 50), "Blusa R$ 10,00", fontsize=12)
+    doc.save(pdf_path)
+    doc.close()
+    with open(pdf_path, "rb") as f:
+        original = f.read()
+    
+    for profile in ("fast", "balanced", "compact", "incremental"):
+        out_path = str(tmp_path / f"{profile}.pdf")
+        processor = PdfProcessor(save_profile=profile)
+        ok, msg = processor.process_catalog(pdf_path, out_path, 5.0)
+        assert ok and processor.last_save.profile == profile
+        assert processor.last_save.size == os.path.getsize(out_path)
+        out = fitz.open(out_path)
+        assert "R$ 15,00" in out[0].get_text()
+        out.close()
+        with open(out_path, "rb") as f:
+            data = f.read()
+        # Incremental: o original fica intacto e as mudanças são anexadas
+        assert data.startswith(original) == (profile == "incremental")
+    
+    # Documento novo (V2) não tem como ser incremental: cai para "fast"
+    processor = PdfProcessor(save_profile="incremental")
+    assert processor.process_catalog_v2(pdf_path, str(tmp_path / "v2.pdf"), 1.0, None, [], False, False, "")[0]
+    assert processor.last_save.profile == "fast"
+    
+    # "web": linearizado se o MuPDF/qpdf permitirem; senão salva normal e avisa
+    processor = PdfProcessor(save_profile="web")
+    assert processor.process_catalog(pdf_path, str(tmp_path / "web.pdf"), 5.0)[0]
+    assert processor.last_save.profile == "web"
+    assert processor.last_save.linearized or "sem linearização" in str(processor.last_save)
+    
+    try:
+        PdfProcessor(save_profile="turbo")
+        assert False, "perfil inválido deveria falhar"
+    except ValueError:
+        pass
+
+def test_image_optimizer_keeps_vector_overlays(tmp_path):
+    import random
+    from backend.image_optimizer import optimize_images
+    random.seed(0)
+    # Foto "ruidosa" de 600x600 exibida em 200pt (216 DPI)
+    img = Image.new("RGB", (600, 600))
+    img.putdata([(random.randrange(256), 120, random.randrange(256)) for _ in range(600 * 600)])
+    img_path = str(tmp_path / "foto.png")
+    img.save(img_path)
+    
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_image(fitz.Rect(50, 50, 250, 250), filename=img_path)
+    page.insert_text((300, 100), "Blusa R$ 10,00", fontsize=12)
+    contents = page.read_contents()
+    before = len(doc.tobytes(garbage=3, deflate=True))
+    
+    report = optimize_images(doc, dpi=72, quality=60, max_workers=2)
+    assert len(report.images) == 1
+    result = report.images[0]
+    assert result.pixels_before == (600, 600) and result.pixels_after == (200, 200)
+    assert result.size_after < result.size_before
+    # Textos e capas de preço não mudam; o arquivo diminui
+    assert page.read_contents() == contents
+    assert "R$ 10,00" in page.get_text()
+    assert len(doc.tobytes(garbage=3, deflate=True)) < before / 4
+    
+    # Tamanho-alvo inalcançável: tenta todos os degraus e avisa
+    report = optimize_images(doc, dpi=72, target_bytes=100, max_workers=1)
+    assert not report.reached
+    doc.close()
+
+def test_download_app_range_and_etag(tmp_path):
+    import asyncio
+    from backend.download_server import DownloadApp, PrefixRouter
+    data = bytes(range(256)) * 40
+    (tmp_path / "catalogo.pdf").write_bytes(data)
+    
+    async def fallback(scope, receive, send):
+        await send({"type": "http.response.start", "status": 299, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+    app = PrefixRouter(fallback, "/download", DownloadApp(str(tmp_path), chunk_size=1000))
+    
+    def request(path, **headers):
+        messages = []
+        async def receive():
+            return {"type": "http.request"}
+        async def send(message):
+            messages.append(message)
+        scope = {"type": "http", "method": "GET", "path": path,
+                 "headers": [(k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()]}
+        asyncio.run(app(scope, receive, send))
+        start = messages[0]
+        body = b"".join(m.get("body", b"") for m in messages[1:])
+        return start["status"], dict(start["headers"]), body
+    
+    status, headers, body = request("/download/catalogo.pdf")
+    assert status == 200 and body == data
+    assert headers[b"accept-ranges"] == b"bytes" and headers[b"content-type"] == b"application/pdf"
+    etag = headers[b"etag"].decode()
+    
+    status, headers, body = request("/download/catalogo.pdf", range="bytes=100-2099")
+    assert status == 206 and body == data[100:2100]
+    assert headers[b"content-range"] == f"bytes 100-2099/{len(data)}".encode()
+    assert request("/download/catalogo.pdf", range="bytes=-10")[2] == data[-10:]
+    assert request("/download/catalogo.pdf", range="bytes=99999-")[0] == 416
+    # If-Range com ETag antigo: arquivo inteiro
+    assert request("/download/catalogo.pdf", range="bytes=0-9", if_range='"velho"')[0] == 200
+    
+    status, _, body = request("/download/catalogo.pdf", if_none_match=etag)
+    assert status == 304 and body == b""
+    assert request("/download/../test_backend.py")[0] == 404
+    assert request("/outra/rota")[0] == 299
+    
+    # scope["path"] já vem decodificado: "%25" no nome é literal, não decodifica de novo
+    (tmp_path / "100%25.pdf").write_bytes(b"literal")
+    (tmp_path / "100%.pdf").write_bytes(b"outro")
+    assert request("/download/100%25.pdf")[2] == b"literal"
+    assert request("/download/100%.pdf")[2] == b"outro"
+    
+    # Cache de ETags: uma entrada por arquivo (regravar substitui) e limitado
+    downloads = DownloadApp(str(tmp_path), max_etags=2)
+    path = str(tmp_path / "catalogo.pdf")
+    first = downloads.etag(path, os.stat(path))
+    (tmp_path / "catalogo.pdf").write_bytes(data[::-1])
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10**9))
+    assert downloads.etag(path, os.stat(path)) != first and len(downloads._etags) == 1
+    for name in ("100%25.pdf", "100%.pdf"):
+        downloads.etag(str(tmp_path / name), os.stat(tmp_path / name))
+    assert list(downloads._etags) == [str(tmp_path / "100%25.pdf"), str(tmp_path / "100%.pdf")]
+
+def test_logo_asset_single_xref_prescaled(tmp_path):
+    from backend.logo_asset import LogoAsset
+    # Logo enorme (2000x2000 com transparência) usada em tamanhos pequenos
+    logo_path = str(tmp_path / "logo.png")
+    Image.new("RGBA", (2000, 2000), (200, 0, 0, 128)).save(logo_path)
+    
+    doc = fitz.open()
+    for _ in range(3):
+        page = doc.new_page()
+        page.insert_image(fitz.Rect(100, 200, 400, 500), filename='tests/logo_test.png')
+    processor = PdfProcessor()
+    for page in doc:
+        assert processor._insert_logo_on_page(page, logo_path) == 1
+    
+    # Uma só imagem da logo no documento, reduzida, reaproveitada em todas as páginas
+    xrefs = {img[0] for page in doc for img in page.get_images() if img[2] != 100}
+    assert len(xrefs) == 1
+    xref = xrefs.pop()
+    assert doc.xref_get_key(xref, "SMask")[0] == "xref"
+    width = int(doc.xref_get_key(xref, "Width")[1])
+    assert width < 2000
+    asset = processor._logo_asset(logo_path)
+    assert asset.encodes == 1 and processor._logo_asset(logo_path) is asset
+    
+    # Posição maior que a preparada: reprepara com mais resolução
+    asset.insert(doc[0], fitz.Rect(0, 0, 500, 500))
+    assert asset.encodes == 2
+    assert int(doc.xref_get_key(doc[0].get_images()[-1][0], "Width")[1]) > width
+    doc.close()
+
+def test_corrupt_logo_is_skipped(tmp_path):
+    # Logo que não abre: o catálogo sai sem logo, sem erro (nem na capa, nem nas faixas)
+    logo_path = str(tmp_path / "logo.png")
+    with open(logo_path, "wb") as f:
+        f.write(b"isto nao e uma imagem")
+    pdf_path = str(tmp_path / "fotos.pdf")
+    doc = fitz.open()
+    for i in range(2):
+        page = doc.new_page()
+        page.insert_image(fitz.Rect(100, 200, 400, 500), filename='tests/logo_test.png')
+        page.insert_text((50, 50), f"Blusa R$ {i + 10},00", fontsize=12)
+    doc.save(pdf_path)
+    doc.close()
+    
+    processor = PdfProcessor()
+    ok, msg = processor.process_catalog(pdf_path, str(tmp_path / "v1.pdf"), 5.0, logo_path)
+    assert ok and "Logos inseridas: 0" in msg
+    for workers in (1, 2):
+        out_path = str(tmp_path / f"v2_{workers}.pdf")
+        ok, msg = processor.process_catalog_v2(pdf_path, out_path, 5.0, logo_path, [], True, False, "",
+                                               max_workers=workers)
+        assert ok, msg
+        out = fitz.open(out_path)
+        # Capa é a logo centralizada: sem logo, não há capa
+        assert len(out) == 2 and "R$ 15,00" in out[0].get_text()
+        assert all(len(p.get_images()) == 1 for p in out)
+        out.close()
+
+def test_logo_destinations_prepass_and_cache(tmp_path):
+    from backend.logo_placement import PlacementCache, logo_destinations
+    doc = fitz.open()
+    for _ in range(6):
+        page = doc.new_page()
+        page.insert_image(fitz.Rect(100, 200, 400, 450), filename='tests/logo_test.png')
+        page.insert_image(fitz.Rect(-50, 500, 300, 900), filename='tests/logo_test.png')  # sangria
+        page.insert_image(fitz.Rect(450, 50, 500, 100), filename='tests/logo_test.png')  # ícone
+    pdf_path = str(tmp_path / "layout.pdf")
+    doc.save(pdf_path)
+    
+    cache = PlacementCache()
+    destinations = logo_destinations(doc, list(range(6)), cache)
+    assert destinations[0] == [(120.0, 385.0, 165.0, 430.0), (20.0, 777.0, 65.0, 822.0)]
+    assert all(slots == destinations[0] for slots in destinations.values())
+    # Mesmo layout em todas as páginas: o filtro roda só na primeira
+    assert cache.misses == 3 and cache.hits == 15
+    
+    processor = PdfProcessor()
+    assert processor.plan_logo_destinations(pdf_path, [2], max_workers=2) == {
+        n: destinations[0] for n in (0, 1, 3, 4, 5)
+    }
+    doc.close()
+
+def test_v2_in_memory_output(tmp_path):
+    import asyncio
+    import io
+    from backend.download_server import DownloadApp, spooled_output
+    doc = fitz.open()
+    for i in range(4):
+        page = doc.new_page()
+        page.insert_text((50, 50), f"Blusa R$ {i + 10},00", fontsize=12)
+    data = doc.tobytes()
+    doc.close()
+    pdf_path = tmp_path / "entrada.pdf"
+    pdf_path.write_bytes(data)
+    
+    processor = PdfProcessor(cache_dir=str(tmp_path / "cache"))
+    assert processor.process_catalog_v2(str(pdf_path), str(tmp_path / "saida.pdf"), 5.0, None, [], False, False, "")[0]
+    # Bytes de entrada e de saída; a análise em cache (mesmo conteúdo) é reaproveitada
+    ok, msg, out = processor.process_catalog_v2_bytes(data, 5.0, None, [2], False, False, "", max_workers=2)
+    assert ok and out.startswith(b"%PDF") and processor.analysis_cache.hits == 1
+    result = fitz.open("pdf", out)
+    texts = [p.get_text() for p in result]
+    result.close()
+    assert len(texts) == 3
+    for text, price in zip(texts, ["R$ 15,00", "R$ 16,00", "R$ 18,00"]):
+        assert price in text
+    
+    # Arquivo de entrada aberto + buffer que transborda para disco, servido da memória
+    buffer = spooled_output(1024)
+    with open(pdf_path, "rb") as f:
+        ok, _, out = processor.process_catalog_v2_bytes(f, 5.0, None, [], False, False, "", output=buffer)
+    assert ok and out is None and buffer._rolled
+    downloads = DownloadApp(str(tmp_path), chunk_size=100)
+    downloads.publish("catalogo_1.pdf", buffer)
+    
+    messages = []
+    async def receive():
+        return {"type": "http.request"}
+    async def send(message):
+        messages.append(message)
+    scope = {"type": "http", "method": "GET", "path": "/catalogo_1.pdf", "headers": [(b"range", b"bytes=0-249")]}
+    asyncio.run(downloads(scope, receive, send))
+    buffer.seek(0)
+    assert messages[0]["status"] == 206
+    etag = dict(messages[0]["headers"])[b"etag"]
+    assert b"".join(m.get("body", b"") for m in messages[1:]) == buffer.read(250)
+    buffer.seek(0)
+    content = buffer.read()
+    
+    # Despejo: o mais antigo vai para o disco e o link continua servindo o mesmo conteúdo
+    downloads.max_published = 1
+    downloads.publish("catalogo_2.pdf", io.BytesIO(b"%PDF-outro"))
+    assert buffer.closed and (tmp_path / "catalogo_1.pdf").read_bytes() == content
+    messages.clear()
+    scope["headers"] = [(b"if-none-match", etag)]
+    asyncio.run(downloads(scope, receive, send))
+    assert messages[0]["status"] == 304
+    downloads.spill_all()
+    assert (tmp_path / "catalogo_2.pdf").read_bytes() == b"%PDF-outro"
+    try:
+        downloads.publish("../fora.pdf", io.BytesIO(b"x"))
+        assert False, "nome fora do diretório deveria falhar"
+    except ValueError:
+        pass
+    
+    other = io.BytesIO(b"%PDF-descartado")
+    downloads.publish("catalogo_3.pdf", other)
+    downloads.discard("catalogo_3.pdf")
+    assert other.closed and not (tmp_path / "catalogo_3.pdf").exists()
+    
+    # Perfil "web" em memória passa pelo mesmo caminho de linearização do arquivo (qpdf)
+    import shutil
+    web = PdfProcessor(save_profile="web")
+    ok, _, out = web.process_catalog_v2_bytes(data, 5.0, None, [], False, False, "")
+    assert ok and out.startswith(b"%PDF") and web.last_save.size == len(out)
+    assert web.last_save.linearized == bool(shutil.which("qpdf"))
+
+def test_iter_thumbnails_streams_page_ranges(tmp_path):
+    from backend.thumbnails import thumbnail_ranges
+    assert thumbnail_ranges(list(range(20)), 2) == [list(range(0, 8)), list(range(8, 16)), list(range(16, 20))]
+    assert thumbnail_ranges([1, 3, 4, 7, 8, 9], 4) == [[1, 3], [4, 7], [8, 9]]
+    
+    pdf_path = str(tmp_path / "miniaturas.pdf")
+    doc = fitz.open()
+    for i in range(12):
+        doc.new_page().insert_text((50, 50), f"Página {i}", fontsize=30)
+    doc.save(pdf_path)
+    doc.close()
+    
+    processor = PdfProcessor(thumbnail_cache_dir=str(tmp_path / "thumbs"))
+    seen = list(processor.iter_thumbnails(pdf_path, max_workers=3))
+    assert sorted(n for n, _ in seen) == list(range(12))
+    report = processor.last_thumbnails
+    assert report.pages == 12 and report.cached == 0 and 0 < report.first_seconds <= report.seconds
+    for _, path in seen:
+        assert fitz.Pixmap(path).width == 90  # 595pt * 0.15, arredondado para cima
+    
+    # Reabrir (outra sessão, mesmo conteúdo): tudo do cache, mesmos arquivos
+    other = PdfProcessor(thumbnail_cache_dir=str(tmp_path / "thumbs"))
+    assert other.get_thumbnails(pdf_path, max_workers=1) == [path for _, path in sorted(seen)]
+    assert other.last_thumbnails.cached == 12
+    
+    # Só as páginas pedidas (um lote da grade), com as mesmas miniaturas da geração completa
+    subset = PdfProcessor(thumbnail_cache_dir=str(tmp_path / "thumbs_lote"))
+    batch = dict(subset.iter_thumbnails(pdf_path, pages=[3, 4, 5]))
+    assert sorted(batch) == [3, 4, 5] and subset.last_thumbnails.pages == 3
+    assert len(os.listdir(tmp_path / "thumbs_lote")) == 3
+    full = dict(seen)
+    for n, path in batch.items():
+        with open(path, "rb") as a, open(full[n], "rb") as b:
+            assert a.read() == b.read()
+    
+    # Consumidor que para no meio (serial, o padrão): o documento é fechado mesmo assim
+    import backend.pdf_processor as pdf_processor_module
+    opened = []
+    real_open = pdf_processor_module.fitz.open
+    pdf_processor_module.fitz.open = lambda *a, **k: opened.append(real_open(*a, **k)) or opened[-1]
+    try:
+        fresh = PdfProcessor(thumbnail_cache_dir=str(tmp_path / "thumbs_2"))
+        stream = fresh.iter_thumbnails(pdf_path)
+        assert next(stream)[0] == 0
+        stream.close()
+    finally:
+        pdf_processor_module.fitz.open = real_open
+    assert len(opened) == 1 and opened[0].is_closed
+
+def test_thumbnail_cache_is_content_addressed(tmp_path):
+    # Dois uploads com o mesmo nome e conteúdos diferentes não se sobrescrevem
+    thumbs = []
+    for color in ((1, 0, 0), (0, 0, 1)):
+        folder = tmp_path / str(len(thumbs))
+        folder.mkdir()
+        doc = fitz.open()
+        page = doc.new_page()
+        page.draw_rect(page.rect, color=None, fill=color)
+        doc.save(str(folder / "catalogo.pdf"))
+        doc.close()
+        processor = PdfProcessor(thumbnail_cache_dir=str(tmp_path / "thumbs"))
+        thumbs.append(processor.get_thumbnails(str(folder / "catalogo.pdf"), max_workers=1)[0])
+    assert thumbs[0] != thumbs[1]
+    assert fitz.Pixmap(thumbs[0]).pixel(10, 10)[0] > 200
+    assert fitz.Pixmap(thumbs[1]).pixel(10, 10)[2] > 200
+    
+    # Hash do PDF memorizado por caminho + tamanho + mtime (lotes seguidos não relêem o arquivo)
+    from backend.disk_cache import file_digest
+    path = str(tmp_path / "0" / "catalogo.pdf")
+    st = os.stat(path)
+    digest = file_digest(path)
+    with open(path, "r+b") as f:
+        f.seek(-1, os.SEEK_END)
+        f.write(b"#")
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert file_digest(path) == digest
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+    assert file_digest(path) != digest
+    
+    # Miniatura maior que o cache inteiro: vai para um arquivo avulso, nunca um caminho None
+    from backend.disk_cache import DiskCache
+    tiny = PdfProcessor()
+    tiny.thumbnail_cache = DiskCache(str(tmp_path / "tiny"), max_bytes=10, suffix=".jpg")
+    thumbs = list(tiny.iter_thumbnails(path))
+    assert [n for n, _ in thumbs] == [0] and os.path.isfile(thumbs[0][1])
+    assert os.listdir(tmp_path / "tiny") == []
+    sheets = list(tiny.iter_sprite_sheets(path, str(tmp_path), per_sheet=4))
+    assert [sheet.pages for sheet in sheets] == [[0]]
+
+def test_sprite_sheets_index_each_page(tmp_path):
+    pdf_path = str(tmp_path / "folhas.pdf")
+    doc = fitz.open()
+    colors = [(1, 0, 0), (0, 1, 0), (0, 0, 1), (1, 1, 0), (0, 1, 1)]
+    for color in colors:
+        page = doc.new_page()
+        page.draw_rect(page.rect, color=None, fill=color)
+    doc.new_page(width=842, height=595).draw_rect(fitz.Rect(0, 0, 842, 595), color=None, fill=(1, 0, 1))
+    doc.save(pdf_path)
+    doc.close()
+    
+    processor = PdfProcessor(thumbnail_cache_dir=str(tmp_path / "thumbs"))
+    for fmt in ("webp", "jpeg"):
+        sheets = sorted(processor.iter_sprite_sheets(pdf_path, str(tmp_path), per_sheet=4, columns=2,
+                                                     fmt=fmt, quality=80, max_workers=1),
+                        key=lambda sheet: sheet.number)
+        assert [sheet.pages for sheet in sheets] == [[0, 1, 2, 3], [4, 5]]
+        for sheet in sheets:
+            img = Image.open(sheet.path).convert("RGB")
+            assert img.size == sheet.size
+            for page_num in sheet.pages:
+                x, y, w, h = sheet.cells[page_num]
+                # Centro do recorte tem a cor da página
+                r, g, b = img.getpixel((x + w // 2, y + h // 2))
+                expected = (colors + [(1, 0, 1)])[page_num]
+                assert all(abs(c - 255 * e) < 40 for c, e in zip((r, g, b), expected))
+        # Página deitada: recorte mais largo que alto
+        x, y, w, h = sheets[1].cells[5]
+        assert w > h
+    
+    # Folhas já gravadas (mesmo conteúdo e parâmetros): reaproveitadas, sem miniaturas
+    mtimes = {sheet.path: os.stat(sheet.path).st_mtime_ns for sheet in sheets}
+    again = sorted(processor.iter_sprite_sheets(pdf_path, str(tmp_path), per_sheet=4, columns=2,
+                                                fmt="jpeg", quality=80, max_workers=1),
+                   key=lambda sheet: sheet.number)
+    assert [(s.path, s.size, s.cells) for s in again] == [(s.path, s.size, s.cells) for s in sheets]
+    assert processor.last_thumbnails.pages == 0
+    assert {s.path: os.stat(s.path).st_mtime_ns for s in again} == mtimes
+    
+    # Só as folhas pedidas (lotes da grade), iguais às da geração completa
+    subset_dir = tmp_path / "lotes"
+    subset_dir.mkdir()
+    subset = PdfProcessor(thumbnail_cache_dir=str(tmp_path / "thumbs_lotes"))
+    only = list(subset.iter_sprite_sheets(pdf_path, str(subset_dir), per_sheet=4, columns=2,
+                                          fmt="jpeg", quality=80, sheets=[1, 7]))
+    assert [(s.number, s.size, s.cells) for s in only] == [(1, sheets[1].size, sheets[1].cells)]
+    assert subset.last_thumbnails.pages == 2
+    assert sorted(os.listdir(subset_dir)) == sorted(os.path.basename(p) for p in (only[0].path, only[0].index_path))
+    
+    try:
+        next(processor.iter_sprite_sheets(pdf_path, str(tmp_path), fmt="gif"))
+        assert False, "formato inválido deveria falhar"
+    except ValueError:
+        pass
+
 if __name__ == "__main__":
     test_processor()
+    test_page_text_context_single_extraction()
+    test_char_index_maps_each_match_to_its_rect()
+    test_price_regex_does_not_cross_lines()
+    test_rect_grid_tolerance()
+    test_color_analysis_batch()
+    test_raster_cache_renders_page_once()
+    test_style_comes_from_span_metadata()
+    test_drawing_index_background()
+    test_adaptive_strategies_skip_and_report()
+    test_detection_is_separate_from_apply()
+    test_batched_write_back_single_stream()
+    import pathlib, tempfile
+    test_analyze_prices_report(pathlib.Path(tempfile.mkdtemp()))
+    test_process_variants_share_one_analysis(pathlib.Path(tempfile.mkdtemp()))
+    test_disk_cache_lru_eviction(pathlib.Path(tempfile.mkdtemp()))
+    test_analysis_cache_skips_detection_on_rerun(pathlib.Path(tempfile.mkdtemp()))
+    test_sharded_v2_matches_serial(pathlib.Path(tempfile.mkdtemp()))
+    test_sharded_v2_adaptive_matches_serial(pathlib.Path(tempfile.mkdtemp()))
+    test_save_profiles(pathlib.Path(tempfile.mkdtemp()))
+    test_image_optimizer_keeps_vector_overlays(pathlib.Path(tempfile.mkdtemp()))
+    test_download_app_range_and_etag(pathlib.Path(tempfile.mkdtemp()))
+    test_logo_asset_single_xref_prescaled(pathlib.Path(tempfile.mkdtemp()))
+    test_corrupt_logo_is_skipped(pathlib.Path(tempfile.mkdtemp()))
+    test_logo_destinations_prepass_and_cache(pathlib.Path(tempfile.mkdtemp()))
+    test_v2_in_memory_output(pathlib.Path(tempfile.mkdtemp()))
+    test_iter_thumbnails_streams_page_ranges(pathlib.Path(tempfile.mkdtemp()))
+    test_thumbnail_cache_is_content_addressed(pathlib.Path(tempfile.mkdtemp()))
+    test_sprite_sheets_index_each_page(pathlib.Path(tempfile.mkdtemp()))